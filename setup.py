@@ -46,7 +46,8 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     entry_points={
         'console_scripts': [
-            'slugs = slugs.app:main'
+            'slugs = slugs.app:main',
+            'slugs-compile = slugs.compiler:main'
         ]
     },
     install_requires=[
@@ -32,6 +32,17 @@ with open(version_path, 'r') as version_file:
 
 __all__ = [
     'app',
+    'bitmaps',
+    'cache',
+    'cbor',
+    'changes',
+    'client',
+    'compiler',
     'controllers',
-    'plugins'
+    'dispatch',
+    'hierarchy',
+    'plugins',
+    'snapshots',
+    'tools',
+    'watch'
 ]
@@ -18,6 +18,7 @@ import cherrypy
 import os
 
 from slugs import controllers
+from slugs import dispatch
 from slugs import plugins
 
 
@@ -59,10 +60,37 @@ def main():
         "/slugs",
         config=args.config
     )
+    if 'request.dispatch' not in application.config.get('/', {}):
+        application.merge(
+            {'/': {'request.dispatch': dispatch.RouteDispatcher()}}
+        )
+    cache_config = application.config.get('cache', {})
+    if 'max_size' in cache_config:
+        controller.response_cache.max_size = cache_config.get('max_size')
+    changes_config = application.config.get('changes', {})
+    if 'max_size' in changes_config:
+        controller.change_feed.max_size = changes_config.get('max_size')
+
+    watch_config = application.config.get('watch', {})
+    if 'port' in watch_config:
+        plugins.WatchPlugin(
+            cherrypy.engine,
+            controller,
+            host=watch_config.get(
+                'host',
+                cherrypy.config.get('server.socket_host', '127.0.0.1')
+            ),
+            port=watch_config.get('port')
+        ).subscribe()
+
+    data_config = application.config.get('data')
     plugins.FileMonitoringPlugin(
         cherrypy.engine,
-        application.config.get('data').get('user_group_mapping'),
-        controller.update
+        data_config.get('user_group_mapping'),
+        controller.update,
+        watcher=data_config.get('watcher', 'auto'),
+        reloader=data_config.get('reloader', 'thread'),
+        snapshot=lambda: controller.snapshot
     ).subscribe()
 
     if hasattr(cherrypy.engine, 'block'):
@@ -0,0 +1,161 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import array
+import bisect
+
+
+# IDs are split into a 16-bit chunk key and a 16-bit low part. A chunk with
+# at most _ARRAY_MAX members is stored as a sorted array of low parts (two
+# bytes per member); a denser chunk is stored as a fixed 8 KB bitmap, which
+# is smaller past that point.
+_CHUNK_BITS = 16
+_CHUNK_MASK = (1 << _CHUNK_BITS) - 1
+CHUNK_SIZE = 1 << _CHUNK_BITS
+_ARRAY_MAX = 4096
+_BITMAP_BYTES = (1 << _CHUNK_BITS) // 8
+
+
+def _array_container(lows):
+    return array.array('H', lows)
+
+
+def _bitmap_container(lows):
+    bits = bytearray(_BITMAP_BYTES)
+    for low in lows:
+        bits[low >> 3] |= 1 << (low & 7)
+    return bits
+
+
+def _container(lows):
+    if len(lows) <= _ARRAY_MAX:
+        return _array_container(lows)
+    return _bitmap_container(lows)
+
+
+def _iter_container(container, start=0):
+    # Yields the low parts not lower than start, in increasing order.
+    if isinstance(container, bytearray):
+        for k in range(start >> 3, len(container)):
+            byte = container[k]
+            if byte:
+                base = k << 3
+                for bit in range(8):
+                    if byte >> bit & 1 and base | bit >= start:
+                        yield base | bit
+    else:
+        for k in range(bisect.bisect_left(container, start), len(container)):
+            yield container[k]
+
+
+def _has(container, low):
+    if isinstance(container, bytearray):
+        return container[low >> 3] >> (low & 7) & 1 == 1
+    k = bisect.bisect_left(container, low)
+    return k < len(container) and container[k] == low
+
+
+class Bitmap(object):
+    """
+    A compressed, immutable set of unsigned 32-bit IDs.
+
+    IDs are grouped into chunks of 65536 by their high bits, in the style of
+    roaring bitmaps. Each chunk picks its own layout by how many members it
+    has: a sorted array for sparse chunks and a plain bitmap for dense ones.
+    """
+
+    def __init__(self, ids=()):
+        """
+        Build a bitmap.
+
+        Args:
+            ids (iterable): The members, as distinct IDs in increasing
+                order. Optional, defaults to no members.
+        """
+        chunks = {}
+        for i in ids:
+            chunks.setdefault(i >> _CHUNK_BITS, []).append(i & _CHUNK_MASK)
+        self._set_chunks(chunks)
+
+    def _set_chunks(self, chunks):
+        self._keys = sorted(chunks)
+        self._containers = {}
+        self._count = 0
+        for key in self._keys:
+            lows = chunks[key]
+            self._containers[key] = _container(lows)
+            self._count += len(lows)
+
+    def __contains__(self, i):
+        container = self._containers.get(i >> _CHUNK_BITS)
+        if container is None:
+            return False
+        return _has(container, i & _CHUNK_MASK)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, start):
+        """
+        Iterate over the members not lower than start, in increasing order.
+        """
+        first = start >> _CHUNK_BITS
+        for key in self._keys[bisect.bisect_left(self._keys, first):]:
+            base = key << _CHUNK_BITS
+            low = start & _CHUNK_MASK if key == first else 0
+            for low in _iter_container(self._containers[key], low):
+                yield base | low
+
+    def __and__(self, other):
+        chunks = {}
+        for key in self._keys:
+            theirs = other._containers.get(key)
+            if theirs is None:
+                continue
+            ours = self._containers[key]
+
+            if isinstance(ours, bytearray) and isinstance(theirs, bytearray):
+                lows = list(_iter_container(bytearray(
+                    a & b for a, b in zip(ours, theirs)
+                )))
+            else:
+                # Walk the array side, the shorter one if both are arrays,
+                # and probe the other.
+                if isinstance(ours, bytearray) or (
+                        not isinstance(theirs, bytearray) and
+                        len(theirs) < len(ours)):
+                    ours, theirs = theirs, ours
+                lows = [low for low in ours if _has(theirs, low)]
+            if lows:
+                chunks[key] = lows
+
+        bitmap = Bitmap.__new__(Bitmap)
+        bitmap._set_chunks(chunks)
+        return bitmap
+
+    def size(self):
+        """
+        Get the approximate number of bytes used by the containers.
+        """
+        total = 0
+        for container in self._containers.values():
+            if isinstance(container, bytearray):
+                total += len(container)
+            else:
+                total += len(container) * container.itemsize
+        return total
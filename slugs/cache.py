@@ -0,0 +1,105 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import threading
+
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class ResponseCache(object):
+    """
+    A thread-safe LRU cache of encoded response bodies.
+
+    The cache is bounded by the total size of the cached bodies in bytes.
+    Bodies larger than the whole budget are never cached.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._max_size = 0
+
+        self.max_size = max_size
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value):
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise ValueError(
+                "Cache size '{}' must be a non-negative integer.".format(value)
+            )
+        with self._lock:
+            self._max_size = value
+            self._evict()
+
+    @property
+    def size(self):
+        """
+        The total size of the cached bodies, in bytes.
+        """
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Get a cached body, marking it as the most recently used.
+
+        Args:
+            key (tuple): The cache key.
+
+        Returns:
+            bytes: The cached body, or None if the key is not cached.
+        """
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._entries[key] = value
+            return value
+
+    def put(self, key, value):
+        """
+        Cache a body, evicting the least recently used bodies as needed.
+
+        Args:
+            key (tuple): The cache key.
+            value (bytes): The encoded body.
+        """
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            if len(value) > self._max_size:
+                return
+            self._entries[key] = value
+            self._size += len(value)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _evict(self):
+        while self._size > self._max_size:
+            _, value = self._entries.popitem(last=False)
+            self._size -= len(value)
@@ -0,0 +1,292 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+A small CBOR (RFC 7049) codec covering the values SLUGS responses use.
+
+Supported are null, booleans, integers up to 64 bits, floats, byte and text
+strings, arrays, and maps. Tags, other simple values, and half or single
+precision floats are not. Definite and indefinite length arrays and maps
+can both be decoded; indefinite lengths let large listings be streamed
+without knowing their length up front.
+"""
+
+import struct
+
+
+MEDIA_TYPE = 'application/cbor'
+
+_UNSIGNED = 0
+_NEGATIVE = 1
+_BYTES = 2
+_TEXT = 3
+_ARRAY = 4
+_MAP = 5
+_SIMPLE = 7
+
+_FALSE = b'\xf4'
+_TRUE = b'\xf5'
+_NULL = b'\xf6'
+_FLOAT = b'\xfb'
+
+# Indefinite length arrays and maps are opened with these and closed with
+# BREAK.
+ARRAY_START = b'\x9f'
+MAP_START = b'\xbf'
+BREAK = b'\xff'
+
+_LENGTHS = ((24, 'B'), (25, 'H'), (26, 'I'), (27, 'Q'))
+
+# Returned by _decode for a break, which is only valid where it closes an
+# indefinite length array or map.
+_BREAK = object()
+
+# Indexing bytes gives integers on Python 3; on Python 2, the data is
+# copied to a bytearray for the same behavior.
+_INDEXES_TO_INT = isinstance(b'\0'[0], int)
+
+# On Python 2, names read from files are UTF-8 encoded str, so str is text
+# like unicode, and only bytearray is encoded as a byte string.
+try:
+    _INTEGER_TYPES = (int, long)
+    _TEXT_TYPES = (str, unicode)
+    _BYTES_TYPES = (bytearray,)
+except NameError:
+    _INTEGER_TYPES = (int,)
+    _TEXT_TYPES = (str,)
+    _BYTES_TYPES = (bytes, bytearray)
+
+
+class CBORError(ValueError):
+    """
+    Raised when a value cannot be encoded, or data cannot be decoded.
+    """
+
+
+# Heads of short text strings, which most names are, by byte length.
+_TEXT_HEADS = [struct.pack('>B', _TEXT << 5 | n) for n in range(24)] + [
+    struct.pack('>BB', _TEXT << 5 | 24, n) for n in range(24, 256)
+]
+
+
+def _head(major, value):
+    if value < 24:
+        return struct.pack('>B', major << 5 | value)
+    for info, code in _LENGTHS:
+        if value < 1 << (8 * struct.calcsize(code)):
+            return struct.pack('>B' + code, major << 5 | info, value)
+    raise CBORError("Integer {} is too large to encode.".format(value))
+
+
+def encode_text(value):
+    """
+    Encode a text string.
+
+    A fast path for encoding many names, skipping the type dispatch of
+    dumps. On Python 2, a str value is taken to be UTF-8 already.
+    """
+    if isinstance(value, bytes):
+        data = value
+    else:
+        data = value.encode('utf-8')
+    if len(data) < 256:
+        return _TEXT_HEADS[len(data)] + data
+    return _head(_TEXT, len(data)) + data
+
+
+def dumps(value):
+    """
+    Encode a value as CBOR.
+
+    Args:
+        value: The value to encode. dict keys must be strings.
+
+    Returns:
+        bytes: The encoded value.
+
+    Raises:
+        CBORError: if the value holds a type outside the supported subset.
+    """
+    parts = []
+    _encode(value, parts)
+    return b''.join(parts)
+
+
+def _encode(value, parts):
+    if value is None:
+        parts.append(_NULL)
+    elif value is True:
+        parts.append(_TRUE)
+    elif value is False:
+        parts.append(_FALSE)
+    elif isinstance(value, _TEXT_TYPES):
+        parts.append(encode_text(value))
+    elif isinstance(value, _INTEGER_TYPES):
+        if value >= 0:
+            parts.append(_head(_UNSIGNED, value))
+        else:
+            parts.append(_head(_NEGATIVE, -1 - value))
+    elif isinstance(value, float):
+        parts.append(_FLOAT + struct.pack('>d', value))
+    elif isinstance(value, (list, tuple)):
+        parts.append(_head(_ARRAY, len(value)))
+        if all(isinstance(item, _TEXT_TYPES) for item in value):
+            parts.extend(encode_text(item) for item in value)
+        else:
+            for item in value:
+                _encode(item, parts)
+    elif isinstance(value, dict):
+        parts.append(_head(_MAP, len(value)))
+        for key, item in value.items():
+            _encode(key, parts)
+            _encode(item, parts)
+    elif isinstance(value, _BYTES_TYPES):
+        parts.append(_head(_BYTES, len(value)))
+        parts.append(bytes(value))
+    else:
+        raise CBORError(
+            "Type '{}' cannot be encoded.".format(type(value).__name__)
+        )
+
+
+def loads(data):
+    """
+    Decode a CBOR value.
+
+    Args:
+        data (bytes): The encoded value.
+
+    Returns:
+        The decoded value. Text strings decode to unicode strings.
+
+    Raises:
+        CBORError: if the data is malformed, truncated, followed by extra
+            bytes, or outside the supported subset.
+    """
+    if not _INDEXES_TO_INT:
+        data = bytearray(data)
+    try:
+        value, offset = _decode_item(data, 0)
+    except (IndexError, struct.error):
+        raise CBORError("Data is truncated.")
+    if offset != len(data):
+        raise CBORError("Data has trailing bytes.")
+    return value
+
+
+def _decode_item(data, offset):
+    value, offset = _decode(data, offset)
+    if value is _BREAK:
+        raise CBORError("Unexpected break.")
+    return value, offset
+
+
+def _decode_array(data, offset, count):
+    # Arrays are mostly lists of short names, so those are decoded inline.
+    items = []
+    size = len(data)
+    while count is None or len(items) < count:
+        initial = data[offset]
+        if 0x60 <= initial < 0x78:
+            end = offset + 1 + initial - 0x60
+            if end > size:
+                raise CBORError("Data is truncated.")
+            try:
+                items.append(bytes(data[offset + 1:end]).decode('utf-8'))
+            except UnicodeDecodeError:
+                raise CBORError("Text string is not valid UTF-8.")
+            offset = end
+            continue
+        item, offset = _decode(data, offset)
+        if item is _BREAK:
+            if count is not None:
+                raise CBORError("Unexpected break.")
+            break
+        items.append(item)
+    return items, offset
+
+
+def _decode(data, offset):
+    initial = data[offset]
+    offset += 1
+    major = initial >> 5
+    info = initial & 0x1f
+
+    if major == _SIMPLE:
+        if info == 20:
+            return False, offset
+        if info == 21:
+            return True, offset
+        if info == 22:
+            return None, offset
+        if info == 27:
+            value = struct.unpack_from('>d', bytes(data[offset:offset + 8]))
+            return value[0], offset + 8
+        if info == 31:
+            return _BREAK, offset
+        raise CBORError("Simple value {} is not supported.".format(info))
+
+    if info == 31:
+        if major == _ARRAY:
+            return _decode_array(data, offset, None)
+        if major == _MAP:
+            result = {}
+            while True:
+                key, offset = _decode(data, offset)
+                if key is _BREAK:
+                    return result, offset
+                result[key], offset = _decode_item(data, offset)
+        raise CBORError(
+            "Indefinite length major type {} is not supported.".format(major)
+        )
+
+    if info < 24:
+        argument = info
+    elif info < 28:
+        code = _LENGTHS[info - 24][1]
+        size = struct.calcsize(code)
+        if offset + size > len(data):
+            raise CBORError("Data is truncated.")
+        argument = struct.unpack_from('>' + code, bytes(
+            data[offset:offset + size]
+        ))[0]
+        offset += size
+    else:
+        raise CBORError("Additional information {} is invalid.".format(info))
+
+    if major == _UNSIGNED:
+        return argument, offset
+    if major == _NEGATIVE:
+        return -1 - argument, offset
+    if major in (_BYTES, _TEXT):
+        end = offset + argument
+        if end > len(data):
+            raise CBORError("Data is truncated.")
+        chunk = bytes(data[offset:end])
+        if major == _TEXT:
+            try:
+                return chunk.decode('utf-8'), end
+            except UnicodeDecodeError:
+                raise CBORError("Text string is not valid UTF-8.")
+        return chunk, end
+    if major == _ARRAY:
+        return _decode_array(data, offset, argument)
+    if major == _MAP:
+        result = {}
+        for _ in range(argument):
+            key, offset = _decode_item(data, offset)
+            result[key], offset = _decode_item(data, offset)
+        return result, offset
+    raise CBORError("Major type {} is not supported.".format(major))
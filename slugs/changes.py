@@ -0,0 +1,155 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+DEFAULT_MAX_SIZE = 100000
+
+
+class ChangeFeed(object):
+    """
+    A bounded history of the membership changes between recent snapshots.
+
+    Each entry holds the pairs added and removed by one published snapshot.
+    The history is bounded by the total number of changed pairs; the oldest
+    entries are dropped to make room for new ones. Like snapshots, the
+    recorded history is immutable and replaced by swapping a single
+    reference, so readers never take a lock. Writers must be serialized by
+    the caller.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, generation=0):
+        """
+        Build a change feed.
+
+        Args:
+            max_size (int): The maximum number of changed pairs to keep.
+                Optional, defaults to DEFAULT_MAX_SIZE.
+            generation (int): The generation changes are tracked from.
+                Optional, defaults to 0.
+        """
+        self._max_size = 0
+        self.max_size = max_size
+        self.reset(generation)
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value):
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise ValueError(
+                "Change feed size '{}' must be a non-negative "
+                "integer.".format(value)
+            )
+        self._max_size = value
+
+    @property
+    def base(self):
+        """
+        The oldest generation changes can be listed from.
+        """
+        return self._history[0]
+
+    @property
+    def generation(self):
+        """
+        The generation of the most recently recorded snapshot.
+        """
+        base, entries, _ = self._history
+        return entries[-1][0] if entries else base
+
+    @property
+    def size(self):
+        """
+        The total number of changed pairs kept.
+        """
+        return self._history[2]
+
+    def __len__(self):
+        return len(self._history[1])
+
+    def reset(self, generation):
+        """
+        Drop every recorded change and track changes from a new generation.
+
+        Used when a snapshot is published that does not derive from the
+        previous one, such as after a full reload.
+
+        Args:
+            generation (int): The generation of the new snapshot.
+        """
+        self._history = (generation, (), 0)
+
+    def record(self, generation, added, removed):
+        """
+        Record the changes made by a newly published snapshot.
+
+        Args:
+            generation (int): The generation of the new snapshot.
+            added (list): The (user, group) pairs the snapshot added.
+            removed (list): The (user, group) pairs the snapshot removed.
+        """
+        base, entries, size = self._history
+        entry = (generation, tuple(added), tuple(removed))
+        entry_size = len(entry[1]) + len(entry[2])
+        if entry_size > self._max_size:
+            self.reset(generation)
+            return
+
+        entries = entries + (entry,)
+        size += entry_size
+        dropped = 0
+        while size > self._max_size:
+            base = entries[dropped][0]
+            size -= len(entries[dropped][1]) + len(entries[dropped][2])
+            dropped += 1
+        self._history = (base, entries[dropped:], size)
+
+    def since(self, generation):
+        """
+        Get the net changes made after a generation.
+
+        Args:
+            generation (int): The generation a client last synchronized to.
+
+        Returns:
+            tuple: The sorted lists of the (user, group) pairs added and
+                removed since that generation, or None if the changes since
+                that generation are no longer, or were never, recorded.
+        """
+        base, entries, _ = self._history
+        if generation != base:
+            for k, entry in enumerate(entries):
+                if entry[0] == generation:
+                    entries = entries[k + 1:]
+                    break
+            else:
+                return None
+
+        # Every recorded change really changed the data, so a pair that was
+        # added and later removed (or the reverse) cancels out.
+        net = {}
+        for _, added, removed in entries:
+            for pairs, change in ((added, True), (removed, False)):
+                for pair in pairs:
+                    if net.get(pair) is (not change):
+                        del net[pair]
+                    else:
+                        net[pair] = change
+        return (
+            sorted(pair for pair, change in net.items() if change),
+            sorted(pair for pair, change in net.items() if not change)
+        )
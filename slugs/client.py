@@ -0,0 +1,336 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import json
+import numbers
+import socket
+import threading
+import time
+
+from slugs import cbor
+
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+
+try:
+    from urllib.parse import quote, urlsplit
+except ImportError:
+    from urllib import quote
+    from urlparse import urlsplit
+
+
+DEFAULT_TTL = 60
+DEFAULT_NEGATIVE_TTL = 10
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 4
+
+# The formats answers can be requested in, with their decoders.
+_FORMATS = {
+    'json': (
+        'application/json',
+        lambda body: json.loads(body.decode('utf-8'))
+    ),
+    'cbor': (cbor.MEDIA_TYPE, cbor.loads)
+}
+
+# A reused keep-alive connection may have been closed by the server since it
+# was last used; requests failing like this are retried once on a new one.
+_STALE_CONNECTION_ERRORS = (
+    httplib.BadStatusLine,
+    httplib.CannotSendRequest,
+    socket.error
+)
+
+
+class ClientError(Exception):
+    """
+    Raised when the SLUGS service returns an unexpected response.
+    """
+
+    def __init__(self, status, message):
+        super(ClientError, self).__init__(message)
+        self.status = status
+
+
+class _Entry(object):
+
+    def __init__(self, value, etag, expires):
+        self.value = value
+        self.etag = etag
+        self.expires = expires
+
+
+class SLUGSClient(object):
+    """
+    A caching client for the SLUGS REST API.
+
+    Answers are kept in an in-process LRU cache. Answers for names that
+    exist are kept for ttl seconds and answers for names that do not are
+    kept for negative_ttl seconds. Once an answer expires, it is revalidated
+    with a conditional request; while the data is unchanged, the service
+    answers with an empty 304 and the cached answer is kept for another
+    period. Requests reuse a small pool of keep-alive connections. Answers
+    can be requested as CBOR instead of JSON, for smaller bodies.
+
+    The client is safe to share between threads.
+    """
+
+    def __init__(self, url, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_size=DEFAULT_MAX_SIZE, timeout=DEFAULT_TIMEOUT,
+                 pool_size=DEFAULT_POOL_SIZE, context=None,
+                 encoding='json'):
+        """
+        Build a client.
+
+        Args:
+            url (string): The base URL of the service, including the /slugs
+                mount point, e.g. 'http://127.0.0.1:8080/slugs'.
+            ttl (float): How long answers about existing names are cached,
+                in seconds. Optional, defaults to DEFAULT_TTL.
+            negative_ttl (float): How long answers about missing names are
+                cached, in seconds. Optional, defaults to
+                DEFAULT_NEGATIVE_TTL.
+            max_size (int): The maximum number of cached answers. Optional,
+                defaults to DEFAULT_MAX_SIZE. Set this to 0 to disable
+                caching.
+            timeout (float): The socket timeout of each request, in seconds.
+                Optional, defaults to DEFAULT_TIMEOUT.
+            pool_size (int): The maximum number of idle connections kept
+                open. Optional, defaults to DEFAULT_POOL_SIZE.
+            context (ssl.SSLContext): The SSL context for https URLs.
+                Optional, defaults to None.
+            encoding (string): The format answers are requested in, 'json'
+                or 'cbor'. Optional, defaults to 'json'.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(
+                "Service URL '{}' must be an http or https URL.".format(url)
+            )
+        for name, value in (('ttl', ttl), ('negative_ttl', negative_ttl)):
+            if not isinstance(value, numbers.Real) or value < 0:
+                raise ValueError(
+                    "Client {} '{}' must be a non-negative number.".format(
+                        name,
+                        value
+                    )
+                )
+        for name, value in (('max_size', max_size),
+                            ('pool_size', pool_size)):
+            if not isinstance(value, numbers.Integral) or value < 0:
+                raise ValueError(
+                    "Client {} '{}' must be a non-negative integer.".format(
+                        name,
+                        value
+                    )
+                )
+
+        if encoding not in _FORMATS:
+            raise ValueError(
+                "Client encoding '{}' must be one of: {}.".format(
+                    encoding,
+                    ', '.join(sorted(_FORMATS))
+                )
+            )
+
+        self._scheme = parts.scheme
+        self._host = parts.hostname
+        self._port = parts.port
+        self._prefix = parts.path.rstrip('/')
+        self._timeout = timeout
+        self._context = context
+        self._media_type, self._decode = _FORMATS[encoding]
+
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        self._pool_size = pool_size
+        self._pool = []
+        self._pool_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_user(self, user):
+        """
+        Check if a user is known to the service.
+        """
+        return self._get(('users', user)) is not None
+
+    def is_group(self, group):
+        """
+        Check if a group is known to the service.
+        """
+        return self._get(('groups', group)) is not None
+
+    def is_member(self, user, group):
+        """
+        Check if a user belongs to a group.
+        """
+        return self._get(('users', user, 'groups', group)) is not None
+
+    def get_groups(self, user):
+        """
+        Get the groups of a user.
+
+        Returns:
+            list: The group names, or None if the user is not known.
+        """
+        return self._get(('users', user, 'groups'), 'groups')
+
+    def get_users(self, group):
+        """
+        Get the users of a group.
+
+        Returns:
+            list: The user names, or None if the group is not known.
+        """
+        return self._get(('groups', group, 'users'), 'users')
+
+    def clear(self):
+        """
+        Drop every cached answer.
+        """
+        with self._cache_lock:
+            self._entries.clear()
+
+    def close(self):
+        """
+        Close every idle connection.
+        """
+        with self._pool_lock:
+            pool, self._pool = self._pool, []
+        for connection in pool:
+            connection.close()
+
+    def _get(self, resource, key=None):
+        # Answers are stored as the decoded field, or None for a 404. The
+        # trailing slash avoids a redirect under the default configuration.
+        # Byte string names (native strings on Python 2) are taken to be
+        # UTF-8 already.
+        path = self._prefix + '/' + '/'.join(
+            quote(
+                name if isinstance(name, bytes) else name.encode('utf-8'),
+                safe=''
+            )
+            for name in resource
+        ) + '/'
+        now = time.time()
+        entry = self._lookup(path)
+        if entry is not None and now < entry.expires:
+            return entry.value
+
+        # NOTE: Entity tags identify the version of the whole data set, not
+        # of a single resource, so an answer may only be revalidated with
+        # the tag of the response it came from. Most 404 responses carry no
+        # tag; those answers are fetched again in full once they expire.
+        headers = {'Accept': self._media_type}
+        if entry is not None and entry.etag is not None:
+            headers['If-None-Match'] = entry.etag
+
+        status, etag, body = self._request(path, headers)
+        now = time.time()
+
+        if status == 304 and entry is not None:
+            value = entry.value
+            if etag is None:
+                etag = entry.etag
+        elif status == 200:
+            value = self._decode(body)
+            if key is not None:
+                value = value[key]
+            elif value is None:
+                # Existence checks answer with a null body.
+                value = True
+        elif status == 404:
+            value = None
+        else:
+            raise ClientError(
+                status,
+                "Unexpected response status {} for {}.".format(status, path)
+            )
+
+        ttl = self._ttl if value is not None else self._negative_ttl
+        self._store(path, _Entry(value, etag, now + ttl))
+        return value
+
+    def _lookup(self, path):
+        with self._cache_lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._entries[path] = entry
+            return entry
+
+    def _store(self, path, entry):
+        with self._cache_lock:
+            self._entries.pop(path, None)
+            if self._max_size == 0:
+                return
+            self._entries[path] = entry
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def _connect(self):
+        if self._scheme == 'https':
+            return httplib.HTTPSConnection(
+                self._host,
+                self._port,
+                timeout=self._timeout,
+                context=self._context
+            )
+        return httplib.HTTPConnection(
+            self._host,
+            self._port,
+            timeout=self._timeout
+        )
+
+    def _request(self, path, headers):
+        for attempt in (0, 1):
+            connection = None
+            if attempt == 0:
+                with self._pool_lock:
+                    if self._pool:
+                        connection = self._pool.pop()
+            reused = connection is not None
+            if connection is None:
+                connection = self._connect()
+
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except _STALE_CONNECTION_ERRORS:
+                connection.close()
+                if reused:
+                    continue
+                raise
+
+            if response.getheader('Connection', '').lower() == 'close':
+                connection.close()
+            else:
+                with self._pool_lock:
+                    if len(self._pool) < self._pool_size:
+                        self._pool.append(connection)
+                        connection = None
+                if connection is not None:
+                    connection.close()
+            return response.status, response.getheader('ETag'), body
@@ -0,0 +1,94 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import argparse
+import os
+import tempfile
+
+from slugs import plugins
+from slugs import snapshots
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Compile a user/group mapping CSV file into a SLUGS "
+                    "snapshot file."
+    )
+    parser.add_argument(
+        "input",
+        type=str,
+        help="User/group mapping CSV file path."
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        type=str,
+        required=True,
+        help="Compiled snapshot file path."
+    )
+    return parser
+
+
+def check_arguments(args):
+    if not os.path.exists(args.input):
+        raise ValueError(
+            "Input file path '{}' does not exist.".format(args.input)
+        )
+    output_directory = os.path.dirname(os.path.abspath(args.output))
+    if not os.path.isdir(output_directory):
+        raise ValueError(
+            "Output directory '{}' does not exist.".format(output_directory)
+        )
+
+
+def compile_file(input_path, output_path):
+    """
+    Compile a user/group mapping CSV file into a snapshot file.
+
+    The snapshot file is written next to its final location and then
+    renamed into place, so a running SLUGS instance never sees a partially
+    written file.
+
+    Args:
+        input_path (string): The user/group mapping CSV file path.
+        output_path (string): The compiled snapshot file path.
+    """
+    snapshot = snapshots.Snapshot(plugins.parse_mapping_file(input_path))
+
+    descriptor, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(output_path)),
+        prefix='.slugs-compile-'
+    )
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            snapshots.dump(snapshot, f)
+        os.chmod(temp_path, 0o644)
+        os.rename(temp_path, output_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    check_arguments(args)
+
+    compile_file(args.input, args.output)
+
+
+if __name__ == '__main__':
+    main()
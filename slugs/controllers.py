@@ -14,8 +14,64 @@
 # under the License.
 
 
+import base64
 import cherrypy
+import itertools
+import json
 import threading
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from cherrypy.lib import httputil
+
+from slugs import cache
+from slugs import cbor
+from slugs import changes
+from slugs import snapshots
+from slugs import tools
+
+
+# On Python 2, names are UTF-8 encoded str, which msgpack packs as binary
+# when bin types are on. With them off, str and unicode both pack as text.
+_MSGPACK_BIN_TYPE = bytes is not str
+
+# The bodies cherrypy.tools.json_out and its binary equivalents produce for
+# a handler returning None, by format.
+_NULLS = {'json': b'null', 'cbor': b'\xf6', 'msgpack': b'\xc0'}
+
+# The formats GET responses can be encoded in, by media type.
+_FORMATS = {
+    'application/json': 'json',
+    cbor.MEDIA_TYPE: 'cbor',
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack'
+}
+
+# Listings with more names than this are streamed instead of being encoded
+# whole up front. Streamed names are encoded in batches of _STREAM_BATCH,
+# and cached bodies are streamed in chunks of _STREAM_CHUNK bytes.
+_STREAM_THRESHOLD = 10000
+_STREAM_BATCH = 1000
+_STREAM_CHUNK = 65536
+
+# Searches list at most _SEARCH_LIMIT matches unless a limit is given, and
+# never more than _SEARCH_MAX_LIMIT.
+_SEARCH_LIMIT = 100
+_SEARCH_MAX_LIMIT = 1000
+
+# Bodies smaller than this are always sent uncompressed, since gzip would
+# barely shrink them.
+_GZIP_MIN_SIZE = 1024
+_GZIP_LEVEL = 6
+
+try:
+    _STRING_TYPES = (str, unicode)
+except NameError:
+    _STRING_TYPES = (str,)
 
 
 def synchronize(f):
@@ -26,169 +82,1420 @@ def synchronize(f):
     return decorator
 
 
+def json_response(response_cache, snapshot, resource, build):
+    """
+    Get the encoded body for a resource of a snapshot.
+
+    The body is encoded as JSON, or in a binary format the client prefers
+    (see negotiate_format). Each body is encoded once per snapshot
+    generation and then served from the response cache until it is
+    evicted.
+
+    Args:
+        response_cache (ResponseCache): The cache for encoded bodies.
+        snapshot (Snapshot): The snapshot the resource is built from.
+        resource (tuple): The path elements identifying the resource.
+        build (callable): Builds the JSON-serializable response object.
+
+    Returns:
+        bytes: The encoded body.
+    """
+    response_format = set_format_headers()
+    key = format_key(snapshot, resource, response_format)
+    gzip = accepts_gzip()
+    if gzip:
+        body = response_cache.get(key + ('gzip',))
+        if body is not None:
+            set_gzip_headers()
+            return body
+
+    body = response_cache.get(key)
+    if body is None:
+        body = encode(response_format, build())
+        response_cache.put(key, body)
+
+    if gzip and len(body) >= _GZIP_MIN_SIZE:
+        compressor = _compressor()
+        body = compressor.compress(body) + compressor.flush()
+        response_cache.put(key + ('gzip',), body)
+        set_gzip_headers()
+    return body
+
+
+def negotiate_format():
+    """
+    Pick the format of a response from the Accept header.
+
+    JSON is picked unless the client prefers a binary format that is
+    available. MessagePack is only available when the msgpack package is
+    installed.
+
+    Returns:
+        tuple: The format, one of 'json', 'cbor', or 'msgpack', and the
+            media type to send it as.
+    """
+    headers = cherrypy.serving.request.headers
+    for element in headers.elements('Accept'):
+        if element.qvalue <= 0:
+            continue
+        media_type = element.value
+        response_format = _FORMATS.get(media_type)
+        if response_format == 'msgpack' and msgpack is None:
+            continue
+        if response_format is not None:
+            return response_format, media_type
+        if media_type in ('*/*', 'application/*'):
+            break
+    return 'json', 'application/json'
+
+
+def set_format_headers():
+    """
+    Set the Content-Type of the response from the Accept header.
+
+    Binary formats are different representations of the resource, so they
+    get their own entity tags.
+
+    Returns:
+        string: The picked format.
+    """
+    response_format, media_type = negotiate_format()
+    headers = cherrypy.serving.response.headers
+    headers['Content-Type'] = media_type
+    if response_format != 'json' and 'ETag' in headers:
+        headers['ETag'] = tools.variant_tag(headers['ETag'], response_format)
+    return response_format
+
+
+def format_key(snapshot, resource, response_format):
+    """
+    Get the response cache key for a resource of a snapshot in a format.
+    """
+    key = (snapshot.generation,) + resource
+    if response_format != 'json':
+        key += (response_format,)
+    return key
+
+
+def encode(response_format, value):
+    """
+    Encode a response body.
+
+    Args:
+        response_format (string): One of 'json', 'cbor', or 'msgpack'.
+        value: The JSON-serializable value to encode.
+
+    Returns:
+        bytes: The encoded body.
+    """
+    if response_format == 'cbor':
+        return cbor.dumps(value)
+    if response_format == 'msgpack':
+        return msgpack.packb(value, use_bin_type=_MSGPACK_BIN_TYPE)
+    return json.dumps(value).encode('utf-8')
+
+
+def accepts_gzip():
+    """
+    Check if the client accepts gzip-encoded responses.
+
+    Returns:
+        bool: True if Accept-Encoding allows gzip, False otherwise.
+    """
+    wildcard = False
+    headers = cherrypy.serving.request.headers
+    for element in headers.elements('Accept-Encoding'):
+        if element.value in ('gzip', 'x-gzip'):
+            return element.qvalue > 0
+        if element.value == '*':
+            wildcard = element.qvalue > 0
+    return wildcard
+
+
+def set_gzip_headers():
+    """
+    Mark the response as gzip-encoded.
+
+    The compressed body is a different representation of the resource, so
+    it gets its own entity tag.
+    """
+    headers = cherrypy.serving.response.headers
+    headers['Content-Encoding'] = 'gzip'
+    if 'ETag' in headers:
+        headers['ETag'] = tools.variant_tag(headers['ETag'], 'gzip')
+
+
+def _compressor():
+    # The gzip header written by zlib carries no timestamp, so compressing
+    # the same body always produces the same bytes.
+    return zlib.compressobj(_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def _stream_gzip(chunks):
+    # Compresses a streamed body on the fly.
+    compressor = _compressor()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _stream_and_cache(chunks, response_cache, key):
+    # Keeps the chunks sent, and caches the body once it is complete, so a
+    # streamed listing is encoded once per generation. A stream the client
+    # abandons is not cached. Once the body outgrows the cache budget it
+    # could never be cached, so the chunks stop being kept and the stream
+    # goes on in constant memory.
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if parts is not None:
+            size += len(chunk)
+            if size > response_cache.max_size:
+                parts = None
+            else:
+                parts.append(chunk)
+        yield chunk
+    if parts is not None:
+        response_cache.put(key, b''.join(parts))
+
+
+def _stream_body(body):
+    # Serves a cached body in fixed-size chunks.
+    for i in range(0, len(body), _STREAM_CHUNK):
+        yield body[i:i + _STREAM_CHUNK]
+
+
+def _stream_json(fields):
+    # Matches the output of json.dumps for the same object, one batch of
+    # names at a time.
+    for n, (key, _, names) in enumerate(fields):
+        prefix = '{' if n == 0 else ', '
+        yield '{}{}: ['.format(prefix, json.dumps(key)).encode('utf-8')
+        separator = ''
+        batch = []
+        for name in names():
+            batch.append(json.dumps(name))
+            if len(batch) == _STREAM_BATCH:
+                yield (separator + ', '.join(batch)).encode('utf-8')
+                separator = ', '
+                batch = []
+        if batch:
+            yield (separator + ', '.join(batch)).encode('utf-8')
+        yield b']'
+    yield b'}'
+
+
+def _stream_cbor(fields):
+    # Encodes the same object as _stream_json, using indefinite length
+    # arrays and maps so no length is needed up front.
+    yield cbor.MAP_START
+    for key, _, names in fields:
+        yield cbor.encode_text(key) + cbor.ARRAY_START
+        batch = []
+        for name in names():
+            batch.append(cbor.encode_text(name))
+            if len(batch) == _STREAM_BATCH:
+                yield b''.join(batch)
+                batch = []
+        if batch:
+            yield b''.join(batch)
+        yield cbor.BREAK
+    yield cbor.BREAK
+
+
+def _stream_lookup(source, target, known, unknown):
+    # Matches the output of json.dumps for the same object, one batch of
+    # users at a time.
+    yield b'{"groups": {'
+    table = target.names
+    separator = ''
+    batch = []
+    for user, i in known:
+        groups = [table[j] for j in source.row(i)]
+        batch.append('{}: {}'.format(json.dumps(user), json.dumps(groups)))
+        if len(batch) == _STREAM_BATCH:
+            yield (separator + ', '.join(batch)).encode('utf-8')
+            separator = ', '
+            batch = []
+    if batch:
+        yield (separator + ', '.join(batch)).encode('utf-8')
+    yield '}}, "unknown": {}}}'.format(json.dumps(unknown)).encode('utf-8')
+
+
+def listing_response(response_cache, snapshot, resource, fields):
+    """
+    Get the body for a listing resource of a snapshot.
+
+    Small listings are encoded whole and cached, as with json_response.
+    Large listings are streamed straight from the snapshot instead, so the
+    first bytes are sent right away. The body is cached once the first
+    stream completes, and later requests stream the cached bytes, so each
+    listing is still encoded once per generation. Bodies too large for the
+    response cache are streamed in constant memory on every request
+    instead. MessagePack has no
+    indefinite lengths, so MessagePack listings are always encoded whole.
+
+    Args:
+        response_cache (ResponseCache): The cache for encoded bodies.
+        snapshot (Snapshot): The snapshot the resource is built from.
+        resource (tuple): The path elements identifying the resource.
+        fields (list): A (key, size, names) tuple for each listing in the
+            response, in order. names is a callable returning an iterable
+            of the names in the listing.
+
+    Returns:
+        bytes: The encoded body, or a generator of its chunks.
+    """
+    size = sum(size for _, size, _ in fields)
+    if size <= _STREAM_THRESHOLD or negotiate_format()[0] == 'msgpack':
+        return json_response(
+            response_cache,
+            snapshot,
+            resource,
+            lambda: dict((key, list(names())) for key, _, names in fields)
+        )
+
+    response_format = set_format_headers()
+    key = format_key(snapshot, resource, response_format)
+    stream = _stream_cbor if response_format == 'cbor' else _stream_json
+    chunks = stream(fields)
+    if accepts_gzip():
+        set_gzip_headers()
+        key += ('gzip',)
+        chunks = _stream_gzip(chunks)
+
+    cherrypy.response.stream = True
+    body = response_cache.get(key)
+    if body is not None:
+        return _stream_body(body)
+    return _stream_and_cache(chunks, response_cache, key)
+
+
+def _key_names(adjacency):
+    def names():
+        table = adjacency.names
+        for i in adjacency:
+            yield table[i]
+    return names
+
+
+def _row_names(source, target, name):
+    def names():
+        table = target.names
+        for i in source.row(source.lookup(name)):
+            yield table[i]
+    return names
+
+
+def json_null():
+    return _NULLS[set_format_headers()]
+
+
+def encode_cursor(snapshot, limit, positions):
+    """
+    Encode an opaque cursor for the next page of a listing.
+
+    Args:
+        snapshot (Snapshot): The snapshot the listing was served from.
+        limit (int): The page size.
+        positions (tuple): The ID each listing resumes from, or None for a
+            listing that is exhausted.
+
+    Returns:
+        string: The cursor.
+    """
+    fields = [snapshots.INSTANCE, snapshot.epoch, limit]
+    fields.extend('' if p is None else p for p in positions)
+    value = ':'.join(str(field) for field in fields).encode('ascii')
+    return base64.urlsafe_b64encode(value).decode('ascii').rstrip('=')
+
+
+def decode_cursor(snapshot, cursor, count):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        snapshot (Snapshot): The snapshot the next page is served from.
+        cursor (string): The cursor.
+        count (int): The number of listings the cursor must cover.
+
+    Returns:
+        tuple: The page size and the tuple of positions.
+
+    Raises:
+        HTTPError: a 400 error if the cursor is invalid, or a 410 error if
+            the cursor was issued for IDs that are no longer in use.
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        value = base64.urlsafe_b64decode(str(cursor + padding))
+        fields = value.decode('ascii').split(':')
+        if len(fields) != count + 3:
+            raise ValueError()
+        epoch = int(fields[1])
+        limit = int(fields[2])
+        positions = tuple(None if f == '' else int(f) for f in fields[3:])
+    except (TypeError, ValueError, UnicodeError):
+        raise cherrypy.HTTPError(400, "Cursor is invalid.")
+    if limit < 1 or any(p is not None and p < 0 for p in positions):
+        raise cherrypy.HTTPError(400, "Cursor is invalid.")
+
+    # IDs are only stable between full reloads, so a cursor from another
+    # process or epoch cannot be resumed.
+    if fields[0] != snapshots.INSTANCE or epoch != snapshot.epoch:
+        raise cherrypy.HTTPError(410, "Cursor has expired.")
+    return limit, positions
+
+
+def get_page(snapshot, limit, cursor, count):
+    """
+    Get the page requested by the limit and cursor query parameters.
+
+    Args:
+        snapshot (Snapshot): The snapshot the page is served from.
+        limit (string): The requested page size, or None.
+        cursor (string): The cursor for the page, or None for the first
+            page.
+        count (int): The number of listings being paged through.
+
+    Returns:
+        tuple: The page size and the tuple of positions, or None if the
+            request is not paginated.
+
+    Raises:
+        HTTPError: a 400 error if the limit or cursor is invalid, or a 410
+            error if the cursor has expired.
+    """
+    if limit is None and cursor is None:
+        return None
+
+    positions = (0,) * count
+    if cursor is not None:
+        cursor_limit, positions = decode_cursor(snapshot, cursor, count)
+        if limit is None:
+            limit = cursor_limit
+
+    return parse_limit(limit), positions
+
+
+def parse_limit(limit):
+    """
+    Validate the limit query parameter.
+
+    Args:
+        limit (string): The requested limit.
+
+    Returns:
+        int: The limit.
+
+    Raises:
+        HTTPError: a 400 error if the limit is not a positive integer.
+    """
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        limit = 0
+    if limit < 1:
+        raise cherrypy.HTTPError(400, "Limit must be a positive integer.")
+    return limit
+
+
+def parse_names(value):
+    """
+    Split a query parameter holding names into a list of names.
+
+    The parameter may be repeated, and each value may hold several
+    comma-separated names.
+
+    Args:
+        value: The query parameter value, a string or list of strings, or
+            None.
+
+    Returns:
+        list: The names.
+    """
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    names = []
+    for item in value:
+        names.extend(name.strip() for name in item.split(','))
+    return [name for name in names if name]
+
+
+def parse_flag(name, value):
+    """
+    Validate a boolean query parameter.
+
+    Args:
+        name (string): The name of the query parameter.
+        value (string): The query parameter value, or None.
+
+    Returns:
+        bool: The value of the flag, False if it was not given.
+
+    Raises:
+        HTTPError: a 400 error if the value is not 'true' or 'false'.
+    """
+    if value is None or value in ('false', '0'):
+        return False
+    if value in ('true', '1'):
+        return True
+    raise cherrypy.HTTPError(
+        400,
+        "{} must be 'true' or 'false'.".format(name.capitalize())
+    )
+
+
+def count_response(response_cache, snapshot, resource, count):
+    """
+    Get the JSON body holding the size of a listing.
+
+    Args:
+        response_cache (ResponseCache): The cache for encoded bodies.
+        snapshot (Snapshot): The snapshot the size was taken from.
+        resource (tuple): The cache key of the listing.
+        count (int): The number of entries in the listing.
+
+    Returns:
+        bytes: The encoded JSON body.
+    """
+    return json_response(
+        response_cache,
+        snapshot,
+        resource + ('count',),
+        lambda: {'count': count}
+    )
+
+
+def query_response(response_cache, snapshot, key, select, adjacency,
+                   all_of, any_of, none_of, count, limit, cursor):
+    """
+    Get the JSON body listing the names matching a set expression.
+
+    Args:
+        response_cache (ResponseCache): The cache for encoded bodies.
+        snapshot (Snapshot): The snapshot the expression is evaluated on.
+        key (string): The collection being listed.
+        select (callable): The selection method of the snapshot for the
+            collection.
+        adjacency (Adjacency): The adjacency holding the collection.
+        all_of: The all_of query parameter.
+        any_of: The any_of query parameter.
+        none_of: The none_of query parameter.
+        count (string): The count query parameter.
+        limit (string): The limit query parameter.
+        cursor (string): The cursor query parameter.
+
+    Returns:
+        bytes: The encoded JSON body, or a generator of its chunks.
+
+    Raises:
+        HTTPError: a 400 error if a parameter is invalid, or a 410 error if
+            the cursor has expired.
+    """
+    expression = (
+        tuple(parse_names(all_of)),
+        tuple(parse_names(any_of)),
+        tuple(parse_names(none_of))
+    )
+    names = adjacency.names
+
+    if parse_flag('count', count):
+        return json_response(
+            response_cache,
+            snapshot,
+            (key, 'query', 'count') + expression,
+            lambda: {'count': sum(1 for _ in select(*expression))}
+        )
+
+    page = get_page(snapshot, limit, cursor, 1)
+    if page is None:
+        return listing_response(
+            response_cache,
+            snapshot,
+            (key, 'query') + expression,
+            [
+                (
+                    key,
+                    len(adjacency),
+                    lambda: (names[i] for i in select(*expression))
+                )
+            ]
+        )
+
+    def build():
+        limit, positions = page
+        ids = list(
+            itertools.islice(
+                select(*expression, start=positions[0]),
+                limit + 1
+            )
+        )
+        start = ids.pop() if len(ids) > limit else None
+        return {
+            key: [names[i] for i in ids],
+            'next': next_cursor(snapshot, limit, (start,))
+        }
+
+    return json_response(
+        response_cache,
+        snapshot,
+        (key, 'query', page[0]) + page[1] + expression,
+        build
+    )
+
+
+def search_response(response_cache, snapshot, key, adjacency, prefix,
+                    contains, count, limit, cursor):
+    """
+    Get the JSON body listing the names matching a search.
+
+    The body flags whether more names matched than are listed.
+
+    Args:
+        response_cache (ResponseCache): The cache for encoded bodies.
+        snapshot (Snapshot): The snapshot the names are searched in.
+        key (string): The collection being searched.
+        adjacency (Adjacency): The adjacency holding the collection.
+        prefix (string): The prefix names must start with, or None.
+        contains (string): The substring names must contain, or None.
+        count (string): The count query parameter.
+        limit (string): The maximum number of names to list, or None for
+            _SEARCH_LIMIT.
+        cursor (string): The cursor query parameter, which must be None.
+
+    Returns:
+        bytes: The encoded JSON body.
+
+    Raises:
+        HTTPError: a 400 error if the limit is invalid or above
+            _SEARCH_MAX_LIMIT, or if a cursor is given.
+    """
+    if cursor is not None:
+        raise cherrypy.HTTPError(400, "Searches cannot be paginated.")
+    if limit is None:
+        limit = _SEARCH_LIMIT
+    else:
+        limit = parse_limit(limit)
+        if limit > _SEARCH_MAX_LIMIT:
+            raise cherrypy.HTTPError(
+                400,
+                "Search limit must not exceed {}.".format(_SEARCH_MAX_LIMIT)
+            )
+
+    if parse_flag('count', count):
+        return json_response(
+            response_cache,
+            snapshot,
+            (key, 'search', 'count', prefix, contains),
+            lambda: {'count': len(adjacency.search(prefix, contains))}
+        )
+
+    def build():
+        names = adjacency.names
+        ids = adjacency.search(prefix, contains, limit + 1)
+        return {
+            key: [names[i] for i in ids[:limit]],
+            'truncated': len(ids) > limit
+        }
+
+    return json_response(
+        response_cache,
+        snapshot,
+        (key, 'search', prefix, contains, limit),
+        build
+    )
+
+
+def next_cursor(snapshot, limit, positions):
+    """
+    Get the cursor for the page after the one being served, or None if
+    every listing is exhausted.
+    """
+    if all(p is None for p in positions):
+        return None
+    return encode_cursor(snapshot, limit, positions)
+
+
+def _key_page(adjacency, limit, start):
+    if start is None:
+        return [], None
+    ids, start = adjacency.page(start, limit)
+    names = adjacency.names
+    return [names[i] for i in ids], start
+
+
+def _row_page(source, target, name, limit, start):
+    ids, start = source.row_page(source.lookup(name), start, limit)
+    names = target.names
+    return [names[i] for i in ids], start
+
+
+def build_page(snapshot, key, adjacency, limit, positions):
+    names, start = _key_page(adjacency, limit, positions[0])
+    return {key: names, 'next': next_cursor(snapshot, limit, (start,))}
+
+
+def build_row_page(snapshot, key, source, target, name, limit, positions):
+    names, start = _row_page(source, target, name, limit, positions[0])
+    return {key: names, 'next': next_cursor(snapshot, limit, (start,))}
+
+
+# The URL shapes under the mount point, keyed by the path length and the
+# fixed segments, which are every other segment. Each maps to the name of
+# the controller attribute, the request parameters for the variable
+# segments, and any fixed request parameters.
+_ROUTES = {
+    (1, 'users'): ('_users', (), {}),
+    (1, 'groups'): ('_groups', (), {}),
+    (1, 'check'): ('_check', (), {}),
+    (1, 'lookup'): ('_lookup', (), {}),
+    (1, 'changes'): ('_changes', (), {}),
+    (2, 'users'): ('_users', ('user',), {}),
+    (2, 'groups'): ('_groups', ('group',), {}),
+    (3, 'users', 'groups'): ('_users', ('user',), {'groups': True}),
+    (3, 'groups', 'users'): ('_groups', ('group',), {'users': True}),
+    (4, 'users', 'groups'): ('_users', ('user', 'group'), {'groups': True}),
+    (4, 'groups', 'users'): ('_groups', ('group', 'user'), {'users': True})
+}
+
+
+def _route_error(segments):
+    # Only called for paths no route matches, to explain which part of the
+    # path is wrong.
+    collection = segments[0]
+    if collection not in ('users', 'groups'):
+        if collection in ('check', 'lookup', 'changes'):
+            return "Resource not found."
+        return "Collection not found."
+    if len(segments) >= 3:
+        if collection == 'users' and segments[2] != 'groups':
+            return "User attribute not found."
+        if collection == 'groups' and segments[2] != 'users':
+            return "Group attribute not found."
+    return "Resource not found."
+
+
 class MainController(object):
+    # Conditional requests are answered from the snapshot generation alone,
+    # before any page handler runs.
+    _cp_config = {'tools.conditional.on': True}
+
     def __init__(self):
-        self._lock = threading.RLock()
+        # NOTE: The lock only serializes writers. Readers never take it; they
+        # grab the current snapshot reference and work from that instead.
+        self._lock = threading.Lock()
+        self._snapshot = snapshots.Snapshot()
+        self._response_cache = cache.ResponseCache()
+        self._listeners = []
+        self._membership_responses = (None, {})
 
         # NOTE: Use leading underscores here to prevent auto URL routing. Auto
         # routing prevents _cp_dispatch from being called.
-        self._users = UsersController()
-        self._groups = GroupsController()
+        self._users = UsersController(
+            response_cache=self._response_cache
+        )
+        self._groups = GroupsController(
+            response_cache=self._response_cache
+        )
+        self._check = CheckController()
+        self._lookup = LookupController()
+        self._changes = ChangesController(
+            feed=changes.ChangeFeed(generation=self._snapshot.generation),
+            response_cache=self._response_cache
+        )
 
-    @synchronize
-    def update(self, data=None):
-        self._users.update(data)
-        self._groups.update(data)
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def response_cache(self):
+        return self._response_cache
+
+    @property
+    def change_feed(self):
+        return self._changes.feed
+
+    def add_listener(self, callback):
+        """
+        Register a callback to run with every newly published snapshot.
+
+        Callbacks run on the thread publishing the snapshot, after it has
+        been published, so they must return quickly.
+
+        Args:
+            callback (callable): Called with the new Snapshot.
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self._listeners.remove(callback)
 
-    # NOTE: vpath is a required argument name for _cp_dispatch.
     @synchronize
-    def _cp_dispatch(self, vpath):
-        length = len(vpath)
-        controller = self
-
-        # /collection
-        if length >= 1:
-            arg = vpath.pop(0)
-            if arg == 'users':
-                controller = self._users
-            elif arg == 'groups':
-                controller = self._groups
-            else:
-                raise cherrypy.HTTPError(404, "Collection not found.")
+    def update(self, data=None, added=None, removed=None, modified=None):
+        feed = self._changes.feed
+        if added is not None or removed is not None:
+            previous = self._snapshot
+            snapshot = previous.apply(added, removed, modified)
 
-        # /collection/item
-        if length >= 2:
-            if controller == self._users:
-                cherrypy.request.params['user'] = vpath.pop(0)
-            else:
-                cherrypy.request.params['group'] = vpath.pop(0)
-
-        # /collection/item/sub-collection
-        if length >= 3:
-            arg = vpath.pop(0)
-            if controller == self._users:
-                if arg != 'groups':
-                    raise cherrypy.HTTPError(404, "User attribute not found.")
-                else:
-                    cherrypy.request.params['groups'] = True
+            # Only record what the delta actually changed, so the feed can
+            # be replayed and compacted safely.
+            pairs = set(tuple(pair) for pair in added or [])
+            pairs.update(tuple(pair) for pair in removed or [])
+            feed.record(
+                snapshot.generation,
+                [p for p in pairs
+                 if snapshot.is_member(*p) and not previous.is_member(*p)],
+                [p for p in pairs
+                 if previous.is_member(*p) and not snapshot.is_member(*p)]
+            )
+        else:
+            if isinstance(data, snapshots.Snapshot):
+                snapshot = data
             else:
-                if arg != 'users':
-                    raise cherrypy.HTTPError(404, "Group attribute not found.")
-                else:
-                    cherrypy.request.params['users'] = True
+                snapshot = snapshots.Snapshot(data, modified)
+            feed.reset(snapshot.generation)
+        self._publish(snapshot)
 
-        # /collection/item/sub-collection/sub-item
-        if length >= 4:
-            if controller == self._users:
-                cherrypy.request.params['group'] = vpath.pop(0)
-            else:
-                cherrypy.request.params['user'] = vpath.pop(0)
+    def _publish(self, snapshot):
+        # Each controller reads from a single snapshot reference per request,
+        # so publishing is just a reference swap for each of them.
+        self._users.snapshot = snapshot
+        self._groups.snapshot = snapshot
+        self._check.snapshot = snapshot
+        self._lookup.snapshot = snapshot
+        self._changes.snapshot = snapshot
+        self._snapshot = snapshot
+
+        # Cached bodies are keyed by generation, so the old ones can never be
+        # served again.
+        self._response_cache.clear()
+
+        for callback in list(self._listeners):
+            callback(snapshot)
+
+    def route(self, segments):
+        """
+        Match a request path against the route table.
 
-        # Invalid
-        if length >= 5:
-            raise cherrypy.HTTPError(404, "Resource not found.")
+        Args:
+            segments (list): The non-empty segments of the request path,
+                relative to the mount point.
 
+        Returns:
+            tuple: The controller whose index handles the path, and the
+                request parameters taken from the path.
+
+        Raises:
+            HTTPError: a 404 if no route matches the path.
+        """
+        if not segments:
+            return self, {}
+        route = _ROUTES.get((len(segments),) + tuple(segments[::2]))
+        if route is None:
+            raise cherrypy.HTTPError(404, _route_error(segments))
+        name, variables, flags = route
+        params = dict(zip(variables, segments[1::2]))
+        params.update(flags)
+        return getattr(self, name), params
+
+    def membership_handler(self):
+        """
+        Answer a membership check with as little work as possible.
+
+        RouteDispatcher installs this in place of the index handler for GET
+        and HEAD requests to /users/{user}/groups/{group} and
+        /groups/{group}/users/{user}, with the tools it replaces turned
+        off. Conditional requests are answered here, headers are built once
+        per snapshot and format, and the 304 and 404 statuses are set
+        directly instead of raised. A 404 has an empty body.
+
+        Returns:
+            bytes: The encoded null body, or an empty body.
+        """
+        request = cherrypy.serving.request
+        response = cherrypy.serving.response
+        snapshot = self._snapshot
+        etag, body, found, not_modified = self._membership_response(
+            snapshot,
+            negotiate_format()
+        )
+
+        headers = response.headers
+        params = request.params
+        if not snapshot.is_member(params['user'], params['group']):
+            response.status = 404
+            headers.pop('Content-Type', None)
+            return b''
+
+        if tools.is_current(snapshot, etag):
+            response.status = 304
+            headers.pop('Content-Type', None)
+            for name, value in not_modified:
+                headers[name] = value
+            return b''
+
+        for name, value in found:
+            headers[name] = value
+        return body
+
+    def _membership_response(self, snapshot, negotiated):
+        # Builds the entity tag of the representation, the null body, and
+        # the headers of the 200 and 304 responses, once per snapshot and
+        # format. A stale entry is replaced by the first request that sees
+        # the new snapshot. Null bodies are too small to be gzip-encoded.
+        cached = self._membership_responses
+        if cached[0] is not snapshot:
+            cached = (snapshot, {})
+            self._membership_responses = cached
+        responses = cached[1]
+        result = responses.get(negotiated)
+        if result is None:
+            response_format, media_type = negotiated
+            etag = tools.entity_tag(snapshot)
+            if response_format != 'json':
+                etag = tools.variant_tag(etag, response_format)
+            not_modified = (('ETag', etag), ('Vary', tools.VARY))
+            found = [
+                ('Content-Type', media_type),
+                ('Vary', tools.VARY),
+                ('ETag', etag)
+            ]
+            if snapshot.modified is not None:
+                found.append(
+                    ('Last-Modified', httputil.HTTPDate(snapshot.modified))
+                )
+            result = (
+                etag,
+                _NULLS[response_format],
+                tuple(found),
+                not_modified
+            )
+            responses[negotiated] = result
+        return result
+
+    # NOTE: vpath is a required argument name for _cp_dispatch.
+    def _cp_dispatch(self, vpath):
+        # Only used under CherryPy's default dispatcher; RouteDispatcher
+        # calls route directly.
+        controller, params = self.route(vpath)
+        del vpath[:]
+        cherrypy.request.params.update(params)
         return controller
 
     @cherrypy.expose
-    @cherrypy.tools.json_out()
-    @synchronize
-    def index(self):
-        return {
-            'users': self._users.list(),
-            'groups': self._groups.list()
-        }
+    def index(self, limit=None, cursor=None, count=None):
+        snapshot = self._snapshot
+        if parse_flag('count', count):
+            users = len(snapshot.user_adjacency)
+            groups = len(snapshot.group_adjacency)
+            return json_response(
+                self._response_cache,
+                snapshot,
+                ('count',),
+                lambda: {'users': users, 'groups': groups}
+            )
+        page = get_page(snapshot, limit, cursor, 2)
+        if page is None:
+            users = snapshot.user_adjacency
+            groups = snapshot.group_adjacency
+            return listing_response(
+                self._response_cache,
+                snapshot,
+                (),
+                [
+                    ('users', len(users), _key_names(users)),
+                    ('groups', len(groups), _key_names(groups))
+                ]
+            )
 
+        def build():
+            limit, positions = page
+            users, user_start = _key_page(
+                snapshot.user_adjacency,
+                limit,
+                positions[0]
+            )
+            groups, group_start = _key_page(
+                snapshot.group_adjacency,
+                limit,
+                positions[1]
+            )
+            return {
+                'users': users,
+                'groups': groups,
+                'next': next_cursor(
+                    snapshot,
+                    limit,
+                    (user_start, group_start)
+                )
+            }
 
-class UsersController(object):
+        return json_response(
+            self._response_cache,
+            snapshot,
+            (page[0],) + page[1],
+            build
+        )
 
-    def __init__(self, user_group_mapping=None):
-        self.mapping = {}
-        self.update(user_group_mapping)
 
-    def update(self, user_group_mapping=None):
-        mapping = {}
+class UsersController(object):
 
-        if user_group_mapping:
-            for user_group in user_group_mapping:
-                user_groups = mapping.get(user_group[0], [])
-                user_groups.append(user_group[1])
-                mapping.update([(user_group[0], user_groups)])
+    def __init__(self, user_group_mapping=None, response_cache=None):
+        self.snapshot = snapshots.Snapshot()
+        if response_cache is None:
+            response_cache = cache.ResponseCache()
+        self.response_cache = response_cache
+        self.update(user_group_mapping)
 
-            # Do one final pass to remove duplicates.
-            for user in mapping.keys():
-                user_groups = mapping.get(user)
-                mapping.update([(user, list(set(user_groups)))])
+    @property
+    def mapping(self):
+        return self.snapshot.users
 
-        self.mapping = mapping
+    def update(self, user_group_mapping=None):
+        self.snapshot = snapshots.Snapshot(user_group_mapping)
 
     def list(self):
         return list(self.mapping.keys())
 
     @cherrypy.expose
-    @cherrypy.tools.json_out()
-    def index(self, user=None, groups=False, group=None):
+    def index(self, user=None, groups=False, group=None, limit=None,
+              cursor=None, prefix=None, contains=None, all_of=None,
+              any_of=None, none_of=None, count=None):
+        snapshot = self.snapshot
+        mapping = snapshot.users
         if user is not None:
-            if user in self.mapping.keys():
+            if user in mapping:
                 if groups:
-                    user_groups = self.mapping.get(user)
                     if group is not None:
-                        if group in user_groups:
-                            return
+                        if snapshot.is_member(user, group):
+                            return json_null()
                         else:
                             raise cherrypy.HTTPError(404, "Group not found.")
                     else:
-                        return {'groups': user_groups}
+                        source = snapshot.user_adjacency
+                        if parse_flag('count', count):
+                            return count_response(
+                                self.response_cache,
+                                snapshot,
+                                ('users', user, 'groups'),
+                                source.degree(source.lookup(user))
+                            )
+                        page = get_page(snapshot, limit, cursor, 1)
+                        if page is None:
+                            return listing_response(
+                                self.response_cache,
+                                snapshot,
+                                ('users', user, 'groups'),
+                                [
+                                    (
+                                        'groups',
+                                        source.degree(source.lookup(user)),
+                                        _row_names(
+                                            source,
+                                            snapshot.group_adjacency,
+                                            user
+                                        )
+                                    )
+                                ]
+                            )
+                        return json_response(
+                            self.response_cache,
+                            snapshot,
+                            ('users', user, 'groups', page[0]) + page[1],
+                            lambda: build_row_page(
+                                snapshot,
+                                'groups',
+                                snapshot.user_adjacency,
+                                snapshot.group_adjacency,
+                                user,
+                                *page
+                            )
+                        )
                 else:
-                    return
+                    return json_null()
             else:
                 raise cherrypy.HTTPError(404, "User not found.")
         else:
-            return {'users': list(self.mapping.keys())}
+            if any(p is not None for p in (all_of, any_of, none_of)):
+                return query_response(
+                    self.response_cache,
+                    snapshot,
+                    'users',
+                    snapshot.select_users,
+                    snapshot.user_adjacency,
+                    all_of,
+                    any_of,
+                    none_of,
+                    count,
+                    limit,
+                    cursor
+                )
+            if prefix is not None or contains is not None:
+                return search_response(
+                    self.response_cache,
+                    snapshot,
+                    'users',
+                    snapshot.user_adjacency,
+                    prefix,
+                    contains,
+                    count,
+                    limit,
+                    cursor
+                )
+            source = snapshot.user_adjacency
+            if parse_flag('count', count):
+                return count_response(
+                    self.response_cache,
+                    snapshot,
+                    ('users',),
+                    len(source)
+                )
+            page = get_page(snapshot, limit, cursor, 1)
+            if page is None:
+                return listing_response(
+                    self.response_cache,
+                    snapshot,
+                    ('users',),
+                    [('users', len(source), _key_names(source))]
+                )
+            return json_response(
+                self.response_cache,
+                snapshot,
+                ('users', page[0]) + page[1],
+                lambda: build_page(
+                    snapshot,
+                    'users',
+                    snapshot.user_adjacency,
+                    *page
+                )
+            )
 
 
 class GroupsController(object):
 
-    def __init__(self, user_group_mapping=None):
-        self.mapping = {}
+    def __init__(self, user_group_mapping=None, response_cache=None):
+        self.snapshot = snapshots.Snapshot()
+        if response_cache is None:
+            response_cache = cache.ResponseCache()
+        self.response_cache = response_cache
         self.update(user_group_mapping)
 
-    def update(self, user_group_mapping=None):
-        mapping = {}
-
-        if user_group_mapping:
-            for user_group in user_group_mapping:
-                user_groups = mapping.get(user_group[1], [])
-                user_groups.append(user_group[0])
-                mapping.update([(user_group[1], user_groups)])
+    @property
+    def mapping(self):
+        return self.snapshot.groups
 
-            # Do one final pass to remove duplicates.
-            for group in mapping.keys():
-                group_users = mapping.get(group)
-                mapping.update([(group, list(set(group_users)))])
-
-        self.mapping = mapping
+    def update(self, user_group_mapping=None):
+        self.snapshot = snapshots.Snapshot(user_group_mapping)
 
     def list(self):
         return list(self.mapping.keys())
 
     @cherrypy.expose
-    @cherrypy.tools.json_out()
-    def index(self, group=None, users=False, user=None):
+    def index(self, group=None, users=False, user=None, limit=None,
+              cursor=None, prefix=None, contains=None, all_of=None,
+              any_of=None, none_of=None, count=None):
+        snapshot = self.snapshot
+        mapping = snapshot.groups
         if group:
-            if group in self.mapping.keys():
+            if group in mapping:
                 if users:
-                    group_users = self.mapping.get(group)
                     if user:
-                        if user in group_users:
-                            return
+                        if snapshot.is_member(user, group):
+                            return json_null()
                         else:
                             raise cherrypy.HTTPError(404, "User not found.")
                     else:
-                        return {'users': group_users}
+                        source = snapshot.group_adjacency
+                        if parse_flag('count', count):
+                            return count_response(
+                                self.response_cache,
+                                snapshot,
+                                ('groups', group, 'users'),
+                                source.degree(source.lookup(group))
+                            )
+                        page = get_page(snapshot, limit, cursor, 1)
+                        if page is None:
+                            return listing_response(
+                                self.response_cache,
+                                snapshot,
+                                ('groups', group, 'users'),
+                                [
+                                    (
+                                        'users',
+                                        source.degree(source.lookup(group)),
+                                        _row_names(
+                                            source,
+                                            snapshot.user_adjacency,
+                                            group
+                                        )
+                                    )
+                                ]
+                            )
+                        return json_response(
+                            self.response_cache,
+                            snapshot,
+                            ('groups', group, 'users', page[0]) + page[1],
+                            lambda: build_row_page(
+                                snapshot,
+                                'users',
+                                snapshot.group_adjacency,
+                                snapshot.user_adjacency,
+                                group,
+                                *page
+                            )
+                        )
                 else:
-                    return
+                    return json_null()
             else:
                 raise cherrypy.HTTPError(404, "Group not found.")
         else:
-            return {'groups': list(self.mapping.keys())}
+            if any(p is not None for p in (all_of, any_of, none_of)):
+                return query_response(
+                    self.response_cache,
+                    snapshot,
+                    'groups',
+                    snapshot.select_groups,
+                    snapshot.group_adjacency,
+                    all_of,
+                    any_of,
+                    none_of,
+                    count,
+                    limit,
+                    cursor
+                )
+            if prefix is not None or contains is not None:
+                return search_response(
+                    self.response_cache,
+                    snapshot,
+                    'groups',
+                    snapshot.group_adjacency,
+                    prefix,
+                    contains,
+                    count,
+                    limit,
+                    cursor
+                )
+            source = snapshot.group_adjacency
+            if parse_flag('count', count):
+                return count_response(
+                    self.response_cache,
+                    snapshot,
+                    ('groups',),
+                    len(source)
+                )
+            page = get_page(snapshot, limit, cursor, 1)
+            if page is None:
+                return listing_response(
+                    self.response_cache,
+                    snapshot,
+                    ('groups',),
+                    [('groups', len(source), _key_names(source))]
+                )
+            return json_response(
+                self.response_cache,
+                snapshot,
+                ('groups', page[0]) + page[1],
+                lambda: build_page(
+                    snapshot,
+                    'groups',
+                    snapshot.group_adjacency,
+                    *page
+                )
+            )
+
+
+def parse_pairs(data):
+    """
+    Validate a decoded JSON request body holding (user, group) pairs.
+
+    Args:
+        data: The decoded request body.
+
+    Returns:
+        list: The (user, group) pairs.
+
+    Raises:
+        HTTPError: a 400 error if the body is not an array of
+            [user, group] string pairs.
+    """
+    if isinstance(data, list):
+        pairs = []
+        for entry in data:
+            if not isinstance(entry, list) or len(entry) != 2:
+                break
+            user, group = entry
+            if not isinstance(user, _STRING_TYPES):
+                break
+            if not isinstance(group, _STRING_TYPES):
+                break
+            pairs.append((user, group))
+        else:
+            return pairs
+    raise cherrypy.HTTPError(
+        400,
+        "Request body must be a JSON array of [user, group] pairs."
+    )
+
+
+class CheckController(object):
+    # NOTE: A trailing slash redirect would turn the POST into a GET.
+    _cp_config = {'tools.trailing_slash.on': False}
+
+    def __init__(self, user_group_mapping=None):
+        self.snapshot = snapshots.Snapshot(user_group_mapping)
+
+    @cherrypy.expose
+    @cherrypy.tools.allow(methods=['POST'])
+    @cherrypy.tools.json_in()
+    def index(self):
+        pairs = parse_pairs(cherrypy.request.json)
+
+        # Every pair is checked against the same snapshot, even if a reload
+        # is published part way through.
+        snapshot = self.snapshot
+        results = [snapshot.is_member(user, group) for user, group in pairs]
+
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return json.dumps({'results': results}).encode('utf-8')
+
+
+def parse_users(data):
+    """
+    Validate a decoded JSON request body holding user names.
+
+    Args:
+        data: The decoded request body.
+
+    Returns:
+        list: The distinct user names, in request order.
+
+    Raises:
+        HTTPError: a 400 error if the body is not an array of strings.
+    """
+    if isinstance(data, list):
+        if all(isinstance(user, _STRING_TYPES) for user in data):
+            users = []
+            seen = set()
+            for user in data:
+                if user not in seen:
+                    seen.add(user)
+                    users.append(user)
+            return users
+    raise cherrypy.HTTPError(
+        400,
+        "Request body must be a JSON array of user names."
+    )
+
+
+class LookupController(object):
+    # NOTE: A trailing slash redirect would turn the POST into a GET.
+    _cp_config = {'tools.trailing_slash.on': False}
+
+    def __init__(self, user_group_mapping=None):
+        self.snapshot = snapshots.Snapshot(user_group_mapping)
+
+    @cherrypy.expose
+    @cherrypy.tools.allow(methods=['POST'])
+    @cherrypy.tools.json_in()
+    def index(self):
+        users = parse_users(cherrypy.request.json)
+
+        # Every user is looked up in the same snapshot, even if a reload is
+        # published part way through.
+        snapshot = self.snapshot
+        source = snapshot.user_adjacency
+        target = snapshot.group_adjacency
+        known = []
+        unknown = []
+        size = 0
+        for user in users:
+            i = source.lookup(user)
+            if i is None:
+                unknown.append(user)
+            else:
+                known.append((user, i))
+                size += source.degree(i)
+
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        if size > _STREAM_THRESHOLD:
+            cherrypy.response.stream = True
+            return _stream_lookup(source, target, known, unknown)
+
+        table = target.names
+        return json.dumps(
+            {
+                'groups': dict(
+                    (user, [table[j] for j in source.row(i)])
+                    for user, i in known
+                ),
+                'unknown': unknown
+            }
+        ).encode('utf-8')
+
+
+def parse_generation(value):
+    """
+    Validate the since query parameter.
+
+    Args:
+        value (string): The requested generation.
+
+    Returns:
+        int: The generation.
+
+    Raises:
+        HTTPError: a 400 error if the value is not a non-negative integer.
+    """
+    try:
+        generation = int(value)
+    except (TypeError, ValueError):
+        generation = -1
+    if generation < 0:
+        raise cherrypy.HTTPError(400, "Since must be a generation number.")
+    return generation
+
+
+class ChangesController(object):
+
+    def __init__(self, feed=None, response_cache=None):
+        self.snapshot = snapshots.Snapshot()
+        if feed is None:
+            feed = changes.ChangeFeed(generation=self.snapshot.generation)
+        self.feed = feed
+        if response_cache is None:
+            response_cache = cache.ResponseCache()
+        self.response_cache = response_cache
+
+    @cherrypy.expose
+    def index(self, since=None):
+        since = parse_generation(since)
+        feed = self.feed
+
+        def build():
+            delta = feed.since(since)
+            if delta is None:
+                return {
+                    'generation': feed.generation,
+                    'instance': snapshots.INSTANCE,
+                    'resync': True
+                }
+            return {
+                'generation': feed.generation,
+                'instance': snapshots.INSTANCE,
+                'resync': False,
+                'added': [list(pair) for pair in delta[0]],
+                'removed': [list(pair) for pair in delta[1]]
+            }
+
+        return json_response(
+            self.response_cache,
+            self.snapshot,
+            ('changes', since),
+            build
+        )
@@ -0,0 +1,109 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import cherrypy
+
+from cherrypy import _cpdispatch
+
+
+# The tools MainController.membership_handler replaces. The encode tool has
+# nothing to do for a handler returning bytes.
+_LEAN_CONFIG = {
+    'tools.conditional.on': False,
+    'tools.trailing_slash.on': False,
+    'tools.encode.on': False
+}
+
+
+class RouteDispatcher(object):
+    """
+    A CherryPy dispatcher for applications rooted at a MainController.
+
+    CherryPy's default dispatcher walks the object tree one path segment at
+    a time, calling MainController._cp_dispatch along the way, and rebuilds
+    the request configuration from every node it visits. This dispatcher
+    matches the whole path against the route table in one step instead
+    (see MainController.route), and merges the configuration once per
+    collection. GET membership checks are handed to
+    MainController.membership_handler, skipping the tools it replaces.
+
+    Configuration sections for the mount point and the top-level resources
+    (e.g. [/], [/users], [/check]) apply as before. Sections for paths
+    naming a particular user or group are not supported.
+    """
+
+    def __init__(self):
+        self._configs = {}
+
+    def __call__(self, path_info):
+        request = cherrypy.serving.request
+        segments = [x for x in path_info.strip('/').split('/') if x]
+        root = request.app.root
+
+        # Every SLUGS resource is served by an index handler, so the
+        # trailing_slash tool treats them all as directories, as before.
+        request.is_index = True
+        try:
+            controller, params = root.route(segments)
+        except cherrypy.HTTPError:
+            request.config = self._config(request.app, root, [])
+            raise
+
+        config = self._config(request.app, controller, segments)
+        request.config = config
+        request.params.update(params)
+
+        # Membership checks are most of the traffic. The lean handler does
+        # the work of the tools it replaces, so it is only used where they
+        # would have done exactly that: conditional requests are on, and no
+        # trailing slash redirect is due.
+        if ('user' in params and 'group' in params and
+                request.method in ('GET', 'HEAD') and
+                config.get('tools.conditional.on') and
+                (path_info.endswith('/') or
+                 not config.get('tools.trailing_slash.on'))):
+            config.update(_LEAN_CONFIG)
+            request.handler = root.membership_handler
+            return
+
+        request.handler = _cpdispatch.LateParamPageHandler(controller.index)
+
+    def _config(self, app, controller, segments):
+        # Mirrors the merge order of the default dispatcher. The global
+        # configuration can change at any time, so only the application
+        # part is cached, and only for as long as the application sections
+        # it was built from are unchanged; Application.merge updates them
+        # in place.
+        key = (app, segments[0] if segments else None, controller)
+        sections = [app.config.get('/', {})]
+        if segments:
+            sections.append(app.config.get('/' + segments[0], {}))
+        cached = self._configs.get(key)
+        if cached is not None and cached[0] == sections:
+            conf = cached[1]
+        else:
+            conf = {}
+            conf.update(getattr(app.root, '_cp_config', {}))
+            conf.update(sections[0])
+            if segments:
+                conf.update(getattr(controller, '_cp_config', {}))
+                conf.update(sections[1])
+            index = getattr(controller, 'index', None)
+            conf.update(getattr(index, '_cp_config', {}))
+            self._configs[key] = ([dict(x) for x in sections], conf)
+
+        config = cherrypy.config.copy()
+        config.update(conf)
+        return config
@@ -0,0 +1,133 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+def components(edges):
+    """
+    Find the strongly connected components of a group hierarchy.
+
+    Uses an iterative version of Tarjan's algorithm, so deep hierarchies do
+    not hit the recursion limit.
+
+    Args:
+        edges (iterable): The (group, parent) pairs of the hierarchy, where
+            every member of group is also a member of parent.
+
+    Returns:
+        list: The components, as lists of groups. A component is listed
+            after every component holding one of its parents. A component
+            with more than one group is a cycle.
+    """
+    parents = {}
+    for group, parent in edges:
+        parents.setdefault(group, []).append(parent)
+        parents.setdefault(parent, [])
+
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    result = []
+
+    for root in sorted(parents):
+        if root in index:
+            continue
+        work = [(root, iter(parents[root]))]
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            group, children = work[-1]
+            for parent in children:
+                if parent not in index:
+                    index[parent] = low[parent] = len(index)
+                    stack.append(parent)
+                    on_stack.add(parent)
+                    work.append((parent, iter(parents[parent])))
+                    break
+                elif parent in on_stack:
+                    low[group] = min(low[group], index[parent])
+            else:
+                work.pop()
+                if work:
+                    caller = work[-1][0]
+                    low[caller] = min(low[caller], low[group])
+                if low[group] == index[group]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == group:
+                            break
+                    result.append(sorted(component))
+    return result
+
+
+def closure(edges):
+    """
+    Compute the effective groups of every group in a hierarchy.
+
+    Groups in a cycle are members of each other, so they all share the same
+    effective groups.
+
+    Args:
+        edges (iterable): The (group, parent) pairs of the hierarchy.
+
+    Returns:
+        dict: A sorted tuple of the effective groups of each group, itself
+            included, keyed by group.
+    """
+    edges = list(edges)
+    parents = {}
+    for group, parent in edges:
+        parents.setdefault(group, set()).add(parent)
+
+    # Components come out after the components of all their parents, so
+    # each one only has to merge closures that are already complete.
+    result = {}
+    for component in components(edges):
+        groups = set(component)
+        for group in component:
+            for parent in parents.get(group, ()):
+                if parent not in groups:
+                    groups.update(result[parent])
+        groups = tuple(sorted(groups))
+        for group in component:
+            result[group] = groups
+    return result
+
+
+def expand(user_group_mapping, edges):
+    """
+    Expand direct user/group memberships into effective memberships.
+
+    Args:
+        user_group_mapping (iterable): The direct [user, group] entries.
+        edges (iterable): The (group, parent) pairs of the hierarchy.
+
+    Returns:
+        list: The distinct [user, group] entries for every direct and
+            inherited membership, in the order of the direct entries.
+    """
+    groups = closure(edges)
+    data = []
+    seen = set()
+    for user, group in user_group_mapping:
+        for effective in groups.get(group, (group,)):
+            if (user, effective) not in seen:
+                seen.add((user, effective))
+                data.append([user, effective])
+    return data
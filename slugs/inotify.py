@@ -0,0 +1,165 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct('iIII')
+_BUFFER_SIZE = 64 * 1024
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (AttributeError, OSError, TypeError):
+        return None
+
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_init1.restype = ctypes.c_int
+    libc.inotify_add_watch.argtypes = [
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_uint32
+    ]
+    libc.inotify_add_watch.restype = ctypes.c_int
+    return libc
+
+
+_libc = _load_libc()
+
+
+def is_supported():
+    """
+    Check if the inotify API is available on this platform.
+
+    Returns:
+        bool: True if inotify can be used, False otherwise.
+    """
+    return _libc is not None
+
+
+class Event(object):
+    """
+    A single inotify event.
+    """
+
+    def __init__(self, wd, mask, cookie, name):
+        self.wd = wd
+        self.mask = mask
+        self.cookie = cookie
+        self.name = name
+
+    def __repr__(self):
+        return "Event(wd={}, mask={:#x}, cookie={}, name={!r})".format(
+            self.wd,
+            self.mask,
+            self.cookie,
+            self.name
+        )
+
+
+class Inotify(object):
+    """
+    A minimal ctypes binding for a Linux inotify instance.
+    """
+
+    def __init__(self):
+        if not is_supported():
+            raise OSError(errno.ENOSYS, "inotify is not supported.")
+
+        self._fd = _libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def fileno(self):
+        return self._fd
+
+    def add_watch(self, path, mask):
+        """
+        Start watching a path for the events selected by mask.
+
+        Args:
+            path (string): The path to watch.
+            mask (int): A bitmask of the IN_* event flags to watch for.
+
+        Returns:
+            int: The watch descriptor for the new watch.
+        """
+        if not isinstance(path, bytes):
+            path = path.encode('utf-8')
+        wd = _libc.inotify_add_watch(self._fd, path, mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return wd
+
+    def read(self, timeout=None):
+        """
+        Read the pending events, waiting up to timeout seconds for some.
+
+        Args:
+            timeout (float): The number of seconds to wait for events.
+                Optional, defaults to None, waiting indefinitely.
+
+        Returns:
+            list: The Event objects read, empty if the wait timed out.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        buffer = os.read(self._fd, _BUFFER_SIZE)
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(
+                buffer,
+                offset
+            )
+            offset += _EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append(
+                Event(wd, mask, cookie, name.decode('utf-8', 'replace'))
+            )
+        return events
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
@@ -16,19 +16,187 @@
 
 from cherrypy.process import plugins
 
+import multiprocessing
 import os
+import threading
+
+from slugs import hierarchy
+from slugs import inotify
+from slugs import snapshots
+from slugs import watch
+
+
+# Watching the parent directory, rather than the file itself, catches files
+# replaced by rename and files deleted and then recreated.
+_DIRECTORY_EVENTS = (
+    inotify.IN_CLOSE_WRITE |
+    inotify.IN_MOVED_TO |
+    inotify.IN_MOVED_FROM |
+    inotify.IN_CREATE |
+    inotify.IN_DELETE |
+    inotify.IN_ATTRIB |
+    inotify.IN_ONLYDIR
+)
+
+# How many lines to parse between checks for a newer file version.
+_CANCEL_CHECK_INTERVAL = 10000
+
+
+class ReloadCancelled(Exception):
+    """
+    Raised when a reload is superseded by a newer version of the file.
+    """
+
+
+def parse_mapping_file(path, is_cancelled=None):
+    """
+    Parse a user/group mapping CSV file.
+
+    Entries are [user, group] pairs. Entries following a '[groups]' line
+    are [group, parent] pairs instead, making every member of group a
+    member of parent as well; a '[users]' line switches back.
+
+    Args:
+        path (string): The path to the CSV file.
+        is_cancelled (callable): A callable returning True once the parse
+            should be abandoned. Optional, defaults to None.
+
+    Returns:
+        list: The [user, group] entries found in the file, in file order.
+            If the file has group entries, the list holds every effective
+            membership instead, direct or inherited.
+
+    Raises:
+        ValueError: if the file contains an invalid entry.
+        ReloadCancelled: if is_cancelled returns True during the parse.
+    """
+    data = []
+    edges = []
+    entries = data
+    with open(path, 'r') as f:
+        for i, line in enumerate(f):
+            if is_cancelled and i % _CANCEL_CHECK_INTERVAL == 0:
+                if is_cancelled():
+                    raise ReloadCancelled()
+
+            line = line.strip()
+
+            # Ignore empty lines and comments
+            if line == '':
+                continue
+            if line[0] == '#':
+                continue
+
+            # Switch sections
+            if line == '[users]':
+                entries = data
+                continue
+            if line == '[groups]':
+                entries = edges
+                continue
+
+            entry = line.split(',')
+            if len(entry) == 2:
+                entries.append([entry[0].strip(), entry[1].strip()])
+            else:
+                raise ValueError(
+                    "Invalid entry on line {}.".format(i + 1)
+                )
+
+    if edges:
+        return hierarchy.expand(data, edges)
+    return data
+
+
+def _sorted_pairs(snapshot):
+    # Yield the memberships of a snapshot sorted by (user, group) name. IDs
+    # added by deltas are not in name order, so rows are sorted by name one
+    # at a time rather than materialising every pair at once.
+    users = snapshot.user_adjacency
+    group_names = snapshot.group_adjacency.names
+    for user_id in users.order():
+        if not users.degree(user_id):
+            continue
+        user = users.names[user_id]
+        for group in sorted([group_names[j] for j in users.row(user_id)]):
+            yield user, group
+
+
+def _diff(snapshot, data):
+    """
+    Compare parsed entries with the memberships of a snapshot.
+
+    Args:
+        snapshot (Snapshot): The snapshot to compare against.
+        data (list): The parsed [user, group] entries. Sorted in place.
+
+    Returns:
+        tuple: The sorted lists of added and removed (user, group) pairs.
+    """
+    data.sort()
+    added = []
+    removed = []
+    previous = _sorted_pairs(snapshot)
+    old = next(previous, None)
+    last = None
+    for entry in data:
+        new = (entry[0], entry[1])
+        if new == last:
+            continue
+        last = new
+        while old is not None and old < new:
+            removed.append(old)
+            old = next(previous, None)
+        if old == new:
+            old = next(previous, None)
+        else:
+            added.append(new)
+    while old is not None:
+        removed.append(old)
+        old = next(previous, None)
+    return added, removed
+
+
+def _parse_in_subprocess(path, connection):
+    try:
+        connection.send((parse_mapping_file(path), None))
+    except Exception as e:
+        connection.send((None, e))
+    finally:
+        connection.close()
 
 
 class FileMonitoringPlugin(plugins.SimplePlugin):
 
-    def __init__(self, bus, path, callback):
+    def __init__(self, bus, path, callback, watcher='auto',
+                 reloader='thread', snapshot=None):
         plugins.SimplePlugin.__init__(self, bus)
 
         self._callback = callback
         self._path = None
-        self._t = 0
+        self._signature = None
+
+        # NOTE: Reloads are diffed against the published snapshot, so the
+        # plugin never keeps a copy of the data of its own. Without a
+        # snapshot source, every reload is handed over whole.
+        self._snapshot = snapshot
+
+        self._watcher = None
+        self._watcher_thread = None
+        self._watcher_stop = threading.Event()
+
+        # NOTE: Every detected change bumps the version. A reload in progress
+        # is abandoned, and its result dropped, once the version moves on.
+        self._reloader = None
+        self._version = 0
+        self._version_lock = threading.Lock()
+        self._worker_thread = None
+        self._worker_wakeup = threading.Event()
+        self._worker_stop = threading.Event()
 
         self.path = path
+        self.watcher = watcher
+        self.reloader = reloader
 
     @property
     def path(self):
@@ -43,48 +211,288 @@ class FileMonitoringPlugin(plugins.SimplePlugin):
                 "Monitored file '{}' must be an existing file.".format(value)
             )
 
+    @property
+    def watcher(self):
+        return self._watcher
+
+    @watcher.setter
+    def watcher(self, value):
+        if value == 'auto':
+            value = 'inotify' if inotify.is_supported() else 'poll'
+
+        if value == 'inotify':
+            if not inotify.is_supported():
+                raise ValueError(
+                    "The 'inotify' watcher is not supported on this platform."
+                )
+        elif value != 'poll':
+            raise ValueError(
+                "Watcher '{}' must be one of 'auto', 'inotify', or "
+                "'poll'.".format(value)
+            )
+        self._watcher = value
+
+    @property
+    def reloader(self):
+        return self._reloader
+
+    @reloader.setter
+    def reloader(self, value):
+        if value not in ('thread', 'process'):
+            raise ValueError(
+                "Reloader '{}' must be one of 'thread' or 'process'.".format(
+                    value
+                )
+            )
+        self._reloader = value
+
     def start(self):
         self.bus.log(
             "Starting file monitoring plugin for file: {}".format(self._path)
         )
-        self.bus.subscribe("main", self.check_path)
+        self._worker_stop.clear()
+        self._worker_thread = threading.Thread(
+            target=self._work,
+            name="slugs-reload"
+        )
+        self._worker_thread.daemon = True
+        self._worker_thread.start()
+
+        if self._watcher == 'inotify':
+            self._watcher_stop.clear()
+            self._watcher_thread = threading.Thread(
+                target=self._watch,
+                name="slugs-inotify"
+            )
+            self._watcher_thread.daemon = True
+            self._watcher_thread.start()
+        else:
+            self.bus.subscribe("main", self.check_path)
 
     def stop(self):
         self.bus.log(
             "Stopping file monitoring plugin for file: {}".format(self._path)
         )
-        self.bus.unsubscribe("main", self.check_path)
+        if self._watcher_thread is not None:
+            self._watcher_stop.set()
+            self._watcher_thread.join()
+            self._watcher_thread = None
+        else:
+            self.bus.unsubscribe("main", self.check_path)
 
-    def check_path(self):
-        t = os.path.getmtime(self.path)
-        if t > self._t:
-            self._t = t
+        if self._worker_thread is not None:
+            self._worker_stop.set()
+            self._invalidate()
+            self._worker_wakeup.set()
+            self._worker_thread.join()
+            self._worker_thread = None
+
+    def _work(self):
+        while True:
+            self._worker_wakeup.wait()
+            if self._worker_stop.is_set():
+                return
+            self._worker_wakeup.clear()
+            self.update_data()
+
+    def _invalidate(self):
+        with self._version_lock:
+            self._version += 1
+            return self._version
+
+    def _schedule(self):
+        # Hand the reload to the worker thread so that parsing never blocks
+        # the caller. Without a running worker, reload inline instead.
+        self._invalidate()
+        if self._worker_thread is not None:
+            self._worker_wakeup.set()
+        else:
             self.update_data()
 
+    def _watch(self):
+        try:
+            watcher = inotify.Inotify()
+        except OSError as e:
+            self._fall_back(e)
+            return
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self._path))
+            name = os.path.basename(self._path)
+            try:
+                wd = watcher.add_watch(directory, _DIRECTORY_EVENTS)
+            except OSError as e:
+                self._fall_back(e)
+                return
+
+            self.check_path()
+            while not self._watcher_stop.is_set():
+                changed = False
+                for event in watcher.read(timeout=1.0):
+                    if event.mask & inotify.IN_Q_OVERFLOW:
+                        changed = True
+                    elif event.wd != wd:
+                        continue
+                    elif event.mask & inotify.IN_IGNORED:
+                        self._fall_back(
+                            "Monitored directory ({}) is no longer "
+                            "available.".format(directory)
+                        )
+                        return
+                    elif event.name == name:
+                        changed = True
+                if changed:
+                    self.check_path()
+        finally:
+            watcher.close()
+
+    def _fall_back(self, reason):
+        self.bus.log(
+            "Unable to watch monitored file ({}) with inotify: {}. Falling "
+            "back to polling.".format(self._path, reason)
+        )
+        self._watcher = 'poll'
+        self._watcher_thread = None
+        self.bus.subscribe("main", self.check_path)
+
+    def check_path(self):
+        # Compare more than the modification time, so that a file replaced
+        # by rename, or deleted and recreated, is always picked up.
+        try:
+            s = os.stat(self.path)
+        except OSError:
+            if self._signature is not None:
+                self.bus.log(
+                    "Monitored file ({}) is missing. Retaining current "
+                    "data.".format(self._path)
+                )
+                self._signature = None
+            return
+
+        signature = (s.st_dev, s.st_ino, s.st_size, s.st_mtime)
+        if signature != self._signature:
+            self._signature = signature
+            self._schedule()
+
+    def _parse(self, is_cancelled):
+        if self._reloader == 'thread':
+            return parse_mapping_file(self._path, is_cancelled)
+
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=_parse_in_subprocess,
+            args=(self._path, sender)
+        )
+        process.daemon = True
+        process.start()
+        sender.close()
+        try:
+            while not receiver.poll(0.1):
+                if is_cancelled():
+                    process.terminate()
+                    raise ReloadCancelled()
+                if not process.is_alive() and not receiver.poll():
+                    raise ValueError("The parsing subprocess exited.")
+            data, error = receiver.recv()
+        finally:
+            receiver.close()
+            process.join()
+
+        if error is not None:
+            raise error
+        return data
+
     def update_data(self):
         self.bus.log(
             "Monitored file ({}) updated. Reloading data.".format(self._path)
         )
 
-        data = []
-        with open(self._path, 'r') as f:
-            for line in f:
-                line = line.strip()
-
-                # Ignore empty lines and comments
-                if line == '':
-                    continue
-                if line[0] == '#':
-                    continue
-
-                entry = line.split(',')
-                if len(entry) == 2:
-                    data.append([entry[0].strip(), entry[1].strip()])
-                else:
-                    self.bus.log(
-                        "Error parsing monitored file ({}). Halting data "
-                        "reload.".format(self._path)
-                    )
-                    return
-
-        self._callback(data)
+        version = self._version
+
+        def is_cancelled():
+            return self._version != version
+
+        try:
+            if snapshots.is_snapshot_file(self._path):
+                data = snapshots.load(self._path)
+            else:
+                modified = os.stat(self._path).st_mtime
+                data = self._parse(is_cancelled)
+        except ReloadCancelled:
+            self.bus.log(
+                "Monitored file ({}) changed during reload. Discarding stale "
+                "data.".format(self._path)
+            )
+            return
+        except (IOError, OSError, ValueError):
+            self.bus.log(
+                "Error parsing monitored file ({}). Halting data "
+                "reload.".format(self._path)
+            )
+            return
+
+        if is_cancelled():
+            self.bus.log(
+                "Monitored file ({}) changed during reload. Discarding stale "
+                "data.".format(self._path)
+            )
+            return
+
+        # Compiled snapshots are memory-mapped and published whole.
+        if isinstance(data, snapshots.Snapshot):
+            self._callback(data)
+            return
+
+        # Once data has been published, only hand over what actually
+        # changed.
+        previous = self._snapshot() if self._snapshot else None
+        if previous is None or not len(previous.user_adjacency):
+            self._callback(data, modified=modified)
+            return
+
+        added, removed = _diff(previous, data)
+        if added or removed:
+            self.bus.log(
+                "Applying {} added and {} removed memberships.".format(
+                    len(added),
+                    len(removed)
+                )
+            )
+            self._callback(
+                added=added,
+                removed=removed,
+                modified=modified
+            )
+
+
+class WatchPlugin(plugins.SimplePlugin):
+    """
+    Runs a WatchServer alongside the CherryPy engine.
+    """
+
+    def __init__(self, bus, controller, host='127.0.0.1', port=0):
+        plugins.SimplePlugin.__init__(self, bus)
+
+        self._controller = controller
+        self._server = watch.WatchServer(
+            controller,
+            host=host,
+            port=port,
+            log=bus.log
+        )
+
+    @property
+    def server(self):
+        return self._server
+
+    def start(self):
+        self._server.start()
+        self._controller.add_listener(self._server.notify)
+        self.bus.log(
+            "Started watch server on {}:{}.".format(*self._server.address)
+        )
+
+    def stop(self):
+        self.bus.log("Stopping watch server.")
+        self._controller.remove_listener(self._server.notify)
+        self._server.stop()
@@ -0,0 +1,1119 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import array
+import binascii
+import bisect
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import sys
+
+from slugs import bitmaps
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+# Compiled snapshot file layout. All integers are little-endian.
+#
+#   header          magic, version, user count, group count, membership
+#                   count, user name table size, group name table size
+#   user names      UTF-8 names in sorted order, separated by NUL bytes;
+#                   a user's ID is its position in this table
+#   group names     as above, for groups
+#   user offsets    uint32[user count + 1]; the groups of user i are
+#                   user targets[user offsets[i]:user offsets[i + 1]]
+#   user targets    uint32[membership count], sorted group IDs per user
+#   group offsets   uint32[group count + 1], as above
+#   group targets   uint32[membership count], sorted user IDs per group
+#
+# Every section starts on an 8-byte boundary.
+MAGIC = b'SLUGSNAP'
+VERSION = 1
+
+_HEADER = struct.Struct('<8sIIIIII')
+_ALIGNMENT = 8
+_UINT32 = 'I' if array.array('I').itemsize == 4 else 'L'
+_UINT32_MAX = 0xFFFFFFFF
+
+# Every snapshot gets a unique generation number, increasing in the order
+# the snapshots were built. Generation numbers restart with every process,
+# so anything handed to clients that refers to one also carries INSTANCE, a
+# token unique to this process.
+_generations = itertools.count(1)
+INSTANCE = binascii.hexlify(os.urandom(4)).decode('ascii')
+
+# Long rows are stored as compressed bitmaps instead of CSR slices. A CSR
+# row costs four bytes per ID; a bitmap costs about two bytes per ID, plus
+# _BITMAP_BASE_COST bytes and _BITMAP_CHUNK_COST bytes for every chunk of
+# IDs it spans. See _bitmap_threshold.
+_BITMAP_BASE_COST = 610
+_BITMAP_CHUNK_COST = 120
+
+# Once this many rows have been overridden by deltas (or an eighth of all
+# rows, whichever is larger), they are folded back into the CSR arrays.
+_COMPACTION_THRESHOLD = 4096
+
+# The length of the n-grams indexed for substring searches. Shorter
+# substrings are found by scanning the names instead.
+_NGRAM = 3
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _uint32_array(values=()):
+    return array.array(_UINT32, values)
+
+
+def _to_bytes(values):
+    if isinstance(values, memoryview):
+        return values.tobytes()
+    values = _uint32_array(values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    if hasattr(values, 'tobytes'):
+        return values.tobytes()
+    return values.tostring()
+
+
+def _from_bytes(buffer, offset, count):
+    # Serve straight from the mapped file where the platform allows it, and
+    # fall back to copying the section into an array otherwise.
+    if sys.byteorder == 'little' and hasattr(memoryview, 'cast'):
+        return memoryview(buffer)[offset:offset + count * 4].cast(_UINT32)
+
+    values = _uint32_array()
+    data = buffer[offset:offset + count * 4]
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _encode_names(names):
+    # Names are native strings: str on Python 3, and, as parsed from mapping
+    # files, UTF-8 encoded str on Python 2, which is written as it is.
+    return b'\0'.join([
+        name if isinstance(name, bytes) else name.encode('utf-8')
+        for name in names
+    ])
+
+
+def _decode_names(buffer, offset, size, count):
+    # Names are read back as native strings, so that a loaded snapshot finds
+    # the same names as one built from the mapping file.
+    if count == 0:
+        return []
+    data = buffer[offset:offset + size]
+    if bytes is str:
+        return data.split(b'\0')
+    return data.decode('utf-8').split(u'\0')
+
+
+def _csr(keys, count):
+    # Build CSR arrays from sorted (row << 32 | target) keys.
+    offsets = _uint32_array([0]) * (count + 1)
+    for key in keys:
+        offsets[(key >> 32) + 1] += 1
+    for i in range(count):
+        offsets[i + 1] += offsets[i]
+    targets = _uint32_array([key & _UINT32_MAX for key in keys])
+    return offsets, targets
+
+
+def _bitmap_threshold(universe):
+    # The row length past which a bitmap is smaller than the CSR row, even
+    # if the row touches every chunk of the universe of IDs it draws from.
+    chunks = universe // bitmaps.CHUNK_SIZE + 1
+    return (_BITMAP_BASE_COST + _BITMAP_CHUNK_COST * chunks) // 2
+
+
+def _layout(row, threshold):
+    if len(row) > threshold:
+        return bitmaps.Bitmap(row)
+    return _uint32_array(row)
+
+
+def _split(offsets, targets, threshold, copy=True):
+    # Move the rows longer than the threshold out of the CSR arrays and into
+    # bitmaps. Without copy, the CSR arrays are left as they are, and the
+    # slices of the moved rows are simply never read again.
+    bitmap_rows = {}
+    for i in range(len(offsets) - 1):
+        if offsets[i + 1] - offsets[i] > threshold:
+            bitmap_rows[i] = bitmaps.Bitmap(
+                targets[offsets[i]:offsets[i + 1]]
+            )
+    if not bitmap_rows or not copy:
+        return offsets, targets, bitmap_rows
+
+    kept_offsets = _uint32_array([0])
+    kept_targets = _uint32_array()
+    for i in range(len(offsets) - 1):
+        if i not in bitmap_rows:
+            kept_targets.extend(targets[offsets[i]:offsets[i + 1]])
+        kept_offsets.append(len(kept_targets))
+    return kept_offsets, kept_targets, bitmap_rows
+
+
+def _build(user_group_mapping):
+    pairs = list(user_group_mapping or [])
+
+    user_names = sorted(set([pair[0] for pair in pairs]))
+    group_names = sorted(set([pair[1] for pair in pairs]))
+    user_ids = dict(zip(user_names, range(len(user_names))))
+    group_ids = dict(zip(group_names, range(len(group_names))))
+
+    keys = sorted(
+        set([(user_ids[user] << 32) | group_ids[group]
+             for user, group in pairs])
+    )
+    del pairs
+    threshold = _bitmap_threshold(len(group_names))
+    offsets, targets = _csr(keys, len(user_names))
+    offsets, targets, bitmap_rows = _split(offsets, targets, threshold)
+    users = Adjacency(
+        user_names,
+        offsets,
+        targets,
+        ids=user_ids,
+        packed=True,
+        bitmap_rows=bitmap_rows,
+        threshold=threshold
+    )
+
+    keys = sorted([((key & _UINT32_MAX) << 32) | (key >> 32) for key in keys])
+    threshold = _bitmap_threshold(len(user_names))
+    offsets, targets = _csr(keys, len(group_names))
+    offsets, targets, bitmap_rows = _split(offsets, targets, threshold)
+    groups = Adjacency(
+        group_names,
+        offsets,
+        targets,
+        ids=group_ids,
+        packed=True,
+        bitmap_rows=bitmap_rows,
+        threshold=threshold
+    )
+    return users, groups
+
+
+def _grams(name):
+    for k in range(len(name) - _NGRAM + 1):
+        yield name[k:k + _NGRAM]
+
+
+def _change(changes, adjacency, i, value, add):
+    row = changes.get(i)
+    if row is None:
+        row = changes[i] = set(adjacency.row(i))
+    if add:
+        row.add(value)
+    else:
+        row.discard(value)
+
+
+def _row_from(row, start):
+    if isinstance(row, bitmaps.Bitmap):
+        return row.iter_from(start)
+    return itertools.islice(row, bisect.bisect_left(row, start), None)
+
+
+def _unique(ids):
+    last = None
+    for i in ids:
+        if i != last:
+            yield i
+            last = i
+
+
+def _select(rows, universe, all_of, any_of, none_of, start):
+    # rows holds the rows the expression refers to; universe holds the IDs
+    # being selected.
+    all_ids = [rows.lookup(name) for name in all_of]
+    if None in all_ids:
+        return
+    any_ids = [rows.lookup(name) for name in any_of]
+    any_ids = [i for i in any_ids if i is not None]
+    if any_of and not any_ids:
+        return
+    none_ids = [rows.lookup(name) for name in none_of]
+    none_ids = [i for i in none_ids if i is not None]
+
+    # Walk the shortest required row, or failing that the merged optional
+    # rows, and probe the other rows per candidate. When the two shortest
+    # required rows are both bitmaps, intersect them instead.
+    if all_ids:
+        all_ids.sort(key=rows.degree)
+        row_bitmaps = [rows.bitmap(i) for i in all_ids[:2]]
+        if len(all_ids) > 1 and None not in row_bitmaps:
+            candidates = (row_bitmaps[0] & row_bitmaps[1]).iter_from(start)
+            all_ids = all_ids[2:]
+        else:
+            candidates = _row_from(rows.row(all_ids.pop(0)), start)
+    elif any_ids:
+        candidates = _unique(
+            heapq.merge(*[_row_from(rows.row(i), start) for i in any_ids])
+        )
+        any_ids = []
+    else:
+        candidates = (
+            j for j in range(start, len(universe.names)) if universe.degree(j)
+        )
+
+    for j in candidates:
+        if any_ids and not any(rows.contains(i, j) for i in any_ids):
+            continue
+        if not all(rows.contains(i, j) for i in all_ids):
+            continue
+        if any(rows.contains(i, j) for i in none_ids):
+            continue
+        yield j
+
+
+class Adjacency(object):
+    """
+    One direction of the membership store.
+
+    Every name is interned once to an integer ID. The IDs of the names on
+    the other side are kept in CSR form: the row for ID i is the sorted
+    slice targets[offsets[i]:offsets[i + 1]]. Rows longer than the bitmap
+    threshold, which is picked from the number of IDs on the other side
+    when the adjacency is built or compacted, are stored as compressed
+    bitmaps instead, and take no space in the CSR arrays. Rows changed by
+    a delta live in a small overrides dictionary, laid out the same way,
+    so applying a delta never copies the bulk arrays. An ID whose row is
+    empty is not present.
+    """
+
+    def __init__(self, names=None, offsets=None, targets=None, ids=None,
+                 overrides=None, count=None, packed=False, bitmap_rows=None,
+                 order=None, ngrams=None, threshold=None):
+        self._names = names if names is not None else []
+        if ids is None:
+            ids = dict(zip(self._names, range(len(self._names))))
+        self._ids = ids
+        self._offsets = offsets if offsets is not None else _uint32_array([0])
+        self._targets = targets if targets is not None else _uint32_array()
+        self._overrides = overrides if overrides is not None else {}
+        if count is None:
+            count = len(self._names)
+        self._count = count
+
+        # NOTE: A packed adjacency has sorted names, no overrides, and no
+        # absent IDs, so its rows can be written out as they are (see
+        # csr()).
+        self._packed = packed
+
+        # NOTE: A row in bitmap_rows is only ever read from its bitmap. Its
+        # CSR slice is empty, or, for arrays mapped from a compiled
+        # snapshot file, left unread.
+        self._bitmap_rows = bitmap_rows if bitmap_rows is not None else {}
+        if threshold is None:
+            threshold = _bitmap_threshold(0)
+        self._threshold = threshold
+
+        # NOTE: The search indexes depend only on the name table, so they
+        # are shared by every adjacency using the same table. They are also
+        # built lazily, on the first search that needs them.
+        if order is None and packed:
+            order = range(len(self._names))
+        self._order = order
+        self._ngrams = ngrams
+
+    @property
+    def names(self):
+        """
+        The interned names, indexed by ID.
+        """
+        return self._names
+
+    @property
+    def packed(self):
+        return self._packed
+
+    @property
+    def threshold(self):
+        """
+        The length past which rows are stored as bitmaps.
+        """
+        return self._threshold
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for i in range(len(self._names)):
+            if self.degree(i):
+                yield i
+
+    def lookup(self, name):
+        """
+        Look up the ID of a present name.
+
+        Args:
+            name (string): The name to look up.
+
+        Returns:
+            int: The ID of the name, or None if the name is not present.
+        """
+        i = self._ids.get(name)
+        if i is None or not self.degree(i):
+            return None
+        return i
+
+    def row(self, i):
+        """
+        Get the sorted IDs on the other side associated with ID i.
+
+        Returns:
+            array or Bitmap: The row, as an array of IDs, or as a bitmap if
+                it is longer than the bitmap threshold. Either can be
+                iterated in increasing order and has a length.
+        """
+        row = self._overrides.get(i)
+        if row is not None:
+            return row
+        row = self._bitmap_rows.get(i)
+        if row is not None:
+            return row
+        if i + 1 < len(self._offsets):
+            return self._targets[self._offsets[i]:self._offsets[i + 1]]
+        return _uint32_array()
+
+    def degree(self, i):
+        """
+        Get the number of IDs on the other side associated with ID i.
+        """
+        row = self._overrides.get(i)
+        if row is None:
+            row = self._bitmap_rows.get(i)
+        if row is not None:
+            return len(row)
+        if i + 1 < len(self._offsets):
+            return self._offsets[i + 1] - self._offsets[i]
+        return 0
+
+    def bitmap(self, i):
+        """
+        Get the row for ID i if it is stored as a bitmap.
+
+        Returns:
+            Bitmap: The bitmap, or None if the row is stored as an array.
+        """
+        row = self.row(i)
+        if isinstance(row, bitmaps.Bitmap):
+            return row
+        return None
+
+    def contains(self, i, j):
+        """
+        Check if ID j is in the row for ID i.
+
+        Rows stored as bitmaps are checked in constant time. Shorter rows
+        are binary searched, which is bounded by the bitmap threshold.
+        """
+        row = self.row(i)
+        if isinstance(row, bitmaps.Bitmap):
+            return j in row
+
+        k = bisect.bisect_left(row, j)
+        return k < len(row) and row[k] == j
+
+    def page(self, start, limit):
+        """
+        Get a page of present IDs, in ID order.
+
+        Args:
+            start (int): The lowest ID the page may start with.
+            limit (int): The maximum number of IDs on the page.
+
+        Returns:
+            tuple: The list of IDs on the page, and the ID the next page
+                starts with, or None if this is the last page.
+        """
+        ids = []
+        i = start
+        while i < len(self._names):
+            if self.degree(i):
+                if len(ids) == limit:
+                    return ids, i
+                ids.append(i)
+            i += 1
+        return ids, None
+
+    def row_page(self, i, start, limit):
+        """
+        Get a page of the row for ID i.
+
+        Args:
+            i (int): The ID of the row.
+            start (int): The lowest ID on the other side the page may start
+                with.
+            limit (int): The maximum number of IDs on the page.
+
+        Returns:
+            tuple: The IDs on the page, and the ID the next page starts
+                with, or None if this is the last page.
+        """
+        row = self.row(i)
+        if isinstance(row, bitmaps.Bitmap):
+            ids = list(itertools.islice(row.iter_from(start), limit + 1))
+            if len(ids) > limit:
+                return ids[:limit], ids[limit]
+            return ids, None
+
+        k = bisect.bisect_left(row, start)
+        if k + limit < len(row):
+            return row[k:k + limit], row[k + limit]
+        return row[k:], None
+
+    def order(self):
+        """
+        Get the IDs of every interned name, sorted by name.
+        """
+        order = self._order
+        if order is None:
+            names = self._names
+            order = self._order = _uint32_array(
+                sorted(range(len(names)), key=names.__getitem__)
+            )
+        return order
+
+    def ngrams(self):
+        """
+        Get the n-gram index of the interned names.
+
+        Returns:
+            dict: The sorted positions in order() of the names containing
+                each n-gram, keyed by n-gram.
+        """
+        index = self._ngrams
+        if index is None:
+            names = self._names
+            index = {}
+            for k, i in enumerate(self.order()):
+                name = names[i]
+                for gram in set(_grams(name)):
+                    index.setdefault(gram, []).append(k)
+            index = dict((g, _uint32_array(p)) for g, p in index.items())
+            self._ngrams = index
+        return index
+
+    def search(self, prefix=None, contains=None, limit=None):
+        """
+        Find present names by prefix, by substring, or by both.
+
+        Args:
+            prefix (string): The prefix names must start with. Optional,
+                defaults to None.
+            contains (string): The substring names must contain. Optional,
+                defaults to None.
+            limit (int): The maximum number of IDs to return. Optional,
+                defaults to None, returning every match.
+
+        Returns:
+            list: The IDs of the matching names, sorted by name.
+        """
+        names = self._names
+        order = self.order()
+
+        if prefix is not None:
+            # Binary search for the first name not sorting before the prefix;
+            # every match follows it.
+            low, high = 0, len(order)
+            while low < high:
+                middle = (low + high) // 2
+                if names[order[middle]] < prefix:
+                    low = middle + 1
+                else:
+                    high = middle
+            positions = self._prefix_positions(prefix, low)
+        elif contains is not None and len(contains) >= _NGRAM:
+            positions = self._ngram_positions(contains)
+        else:
+            positions = range(len(order))
+
+        ids = []
+        for k in positions:
+            if limit is not None and len(ids) >= limit:
+                break
+            i = order[k]
+            if contains is not None and contains not in names[i]:
+                continue
+            if self.degree(i):
+                ids.append(i)
+        return ids
+
+    def _prefix_positions(self, prefix, start):
+        names = self._names
+        order = self.order()
+        for k in range(start, len(order)):
+            if not names[order[k]].startswith(prefix):
+                return
+            yield k
+
+    def _ngram_positions(self, substring):
+        index = self.ngrams()
+        postings = []
+        for gram in set(_grams(substring)):
+            posting = index.get(gram)
+            if posting is None:
+                return
+            postings.append(posting)
+
+        # Walk the shortest posting list and binary search the others.
+        postings.sort(key=len)
+        for k in postings[0]:
+            for posting in postings[1:]:
+                j = bisect.bisect_left(posting, k)
+                if j == len(posting) or posting[j] != k:
+                    break
+            else:
+                yield k
+
+    def intern(self, names):
+        """
+        Get the name table and ID mapping extended with any new names.
+
+        The current name table and ID mapping are shared, not copied, when
+        every name is already interned.
+
+        Args:
+            names (iterable): The names that must have IDs.
+
+        Returns:
+            tuple: The name list and the name-to-ID dictionary.
+        """
+        new = [name for name in set(names) if name not in self._ids]
+        if not new:
+            return self._names, self._ids
+
+        names = list(self._names)
+        ids = dict(self._ids)
+        for name in sorted(new):
+            ids[name] = len(names)
+            names.append(name)
+        return names, ids
+
+    def update(self, names, ids, changes, universe=None):
+        """
+        Build a new adjacency with some rows replaced.
+
+        Args:
+            names (list): The name table for the new adjacency, as returned
+                by intern().
+            ids (dict): The ID mapping for the new adjacency, as returned by
+                intern().
+            changes (dict): The new rows, as sets of IDs, keyed by ID.
+            universe (int): The number of IDs on the other side, used to
+                pick a new bitmap threshold if the update compacts the
+                adjacency. Optional, defaults to None, keeping the current
+                threshold.
+
+        Returns:
+            Adjacency: The new adjacency. This adjacency is left unchanged.
+        """
+        overrides = dict(self._overrides)
+        count = self._count
+        for i, row in changes.items():
+            count += (1 if row else 0) - (1 if self.degree(i) else 0)
+            overrides[i] = _layout(sorted(row), self._threshold)
+
+        same = names is self._names
+        adjacency = Adjacency(
+            names,
+            self._offsets,
+            self._targets,
+            ids=ids,
+            overrides=overrides,
+            count=count,
+            bitmap_rows=self._bitmap_rows,
+            order=self._order if same else None,
+            ngrams=self._ngrams if same else None,
+            threshold=self._threshold
+        )
+        if len(overrides) > max(_COMPACTION_THRESHOLD, len(names) // 8):
+            adjacency = adjacency.compact(universe)
+        return adjacency
+
+    def compact(self, universe=None):
+        """
+        Fold every overridden row back into new CSR arrays and bitmaps.
+
+        IDs are left unchanged, so absent and appended names keep their IDs.
+
+        Args:
+            universe (int): The number of IDs on the other side, used to
+                pick the bitmap threshold of the compacted adjacency.
+                Optional, defaults to None, keeping the current threshold.
+
+        Returns:
+            Adjacency: The compacted adjacency.
+        """
+        threshold = self._threshold
+        if universe is not None:
+            threshold = _bitmap_threshold(universe)
+
+        offsets = _uint32_array([0])
+        targets = _uint32_array()
+        bitmap_rows = {}
+        for i in range(len(self._names)):
+            row = self.row(i)
+            if len(row) > threshold:
+                if not isinstance(row, bitmaps.Bitmap):
+                    row = bitmaps.Bitmap(row)
+                bitmap_rows[i] = row
+            else:
+                targets.extend(row)
+            offsets.append(len(targets))
+        return Adjacency(
+            self._names,
+            offsets,
+            targets,
+            ids=self._ids,
+            count=self._count,
+            bitmap_rows=bitmap_rows,
+            order=self._order,
+            ngrams=self._ngrams,
+            threshold=threshold
+        )
+
+    def csr(self):
+        """
+        Get every row in CSR form, including the rows stored as bitmaps.
+
+        Returns:
+            tuple: The offsets and targets arrays.
+        """
+        if not self._overrides and not self._bitmap_rows:
+            return self._offsets, self._targets
+
+        offsets = _uint32_array([0])
+        targets = _uint32_array()
+        for i in range(len(self._names)):
+            targets.extend(self.row(i))
+            offsets.append(len(targets))
+        return offsets, targets
+
+
+class MembershipView(Mapping):
+    """
+    A read-only mapping from names on one side to lists of names on the
+    other side, computed on access from an Adjacency.
+    """
+
+    def __init__(self, source, target):
+        self._source = source
+        self._target = target
+
+    def __getitem__(self, name):
+        i = self._source.lookup(name)
+        if i is None:
+            raise KeyError(name)
+        names = self._target.names
+        return [names[t] for t in self._source.row(i)]
+
+    def __contains__(self, name):
+        return self._source.lookup(name) is not None
+
+    def __iter__(self):
+        names = self._source.names
+        for i in self._source:
+            yield names[i]
+
+    def __len__(self):
+        return len(self._source)
+
+
+class Snapshot(object):
+    """
+    An immutable view of the user/group membership data.
+
+    A snapshot is built once, off to the side, and then published by
+    swapping a single reference. Request handlers grab the current snapshot
+    and read from it without taking any locks. Nothing may mutate a
+    snapshot after it has been built.
+
+    Both directions are served from one interned, array-backed store: see
+    Adjacency.
+    """
+
+    def __init__(self, user_group_mapping=None, modified=None):
+        users, groups = _build(user_group_mapping)
+        self._set_adjacency(users, groups, modified)
+
+    @classmethod
+    def _from_adjacency(cls, users, groups, modified=None, epoch=None):
+        snapshot = cls.__new__(cls)
+        snapshot._set_adjacency(users, groups, modified, epoch)
+        return snapshot
+
+    def _set_adjacency(self, users, groups, modified, epoch=None):
+        self._generation = next(_generations)
+        self._epoch = epoch if epoch is not None else self._generation
+        self._modified = modified
+        self._user_adjacency = users
+        self._group_adjacency = groups
+        self._users = MembershipView(users, groups)
+        self._groups = MembershipView(groups, users)
+
+    def apply(self, added=None, removed=None, modified=None):
+        """
+        Build a new snapshot by applying a membership delta to this one.
+
+        Args:
+            added: An iterable of (user, group) pairs to add. Optional,
+                defaults to None.
+            removed: An iterable of (user, group) pairs to remove. Optional,
+                defaults to None.
+            modified (float): The modification time of the new data, in
+                seconds since the epoch. Optional, defaults to None.
+
+        Returns:
+            Snapshot: A new snapshot sharing every untouched row with this
+                one. This snapshot is left unchanged.
+        """
+        added = list(added or [])
+        removed = list(removed or [])
+
+        users = self._user_adjacency
+        groups = self._group_adjacency
+        user_names, user_ids = users.intern([user for user, _ in added])
+        group_names, group_ids = groups.intern([group for _, group in added])
+
+        user_changes = {}
+        group_changes = {}
+        for pairs, add in ((removed, False), (added, True)):
+            for user, group in pairs:
+                user_id = user_ids.get(user)
+                group_id = group_ids.get(group)
+                if user_id is None or group_id is None:
+                    continue
+                _change(user_changes, users, user_id, group_id, add)
+                _change(group_changes, groups, group_id, user_id, add)
+
+        return Snapshot._from_adjacency(
+            users.update(
+                user_names,
+                user_ids,
+                user_changes,
+                universe=len(group_names)
+            ),
+            groups.update(
+                group_names,
+                group_ids,
+                group_changes,
+                universe=len(user_names)
+            ),
+            modified,
+            self._epoch
+        )
+
+    def is_member(self, user, group):
+        """
+        Check if a user belongs to a group, in constant time.
+
+        Args:
+            user (string): The user name.
+            group (string): The group name.
+
+        Returns:
+            bool: True if the user belongs to the group, False otherwise.
+        """
+        users = self._user_adjacency
+        groups = self._group_adjacency
+        user_id = users.lookup(user)
+        if user_id is None:
+            return False
+        group_id = groups.lookup(group)
+        if group_id is None:
+            return False
+
+        # Check against the shorter of the two rows, so that a row stored as
+        # an array is only binary searched when the other row is longer.
+        if users.degree(user_id) <= groups.degree(group_id):
+            return users.contains(user_id, group_id)
+        return groups.contains(group_id, user_id)
+
+    def select_users(self, all_of=(), any_of=(), none_of=(), start=0):
+        """
+        Iterate over the IDs of the users matching a group set expression.
+
+        Args:
+            all_of (iterable): Groups every user must belong to. Optional,
+                defaults to no groups.
+            any_of (iterable): Groups of which every user must belong to at
+                least one. Optional, defaults to no groups.
+            none_of (iterable): Groups no user may belong to. Optional,
+                defaults to no groups.
+            start (int): The lowest user ID to yield. Optional, defaults to
+                0.
+
+        Returns:
+            iterator: The matching user IDs, in increasing order.
+        """
+        return _select(
+            self._group_adjacency,
+            self._user_adjacency,
+            all_of,
+            any_of,
+            none_of,
+            start
+        )
+
+    def select_groups(self, all_of=(), any_of=(), none_of=(), start=0):
+        """
+        Iterate over the IDs of the groups matching a user set expression.
+
+        Args:
+            all_of (iterable): Users every group must contain. Optional,
+                defaults to no users.
+            any_of (iterable): Users of which every group must contain at
+                least one. Optional, defaults to no users.
+            none_of (iterable): Users no group may contain. Optional,
+                defaults to no users.
+            start (int): The lowest group ID to yield. Optional, defaults to
+                0.
+
+        Returns:
+            iterator: The matching group IDs, in increasing order.
+        """
+        return _select(
+            self._user_adjacency,
+            self._group_adjacency,
+            all_of,
+            any_of,
+            none_of,
+            start
+        )
+
+    def pairs(self):
+        """
+        Iterate over every (user, group) membership in the snapshot.
+        """
+        user_names = self._user_adjacency.names
+        group_names = self._group_adjacency.names
+        for user_id in self._user_adjacency:
+            user = user_names[user_id]
+            for group_id in self._user_adjacency.row(user_id):
+                yield user, group_names[group_id]
+
+    @property
+    def generation(self):
+        """
+        The generation number of the snapshot. Snapshots built later always
+        have higher generation numbers.
+        """
+        return self._generation
+
+    @property
+    def epoch(self):
+        """
+        The generation number of the snapshot that assigned the IDs used by
+        this snapshot. Snapshots built by applying deltas keep every ID, and
+        so keep the epoch of the snapshot they were built from.
+        """
+        return self._epoch
+
+    @property
+    def modified(self):
+        """
+        The modification time of the data the snapshot was built from, in
+        seconds since the epoch, or None if it is not known.
+        """
+        return self._modified
+
+    @property
+    def user_adjacency(self):
+        """
+        The user-to-groups Adjacency.
+        """
+        return self._user_adjacency
+
+    @property
+    def group_adjacency(self):
+        """
+        The group-to-users Adjacency.
+        """
+        return self._group_adjacency
+
+    @property
+    def users(self):
+        """
+        The user-to-groups mapping, as a read-only mapping of lists.
+        """
+        return self._users
+
+    @property
+    def groups(self):
+        """
+        The group-to-users mapping, as a read-only mapping of lists.
+        """
+        return self._groups
+
+
+def is_snapshot_file(path):
+    """
+    Check if a file is a compiled snapshot file.
+
+    Args:
+        path (string): The path to the file to check.
+
+    Returns:
+        bool: True if the file starts with the snapshot magic bytes.
+    """
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def dump(snapshot, f):
+    """
+    Write a snapshot to a file in the compiled snapshot format.
+
+    Args:
+        snapshot (Snapshot): The snapshot to write.
+        f (file): A file object opened for binary writing.
+    """
+    users = snapshot.user_adjacency
+    groups = snapshot.group_adjacency
+    if not (users.packed and groups.packed):
+        snapshot = Snapshot(snapshot.pairs())
+        users = snapshot.user_adjacency
+        groups = snapshot.group_adjacency
+
+    user_table = _encode_names(users.names)
+    group_table = _encode_names(groups.names)
+    user_offsets, user_targets = users.csr()
+    group_offsets, group_targets = groups.csr()
+
+    sections = [
+        _HEADER.pack(
+            MAGIC,
+            VERSION,
+            len(users.names),
+            len(groups.names),
+            len(user_targets),
+            len(user_table),
+            len(group_table)
+        ),
+        user_table,
+        group_table,
+        _to_bytes(user_offsets),
+        _to_bytes(user_targets),
+        _to_bytes(group_offsets),
+        _to_bytes(group_targets)
+    ]
+
+    position = 0
+    for section in sections:
+        padding = _align(position) - position
+        f.write(b'\0' * padding)
+        f.write(section)
+        position += padding + len(section)
+
+
+def load(path):
+    """
+    Load a snapshot from a compiled snapshot file.
+
+    Args:
+        path (string): The path to the compiled snapshot file.
+
+    Returns:
+        Snapshot: The snapshot stored in the file.
+
+    Raises:
+        ValueError: if the file is not a valid compiled snapshot file.
+    """
+    with open(path, 'rb') as f:
+        modified = os.fstat(f.fileno()).st_mtime
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError("Snapshot file is empty.")
+
+    # NOTE: The buffer is never closed explicitly. The arrays served from it
+    # keep it mapped for as long as the snapshot is in use.
+    if len(buffer) < _HEADER.size:
+        raise ValueError("Snapshot file is truncated.")
+    magic, version, n_users, n_groups, n_pairs, user_size, group_size = (
+        _HEADER.unpack_from(buffer, 0)
+    )
+    if magic != MAGIC:
+        raise ValueError("Snapshot file has an invalid header.")
+    if version != VERSION:
+        raise ValueError(
+            "Snapshot file version {} is not supported.".format(version)
+        )
+
+    position = _align(_HEADER.size)
+    user_table = position
+    position = _align(position + user_size)
+    group_table = position
+    position = _align(position + group_size)
+    user_offsets = position
+    position = _align(position + (n_users + 1) * 4)
+    user_targets = position
+    position = _align(position + n_pairs * 4)
+    group_offsets = position
+    position = _align(position + (n_groups + 1) * 4)
+    group_targets = position
+    if group_targets + n_pairs * 4 > len(buffer):
+        raise ValueError("Snapshot file is truncated.")
+
+    # The file always holds every row in CSR form. The long rows are read
+    # into bitmaps once; the mapped arrays are left as they are.
+    threshold = _bitmap_threshold(n_groups)
+    offsets, targets, bitmap_rows = _split(
+        _from_bytes(buffer, user_offsets, n_users + 1),
+        _from_bytes(buffer, user_targets, n_pairs),
+        threshold,
+        copy=False
+    )
+    users = Adjacency(
+        _decode_names(buffer, user_table, user_size, n_users),
+        offsets,
+        targets,
+        packed=True,
+        bitmap_rows=bitmap_rows,
+        threshold=threshold
+    )
+    threshold = _bitmap_threshold(n_users)
+    offsets, targets, bitmap_rows = _split(
+        _from_bytes(buffer, group_offsets, n_groups + 1),
+        _from_bytes(buffer, group_targets, n_pairs),
+        threshold,
+        copy=False
+    )
+    groups = Adjacency(
+        _decode_names(buffer, group_table, group_size, n_groups),
+        offsets,
+        targets,
+        packed=True,
+        bitmap_rows=bitmap_rows,
+        threshold=threshold
+    )
+    return Snapshot._from_adjacency(users, groups, modified)
@@ -0,0 +1,104 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import testtools
+
+from slugs import bitmaps
+
+
+class TestBitmap(testtools.TestCase):
+
+    def setUp(self):
+        super(TestBitmap, self).setUp()
+
+        # A sparse chunk, a dense chunk, and a chunk with a single ID.
+        self.sparse = [3, 7, 65535]
+        self.dense = list(range(65536, 65536 + 3 * 5000, 3))
+        self.single = [5 << 16]
+
+    def test_init(self):
+        """
+        Test that a Bitmap can be built without error.
+        """
+        bitmap = bitmaps.Bitmap()
+
+        self.assertEqual(0, len(bitmap))
+        self.assertEqual([], list(bitmap))
+        self.assertNotIn(0, bitmap)
+
+    def test_containers(self):
+        """
+        Test that each chunk of a Bitmap picks its layout by how many
+        members it has.
+        """
+        bitmap = bitmaps.Bitmap(self.sparse + self.dense + self.single)
+
+        self.assertEqual([0, 1, 5], bitmap._keys)
+        self.assertNotIsInstance(bitmap._containers[0], bytearray)
+        self.assertIsInstance(bitmap._containers[1], bytearray)
+        self.assertNotIsInstance(bitmap._containers[5], bytearray)
+        self.assertEqual(3 * 2 + 8192 + 2, bitmap.size())
+
+    def test_membership(self):
+        """
+        Test that a Bitmap reports its members correctly.
+        """
+        ids = self.sparse + self.dense + self.single
+        bitmap = bitmaps.Bitmap(ids)
+
+        self.assertEqual(len(ids), len(bitmap))
+        self.assertEqual(ids, list(bitmap))
+        for i in ids:
+            self.assertIn(i, bitmap)
+        for i in (0, 8, 65537, 2 << 16, (5 << 16) + 1):
+            self.assertNotIn(i, bitmap)
+
+    def test_iter_from(self):
+        """
+        Test that a Bitmap can be iterated from a starting ID.
+        """
+        bitmap = bitmaps.Bitmap(self.sparse + self.dense + self.single)
+
+        self.assertEqual(
+            [7, 65535, 65536],
+            list(bitmap.iter_from(4))[:3]
+        )
+        self.assertEqual(
+            [65536 + 3 * 3334, 65536 + 3 * 3335],
+            list(bitmap.iter_from(65536 + 10000))[:2]
+        )
+        self.assertEqual(self.single, list(bitmap.iter_from(65536 * 2)))
+        self.assertEqual([], list(bitmap.iter_from((5 << 16) + 1)))
+
+    def test_and(self):
+        """
+        Test that the intersection of two Bitmaps is computed for every
+        combination of chunk layouts.
+        """
+        dense = list(range(65536, 65536 + 2 * 8192, 2))
+        left = bitmaps.Bitmap(self.sparse + self.dense + self.single)
+        right = bitmaps.Bitmap([3, 65535] + dense)
+
+        result = left & right
+
+        expected = [3, 65535] + sorted(set(self.dense) & set(dense))
+        self.assertEqual(expected, list(result))
+        self.assertEqual(expected, list(right & left))
+        self.assertEqual(len(expected), len(result))
+        self.assertNotIsInstance(result._containers[1], bytearray)
+
+        result = bitmaps.Bitmap(self.dense) & bitmaps.Bitmap(self.dense)
+        self.assertEqual(self.dense, list(result))
+        self.assertIsInstance(result._containers[1], bytearray)
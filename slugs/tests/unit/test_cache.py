@@ -0,0 +1,106 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import testtools
+
+from slugs import cache
+
+
+class TestResponseCache(testtools.TestCase):
+
+    def setUp(self):
+        super(TestResponseCache, self).setUp()
+
+    def test_init(self):
+        """
+        Test that a ResponseCache can be built without error.
+        """
+        response_cache = cache.ResponseCache()
+
+        self.assertEqual(cache.DEFAULT_MAX_SIZE, response_cache.max_size)
+        self.assertEqual(0, response_cache.size)
+        self.assertEqual(0, len(response_cache))
+
+    def test_invalid_max_size(self):
+        """
+        Test that the right error is raised when setting an invalid maximum
+        size on a ResponseCache.
+        """
+        response_cache = cache.ResponseCache()
+
+        for value in (-1, 'invalid', True):
+            args = [response_cache, 'max_size', value]
+            self.assertRaisesRegex(
+                ValueError,
+                "Cache size '{}' must be a non-negative integer.".format(
+                    value
+                ),
+                setattr,
+                *args
+            )
+
+    def test_get_and_put(self):
+        """
+        Test that a ResponseCache stores and returns bodies correctly.
+        """
+        response_cache = cache.ResponseCache()
+
+        self.assertIsNone(response_cache.get((1, 'users')))
+
+        response_cache.put((1, 'users'), b'{"users": []}')
+        self.assertEqual(b'{"users": []}', response_cache.get((1, 'users')))
+        self.assertEqual(13, response_cache.size)
+
+        response_cache.put((1, 'users'), b'{}')
+        self.assertEqual(b'{}', response_cache.get((1, 'users')))
+        self.assertEqual(2, response_cache.size)
+        self.assertEqual(1, len(response_cache))
+
+    def test_eviction(self):
+        """
+        Test that a ResponseCache evicts the least recently used bodies to
+        stay within its size budget.
+        """
+        response_cache = cache.ResponseCache(max_size=10)
+
+        response_cache.put('a', b'1234')
+        response_cache.put('b', b'1234')
+        response_cache.get('a')
+        response_cache.put('c', b'1234')
+
+        self.assertEqual(b'1234', response_cache.get('a'))
+        self.assertIsNone(response_cache.get('b'))
+        self.assertEqual(b'1234', response_cache.get('c'))
+        self.assertEqual(8, response_cache.size)
+
+        response_cache.put('d', b'12345678901')
+        self.assertIsNone(response_cache.get('d'))
+        self.assertEqual(8, response_cache.size)
+
+        response_cache.max_size = 4
+        self.assertEqual(1, len(response_cache))
+        self.assertEqual(b'1234', response_cache.get('c'))
+
+    def test_clear(self):
+        """
+        Test that a ResponseCache can be cleared.
+        """
+        response_cache = cache.ResponseCache()
+        response_cache.put('a', b'1234')
+
+        response_cache.clear()
+
+        self.assertIsNone(response_cache.get('a'))
+        self.assertEqual(0, response_cache.size)
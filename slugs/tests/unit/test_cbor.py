@@ -0,0 +1,151 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import testtools
+
+from slugs import cbor
+
+
+class TestCBOR(testtools.TestCase):
+
+    def setUp(self):
+        super(TestCBOR, self).setUp()
+
+    def test_dumps(self):
+        """
+        Test that values are encoded as specified by RFC 7049.
+        """
+        cases = [
+            (0, b'\x00'),
+            (23, b'\x17'),
+            (24, b'\x18\x18'),
+            (1000, b'\x19\x03\xe8'),
+            (1000000, b'\x1a\x00\x0f\x42\x40'),
+            (1000000000000, b'\x1b\x00\x00\x00\xe8\xd4\xa5\x10\x00'),
+            (-1, b'\x20'),
+            (-1000, b'\x39\x03\xe7'),
+            (1.1, b'\xfb\x3f\xf1\x99\x99\x99\x99\x99\x9a'),
+            (False, b'\xf4'),
+            (True, b'\xf5'),
+            (None, b'\xf6'),
+            (u'', b'\x60'),
+            (u'IETF', b'\x64IETF'),
+            (u'\xfc', b'\x62\xc3\xbc'),
+            (bytearray(b'\x01\x02'), b'\x42\x01\x02'),
+            ([], b'\x80'),
+            ([1, [2, 3]], b'\x82\x01\x82\x02\x03'),
+            ({u'a': 1}, b'\xa1\x61a\x01')
+        ]
+        for value, expected in cases:
+            self.assertEqual(expected, cbor.dumps(value), repr(value))
+
+    def test_dumps_native_strings(self):
+        """
+        Test that native strings are encoded as text, including the UTF-8
+        encoded str names of Python 2.
+        """
+        name = u'Jos\xe9'
+        if bytes is str:
+            name = name.encode('utf-8')
+
+        self.assertEqual(b'\x65Jos\xc3\xa9', cbor.encode_text(name))
+        self.assertEqual(b'\x65Jos\xc3\xa9', cbor.dumps(name))
+        self.assertEqual(
+            {u'users': [u'Jos\xe9', u'alice']},
+            cbor.loads(cbor.dumps({'users': [name, 'alice']}))
+        )
+
+    def test_round_trip(self):
+        """
+        Test that decoding an encoded value gives the value back.
+        """
+        names = [u'User{}'.format(i) for i in range(300)] + [u'x' * 300]
+        value = {
+            u'users': names,
+            u'groups': [],
+            u'generation': 2 ** 40,
+            u'resync': False,
+            u'added': [[u'Adam', u'M\xe4le']],
+            u'limit': None
+        }
+
+        self.assertEqual(value, cbor.loads(cbor.dumps(value)))
+
+    def test_loads_indefinite_length(self):
+        """
+        Test that indefinite length arrays and maps are decoded.
+        """
+        data = (
+            cbor.MAP_START +
+            cbor.encode_text(u'users') + cbor.ARRAY_START +
+            cbor.encode_text(u'Adam') + cbor.encode_text(u'Eve') +
+            cbor.BREAK +
+            cbor.encode_text(u'groups') + cbor.ARRAY_START + cbor.BREAK +
+            cbor.BREAK
+        )
+
+        self.assertEqual(
+            {u'users': [u'Adam', u'Eve'], u'groups': []},
+            cbor.loads(data)
+        )
+
+    def test_dumps_invalid(self):
+        """
+        Test that the right error is raised when encoding an unsupported
+        value.
+        """
+        self.assertRaisesRegex(
+            cbor.CBORError,
+            "Type 'set' cannot be encoded.",
+            cbor.dumps,
+            [set()]
+        )
+        self.assertRaisesRegex(
+            cbor.CBORError,
+            "Integer {} is too large to encode.".format(2 ** 64),
+            cbor.dumps,
+            2 ** 64
+        )
+
+    def test_loads_invalid(self):
+        """
+        Test that the right error is raised when decoding malformed data.
+        """
+        cases = [
+            (b'', "Data is truncated."),
+            (b'\x64IE', "Data is truncated."),
+            (b'\x82\x01', "Data is truncated."),
+            (b'\x19\x03', "Data is truncated."),
+            (b'\x9f\x01', "Data is truncated."),
+            (b'\x01\x02', "Data has trailing bytes."),
+            (b'\xff', "Unexpected break."),
+            (b'\x82\x01\xff', "Unexpected break."),
+            (b'\xbf\x61a\xff', "Unexpected break."),
+            (b'\x62\xc3\x28', "Text string is not valid UTF-8."),
+            (b'\xf9\x00\x00', "Simple value 25 is not supported."),
+            (b'\xc0\x00', "Major type 6 is not supported."),
+            (b'\x1c', "Additional information 28 is invalid."),
+            (
+                b'\x7f\xff',
+                "Indefinite length major type 3 is not supported."
+            )
+        ]
+        for data, message in cases:
+            self.assertRaisesRegex(
+                cbor.CBORError,
+                message,
+                cbor.loads,
+                data
+            )
@@ -0,0 +1,124 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import testtools
+
+from slugs import changes
+
+
+class TestChangeFeed(testtools.TestCase):
+
+    def setUp(self):
+        super(TestChangeFeed, self).setUp()
+
+    def test_init(self):
+        """
+        Test that a ChangeFeed can be built without error.
+        """
+        feed = changes.ChangeFeed(generation=5)
+
+        self.assertEqual(changes.DEFAULT_MAX_SIZE, feed.max_size)
+        self.assertEqual(5, feed.base)
+        self.assertEqual(5, feed.generation)
+        self.assertEqual(0, feed.size)
+        self.assertEqual(0, len(feed))
+        self.assertEqual(([], []), feed.since(5))
+        self.assertIsNone(feed.since(4))
+
+    def test_invalid_max_size(self):
+        """
+        Test that the right error is raised when setting an invalid maximum
+        size on a ChangeFeed.
+        """
+        feed = changes.ChangeFeed()
+
+        for value in (-1, 'invalid', True):
+            args = [feed, 'max_size', value]
+            self.assertRaisesRegex(
+                ValueError,
+                "Change feed size '{}' must be a non-negative "
+                "integer.".format(value),
+                setattr,
+                *args
+            )
+
+    def test_since(self):
+        """
+        Test that a ChangeFeed lists the net changes after any recorded
+        generation.
+        """
+        feed = changes.ChangeFeed(generation=1)
+        feed.record(2, [('Adam', 'Male'), ('Eve', 'Human')], [])
+        feed.record(4, [('Eve', 'Female')], [('Adam', 'Male')])
+        feed.record(7, [], [('Eve', 'Human'), ('Cain', 'Farmer')])
+
+        self.assertEqual(7, feed.generation)
+        self.assertEqual(3, len(feed))
+        self.assertEqual(6, feed.size)
+        self.assertEqual(
+            (
+                [('Eve', 'Female')],
+                [('Cain', 'Farmer')]
+            ),
+            feed.since(1)
+        )
+        self.assertEqual(
+            (
+                [('Eve', 'Female')],
+                [('Adam', 'Male'), ('Cain', 'Farmer'), ('Eve', 'Human')]
+            ),
+            feed.since(2)
+        )
+        self.assertEqual(([], []), feed.since(7))
+        for generation in (0, 3, 8):
+            self.assertIsNone(feed.since(generation))
+
+    def test_record_evicts_oldest(self):
+        """
+        Test that a ChangeFeed drops its oldest entries to stay within its
+        maximum size.
+        """
+        feed = changes.ChangeFeed(max_size=3, generation=1)
+        feed.record(2, [('Adam', 'Male'), ('Eve', 'Female')], [])
+        feed.record(3, [('Cain', 'Male')], [])
+        self.assertEqual(1, feed.base)
+        self.assertEqual(3, feed.size)
+
+        feed.record(4, [], [('Cain', 'Male')])
+        self.assertEqual(2, feed.base)
+        self.assertEqual(2, len(feed))
+        self.assertEqual(2, feed.size)
+        self.assertIsNone(feed.since(1))
+        self.assertEqual(([], []), feed.since(2))
+
+        feed.record(5, [('Abel', 'Male')] * 4, [])
+        self.assertEqual(5, feed.base)
+        self.assertEqual(0, len(feed))
+        self.assertIsNone(feed.since(4))
+
+    def test_reset(self):
+        """
+        Test that resetting a ChangeFeed drops every recorded change.
+        """
+        feed = changes.ChangeFeed(generation=1)
+        feed.record(2, [('Adam', 'Male')], [])
+
+        feed.reset(3)
+
+        self.assertEqual(3, feed.base)
+        self.assertEqual(3, feed.generation)
+        self.assertEqual(0, feed.size)
+        self.assertIsNone(feed.since(1))
+        self.assertIsNone(feed.since(2))
@@ -0,0 +1,389 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import fractions
+import mock
+import socket
+import testtools
+
+from slugs import cbor
+from slugs import client
+
+
+def build_response(status, body=b'', etag=None, connection=None):
+    headers = {'ETag': etag, 'Connection': connection}
+    response = mock.MagicMock()
+    response.status = status
+    response.read.return_value = body
+    response.getheader.side_effect = lambda name, default=None: (
+        headers.get(name) or default
+    )
+    return response
+
+
+class TestSLUGSClient(testtools.TestCase):
+
+    def setUp(self):
+        super(TestSLUGSClient, self).setUp()
+
+        self.responses = []
+        self.connections = []
+
+        def connect(*args, **kwargs):
+            connection = mock.MagicMock()
+            connection.getresponse.side_effect = lambda: self.responses.pop(0)
+            self.connections.append(connection)
+            return connection
+
+        patch = mock.patch(
+            'slugs.client.httplib.HTTPConnection',
+            side_effect=connect
+        )
+        self.connect = patch.start()
+        self.addCleanup(patch.stop)
+
+        self.time = mock.patch('slugs.client.time.time', return_value=100.0)
+        self.now = self.time.start()
+        self.addCleanup(self.time.stop)
+
+        self.client = client.SLUGSClient(
+            'http://127.0.0.1:8080/slugs/',
+            ttl=60,
+            negative_ttl=10
+        )
+
+    def requests(self):
+        return [
+            call[0] for connection in self.connections
+            for call in connection.request.call_args_list
+        ]
+
+    def test_init(self):
+        """
+        Test that a SLUGSClient can be built without error.
+        """
+        slugs_client = client.SLUGSClient('https://example.com/slugs')
+
+        self.assertEqual(0, len(slugs_client))
+        self.assertEqual('/slugs', slugs_client._prefix)
+
+        # Any real number will do for the TTLs.
+        slugs_client = client.SLUGSClient(
+            'https://example.com/slugs',
+            ttl=fractions.Fraction(1, 2)
+        )
+        self.assertEqual(0.5, slugs_client._ttl)
+
+    def test_init_invalid(self):
+        """
+        Test that the right error is raised when building a SLUGSClient with
+        invalid settings.
+        """
+        self.assertRaisesRegex(
+            ValueError,
+            "Service URL 'ftp://example.com' must be an http or https URL.",
+            client.SLUGSClient,
+            'ftp://example.com'
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            "Client negative_ttl '-1' must be a non-negative number.",
+            client.SLUGSClient,
+            'http://example.com',
+            negative_ttl=-1
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            "Client max_size 'invalid' must be a non-negative integer.",
+            client.SLUGSClient,
+            'http://example.com',
+            max_size='invalid'
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            "Client pool_size '1.5' must be a non-negative integer.",
+            client.SLUGSClient,
+            'http://example.com',
+            pool_size=1.5
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            "Client encoding 'xml' must be one of: cbor, json.",
+            client.SLUGSClient,
+            'http://example.com',
+            encoding='xml'
+        )
+
+    def test_is_member(self):
+        """
+        Test that membership checks are answered and cached.
+        """
+        self.responses = [
+            build_response(200, b'null', '"a-1"'),
+            build_response(404)
+        ]
+
+        self.assertTrue(self.client.is_member('Adam', 'Male'))
+        self.assertFalse(self.client.is_member('Adam', 'Female'))
+        self.assertTrue(self.client.is_member('Adam', 'Male'))
+        self.assertFalse(self.client.is_member('Adam', 'Female'))
+
+        self.assertEqual(
+            [
+                ('GET', '/slugs/users/Adam/groups/Male/'),
+                ('GET', '/slugs/users/Adam/groups/Female/')
+            ],
+            self.requests()
+        )
+        self.assertEqual(2, len(self.client))
+
+    def test_queries(self):
+        """
+        Test that every query is sent to the right resource and decoded.
+        """
+        self.responses = [
+            build_response(200, b'null'),
+            build_response(404),
+            build_response(200, b'{"groups": ["Human", "Male"]}'),
+            build_response(200, b'{"users": ["Adam", "Eve"]}'),
+            build_response(404)
+        ]
+
+        self.assertTrue(self.client.is_user('Adam'))
+        self.assertFalse(self.client.is_group('Robot'))
+        self.assertEqual(['Human', 'Male'], self.client.get_groups('Adam'))
+        self.assertEqual(['Adam', 'Eve'], self.client.get_users('Human'))
+        self.assertIsNone(self.client.get_groups('Cain / Abel'))
+
+        self.assertEqual(
+            [
+                ('GET', '/slugs/users/Adam/'),
+                ('GET', '/slugs/groups/Robot/'),
+                ('GET', '/slugs/users/Adam/groups/'),
+                ('GET', '/slugs/groups/Human/users/'),
+                ('GET', '/slugs/users/Cain%20%2F%20Abel/groups/')
+            ],
+            self.requests()
+        )
+
+    def test_non_ascii_names(self):
+        """
+        Test that names are quoted as UTF-8, whether they are given as text
+        or as UTF-8 byte strings (Python 2 native strings).
+        """
+        self.responses = [build_response(200, b'null', '"a-1"')]
+
+        self.assertTrue(self.client.is_user(u'Zo\u00eb'))
+        self.assertTrue(self.client.is_user(u'Zo\u00eb'.encode('utf-8')))
+
+        self.assertEqual(
+            [('GET', '/slugs/users/Zo%C3%AB/')],
+            self.requests()
+        )
+
+    def test_cbor_encoding(self):
+        """
+        Test that a SLUGSClient can request and decode CBOR answers.
+        """
+        slugs_client = client.SLUGSClient(
+            'http://127.0.0.1:8080/slugs',
+            encoding='cbor'
+        )
+        self.responses = [
+            build_response(200, cbor.dumps(None)),
+            build_response(200, cbor.dumps({u'groups': [u'Human', u'Male']}))
+        ]
+
+        self.assertTrue(slugs_client.is_user('Adam'))
+        self.assertEqual(['Human', 'Male'], slugs_client.get_groups('Adam'))
+
+        for connection in self.connections:
+            for call in connection.request.call_args_list:
+                self.assertEqual(
+                    {'Accept': 'application/cbor'},
+                    call[1]['headers']
+                )
+
+    def test_revalidation(self):
+        """
+        Test that expired answers are revalidated with the entity tag of the
+        response they came from, and untagged negative answers are fetched
+        again in full.
+        """
+        self.responses = [
+            build_response(200, b'null', '"a-1"'),
+            build_response(404),
+            build_response(304, etag='"a-1"'),
+            build_response(404),
+            build_response(200, b'{"groups": ["Male"]}', '"a-2"'),
+            build_response(200, b'null', '"a-2"')
+        ]
+
+        self.assertTrue(self.client.is_member('Adam', 'Male'))
+        self.assertFalse(self.client.is_user('Eve'))
+
+        self.now.return_value = 170.0
+        self.assertTrue(self.client.is_member('Adam', 'Male'))
+        self.assertFalse(self.client.is_user('Eve'))
+        self.assertEqual(['Male'], self.client.get_groups('Adam'))
+
+        # Still fresh after the revalidation.
+        self.now.return_value = 175.0
+        self.assertTrue(self.client.is_member('Adam', 'Male'))
+        self.assertFalse(self.client.is_user('Eve'))
+
+        # Eve was added in the meantime. The newer tag seen on another
+        # response must not be used to keep the stale negative answer.
+        self.now.return_value = 300.0
+        self.assertTrue(self.client.is_user('Eve'))
+
+        calls = [
+            connection.request.call_args_list
+            for connection in self.connections
+        ]
+        headers = [c[1]['headers'] for group in calls for c in group]
+        accept = {'Accept': 'application/json'}
+        self.assertEqual(
+            [
+                accept,
+                accept,
+                dict(accept, **{'If-None-Match': '"a-1"'}),
+                accept,
+                accept,
+                accept
+            ],
+            headers
+        )
+
+    def test_revalidation_of_tagged_negative_answers(self):
+        """
+        Test that a negative answer carrying an entity tag is revalidated
+        with that tag only, so a 304 can never keep it past a change.
+        """
+        self.responses = [
+            build_response(404, etag='"a-1"'),
+            build_response(200, b'{"groups": ["Male"]}', '"a-2"'),
+            build_response(200, b'null', '"a-2"')
+        ]
+
+        self.assertFalse(self.client.is_member('Zed', 'Male'))
+        self.assertEqual(['Male'], self.client.get_groups('Zed'))
+
+        self.now.return_value = 200.0
+        self.assertTrue(self.client.is_member('Zed', 'Male'))
+
+        headers = [
+            call[1]['headers'] for connection in self.connections
+            for call in connection.request.call_args_list
+        ]
+        self.assertEqual(
+            {'Accept': 'application/json', 'If-None-Match': '"a-1"'},
+            headers[-1]
+        )
+
+    def test_unexpected_status(self):
+        """
+        Test that the right error is raised for unexpected responses.
+        """
+        self.responses = [build_response(500)]
+
+        e = self.assertRaises(
+            client.ClientError,
+            self.client.is_user,
+            'Adam'
+        )
+        self.assertEqual(500, e.status)
+        self.assertEqual(
+            "Unexpected response status 500 for /slugs/users/Adam/.",
+            str(e)
+        )
+
+    def test_cache_limits(self):
+        """
+        Test that a SLUGSClient evicts its least recently used answers, and
+        caches nothing with a maximum size of 0.
+        """
+        slugs_client = client.SLUGSClient('http://example.com', max_size=2)
+        self.responses = [build_response(404) for _ in range(4)]
+
+        for user in ('Adam', 'Eve', 'Adam', 'Cain', 'Eve'):
+            slugs_client.is_user(user)
+        self.assertEqual(2, len(slugs_client))
+        self.assertEqual(
+            ['/users/Cain/', '/users/Eve/'],
+            sorted(slugs_client._entries)
+        )
+        self.assertEqual(4, len(self.requests()))
+
+        slugs_client = client.SLUGSClient('http://example.com', max_size=0)
+        self.responses = [build_response(404) for _ in range(2)]
+        slugs_client.is_user('Adam')
+        slugs_client.is_user('Adam')
+        self.assertEqual(0, len(slugs_client))
+        self.assertEqual(6, len(self.requests()))
+
+        slugs_client.clear()
+        self.client.clear()
+        self.assertEqual(0, len(self.client))
+
+    def test_connection_pool(self):
+        """
+        Test that connections are kept alive and reused, unless the server
+        closes them.
+        """
+        self.responses = [
+            build_response(404),
+            build_response(404),
+            build_response(404, connection='close'),
+            build_response(404)
+        ]
+
+        self.client.is_user('Adam')
+        self.client.is_user('Eve')
+        self.assertEqual(1, len(self.connections))
+        self.assertEqual(1, len(self.client._pool))
+
+        self.client.is_user('Cain')
+        self.assertEqual(0, len(self.client._pool))
+        self.connections[0].close.assert_called_once_with()
+
+        self.client.is_user('Abel')
+        self.assertEqual(2, len(self.connections))
+
+        self.client.close()
+        self.assertEqual(0, len(self.client._pool))
+        self.connections[1].close.assert_called_once_with()
+
+    def test_stale_connection(self):
+        """
+        Test that a request failing on a reused connection is retried once
+        on a new connection, and that other failures are raised.
+        """
+        self.responses = [build_response(404), build_response(404)]
+        self.client.is_user('Adam')
+        self.connections[0].request.side_effect = socket.error(
+            "Connection reset"
+        )
+
+        self.assertFalse(self.client.is_user('Eve'))
+        self.assertEqual(2, len(self.connections))
+        self.connections[0].close.assert_called_once_with()
+
+        self.client.close()
+        self.connect.side_effect = None
+        self.connect.return_value.request.side_effect = socket.error(
+            "Connection refused"
+        )
+        self.assertRaises(socket.error, self.client.is_user, 'Cain')
@@ -0,0 +1,143 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import argparse
+import mock
+import os
+import shutil
+import tempfile
+import testtools
+
+from slugs import compiler
+from slugs import snapshots
+
+
+class TestCompiler(testtools.TestCase):
+
+    def setUp(self):
+        super(TestCompiler, self).setUp()
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        self.input = os.path.join(self.temp_dir, 'user_group_mapping.csv')
+        self.output = os.path.join(self.temp_dir, 'user_group_mapping.slugs')
+        with open(self.input, 'w') as f:
+            f.write("John,Male\n")
+            f.write("Jane,Female\n")
+            f.write("John,Human\n")
+            f.write("Jane,Human\n")
+
+    def test_build_parser(self):
+        """
+        Test that a compiler ArgumentParser can be built without error.
+        """
+        result = compiler.build_parser()
+        self.assertIsInstance(result, argparse.ArgumentParser)
+
+        args = result.parse_args([self.input, '-o', self.output])
+        self.assertEqual(self.input, args.input)
+        self.assertEqual(self.output, args.output)
+
+    def test_check_arguments(self):
+        """
+        Test that a valid set of arguments is checked correctly.
+        """
+        args = argparse.Namespace(input=self.input, output=self.output)
+        compiler.check_arguments(args)
+
+    def test_check_arguments_with_invalid_input(self):
+        """
+        Test that an invalid 'input' argument generates the right error.
+        """
+        args = argparse.Namespace(input='invalid', output=self.output)
+
+        self.assertRaisesRegex(
+            ValueError,
+            "Input file path 'invalid' does not exist.",
+            compiler.check_arguments,
+            args
+        )
+
+    def test_check_arguments_with_invalid_output(self):
+        """
+        Test that an invalid 'output' argument generates the right error.
+        """
+        output = os.path.join(self.temp_dir, 'invalid', 'output.slugs')
+        args = argparse.Namespace(input=self.input, output=output)
+
+        self.assertRaisesRegex(
+            ValueError,
+            "Output directory '{}' does not exist.".format(
+                os.path.dirname(output)
+            ),
+            compiler.check_arguments,
+            args
+        )
+
+    def test_compile_file(self):
+        """
+        Test that a CSV file is compiled into an equivalent snapshot file,
+        leaving no temporary files behind.
+        """
+        compiler.compile_file(self.input, self.output)
+
+        self.assertTrue(snapshots.is_snapshot_file(self.output))
+        self.assertEqual(
+            ['user_group_mapping.csv', 'user_group_mapping.slugs'],
+            sorted(os.listdir(self.temp_dir))
+        )
+
+        snapshot = snapshots.load(self.output)
+        self.assertEqual(['Jane', 'John'], sorted(snapshot.users.keys()))
+        self.assertEqual(
+            ['Female', 'Human', 'Male'],
+            sorted(snapshot.groups.keys())
+        )
+
+    def test_compile_file_with_bad_data(self):
+        """
+        Test that an invalid CSV file is not compiled.
+        """
+        with open(self.input, 'w') as f:
+            f.write("JohnMale\n")
+
+        self.assertRaisesRegex(
+            ValueError,
+            "Invalid entry on line 1.",
+            compiler.compile_file,
+            self.input,
+            self.output
+        )
+        self.assertEqual(
+            ['user_group_mapping.csv'],
+            os.listdir(self.temp_dir)
+        )
+
+    @mock.patch('slugs.compiler.build_parser')
+    def test_main(self, build_parser_mock):
+        """
+        Test that the main function can be run without error.
+        """
+        parser_mock = mock.MagicMock(spec=argparse.ArgumentParser)
+        parser_mock.parse_args.return_value = argparse.Namespace(
+            input=self.input,
+            output=self.output
+        )
+        build_parser_mock.return_value = parser_mock
+
+        compiler.main()
+
+        self.assertTrue(snapshots.is_snapshot_file(self.output))
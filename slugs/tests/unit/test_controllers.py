@@ -14,10 +14,17 @@
 # under the License.
 
 import cherrypy
+import json
 import mock
 import testtools
+import zlib
 
+from cherrypy.lib import httputil
+
+from slugs import cbor
 from slugs import controllers
+from slugs import snapshots
+from slugs import tools
 
 
 class TestMainController(testtools.TestCase):
@@ -45,8 +52,12 @@ class TestMainController(testtools.TestCase):
 
         controller.update()
 
-        controller._users.update.assert_called_once_with(None)
-        controller._groups.update.assert_called_once_with(None)
+        snapshot = controller.snapshot
+        self.assertIsInstance(snapshot, snapshots.Snapshot)
+        self.assertEqual({}, snapshot.users)
+        self.assertEqual({}, snapshot.groups)
+        self.assertIs(snapshot, controller._users.snapshot)
+        self.assertIs(snapshot, controller._groups.snapshot)
 
     def test_update_with_data(self):
         """
@@ -57,10 +68,619 @@ class TestMainController(testtools.TestCase):
         controller._users = mock.MagicMock(spec=controllers.UsersController)
         controller._groups = mock.MagicMock(spec=controllers.GroupsController)
 
-        controller.update('test')
+        original = controller.snapshot
+        controller.update([('Adam', 'Male'), ('Eve', 'Female')])
+
+        snapshot = controller.snapshot
+        self.assertIsNot(original, snapshot)
+        self.assertEqual({'Adam': ['Male'], 'Eve': ['Female']}, snapshot.users)
+        self.assertEqual(
+            {'Male': ['Adam'], 'Female': ['Eve']},
+            snapshot.groups
+        )
+        self.assertIs(snapshot, controller._users.snapshot)
+        self.assertIs(snapshot, controller._groups.snapshot)
+
+    def test_update_with_snapshot(self):
+        """
+        Test that a MainController publishes a prebuilt Snapshot as is.
+        """
+        controller = controllers.MainController()
+        snapshot = snapshots.Snapshot([('Adam', 'Male')])
+
+        controller.update(snapshot)
+
+        self.assertIs(snapshot, controller.snapshot)
+        self.assertIs(snapshot, controller._users.snapshot)
+        self.assertIs(snapshot, controller._groups.snapshot)
+        self.assertIs(snapshot, controller._check.snapshot)
+        self.assertIs(snapshot, controller._lookup.snapshot)
+        self.assertIs(snapshot, controller._changes.snapshot)
+
+    def test_update_with_delta(self):
+        """
+        Test that a MainController can be updated with a membership delta,
+        leaving the previously published snapshot untouched.
+        """
+        controller = controllers.MainController()
+        controller.update([('Adam', 'Male'), ('Eve', 'Female')])
+        original = controller.snapshot
+
+        controller.update(
+            added=[('Eve', 'Human')],
+            removed=[('Adam', 'Male')]
+        )
+
+        snapshot = controller.snapshot
+        self.assertIsNot(original, snapshot)
+        self.assertEqual({'Eve': ['Female', 'Human']}, dict(
+            [(k, sorted(v)) for k, v in snapshot.users.items()]
+        ))
+        self.assertEqual(
+            {'Female': ['Eve'], 'Human': ['Eve']},
+            snapshot.groups
+        )
+        self.assertEqual({'Adam': ['Male'], 'Eve': ['Female']}, original.users)
+        self.assertIs(snapshot, controller._users.snapshot)
+        self.assertIs(snapshot, controller._groups.snapshot)
+
+    def test_update_records_changes(self):
+        """
+        Test that a MainController records the changes made by each delta,
+        and starts over after a full update.
+        """
+        controller = controllers.MainController()
+        controller.update([('Adam', 'Male'), ('Eve', 'Female')])
+        feed = controller.change_feed
+        generation = controller.snapshot.generation
+        self.assertEqual(generation, feed.base)
+
+        controller.update(
+            added=[('Eve', 'Human'), ('Eve', 'Female')],
+            removed=[('Adam', 'Male'), ('Cain', 'Farmer')]
+        )
+        self.assertEqual(controller.snapshot.generation, feed.generation)
+        self.assertEqual(
+            ([('Eve', 'Human')], [('Adam', 'Male')]),
+            feed.since(generation)
+        )
+
+        controller.update([('Adam', 'Male')])
+        self.assertIsNone(feed.since(generation))
+        self.assertEqual(controller.snapshot.generation, feed.base)
+
+    def test_listeners(self):
+        """
+        Test that a MainController calls its listeners with every snapshot
+        it publishes.
+        """
+        controller = controllers.MainController()
+        listener = mock.MagicMock()
+        controller.add_listener(listener)
+
+        controller.update([('Adam', 'Male')])
+        listener.assert_called_once_with(controller.snapshot)
+
+        controller.update(added=[('Eve', 'Female')])
+        listener.assert_called_with(controller.snapshot)
+        self.assertEqual(2, listener.call_count)
+
+        controller.remove_listener(listener)
+        controller.update([('Adam', 'Male')])
+        self.assertEqual(2, listener.call_count)
+
+    def test_update_with_modified(self):
+        """
+        Test that a MainController records the modification time of the data
+        it publishes.
+        """
+        controller = controllers.MainController()
+
+        controller.update([('Adam', 'Male')], modified=10.0)
+        self.assertEqual(10.0, controller.snapshot.modified)
+
+        controller.update(added=[('Eve', 'Female')], modified=20.0)
+        self.assertEqual(20.0, controller.snapshot.modified)
+
+    def test_conditional_tool(self):
+        """
+        Test that conditional requests are handled for the whole
+        application.
+        """
+        self.assertTrue(
+            controllers.MainController._cp_config['tools.conditional.on']
+        )
+        self.assertIsInstance(cherrypy.tools.conditional, cherrypy.Tool)
+
+    def test_index_is_cached(self):
+        """
+        Test that MainController responses are encoded once per snapshot
+        generation and served from the response cache.
+        """
+        controller = controllers.MainController()
+        controller.update([('Adam', 'Male')])
+
+        first = controller.index()
+        second = controller._users.index()
+        self.assertIs(first, controller.index())
+        self.assertIs(second, controller._users.index())
+        self.assertEqual(2, len(controller.response_cache))
+        self.assertEqual(
+            'application/json',
+            cherrypy.response.headers['Content-Type']
+        )
+
+        controller.update([('Eve', 'Female')])
+
+        self.assertEqual(0, len(controller.response_cache))
+        result = json.loads(controller.index().decode('utf-8'))
+        self.assertEqual({'users': ['Eve'], 'groups': ['Female']}, result)
+
+    def test_index_is_compressed(self):
+        """
+        Test that MainController responses are gzip-encoded for clients that
+        accept it, compressing each body once per snapshot generation.
+        """
+        controller = controllers.MainController()
+        controller.update(
+            [('User{:03}'.format(i), 'Group{}'.format(i % 3))
+             for i in range(200)]
+        )
+        identity = controller.index()
+        self.assertNotIn('Content-Encoding', cherrypy.response.headers)
+
+        headers = cherrypy.serving.request.headers
+        self.addCleanup(headers.pop, 'Accept-Encoding', None)
+        self.addCleanup(
+            cherrypy.response.headers.pop,
+            'Content-Encoding',
+            None
+        )
+        self.addCleanup(cherrypy.response.headers.pop, 'ETag', None)
+        headers['Accept-Encoding'] = 'deflate, gzip;q=0.5'
+        cherrypy.response.headers['ETag'] = '"token-1"'
+
+        body = controller.index()
+
+        self.assertEqual(
+            'gzip',
+            cherrypy.response.headers['Content-Encoding']
+        )
+        self.assertEqual('"token-1-gzip"', cherrypy.response.headers['ETag'])
+        self.assertLess(len(body), len(identity))
+        self.assertEqual(identity, zlib.decompress(body, 16 + zlib.MAX_WBITS))
+        self.assertIs(body, controller.index())
+        self.assertEqual(2, len(controller.response_cache))
+
+        # Small bodies are not worth compressing.
+        del cherrypy.response.headers['Content-Encoding']
+        body = controller._users.index(user='User000', groups=True)
+        self.assertEqual(b'{"groups": ["Group0"]}', body)
+        self.assertNotIn('Content-Encoding', cherrypy.response.headers)
+
+    def test_accepts_gzip(self):
+        """
+        Test that the Accept-Encoding header is checked for gzip correctly.
+        """
+        headers = cherrypy.serving.request.headers
+        self.addCleanup(headers.pop, 'Accept-Encoding', None)
+
+        cases = [
+            (None, False),
+            ('identity', False),
+            ('gzip', True),
+            ('x-gzip', True),
+            ('deflate, gzip;q=0.1', True),
+            ('gzip;q=0', False),
+            ('*', True),
+            ('gzip;q=0, *', False),
+            ('*;q=0', False)
+        ]
+        for value, expected in cases:
+            headers.pop('Accept-Encoding', None)
+            if value is not None:
+                headers['Accept-Encoding'] = value
+            self.assertEqual(expected, controllers.accepts_gzip(), value)
+
+    def test_negotiate_format(self):
+        """
+        Test that the Accept header is checked for binary formats correctly.
+        """
+        headers = cherrypy.serving.request.headers
+        self.addCleanup(headers.pop, 'Accept', None)
+
+        json_format = ('json', 'application/json')
+        cbor_format = ('cbor', 'application/cbor')
+        msgpack_format = ('msgpack', 'application/msgpack')
+        cases = [
+            (None, json_format),
+            ('*/*', json_format),
+            ('application/json', json_format),
+            ('application/cbor', cbor_format),
+            ('application/json;q=0.5, application/cbor', cbor_format),
+            ('application/json, application/cbor;q=0.5', json_format),
+            ('*/*, application/cbor;q=0.5', json_format),
+            ('application/cbor;q=0', json_format),
+            ('application/msgpack, application/cbor;q=0.5', cbor_format),
+            ('text/html', json_format)
+        ]
+        for value, expected in cases:
+            headers.pop('Accept', None)
+            if value is not None:
+                headers['Accept'] = value
+            self.assertEqual(expected, controllers.negotiate_format(), value)
+
+        with mock.patch('slugs.controllers.msgpack', mock.MagicMock()):
+            headers['Accept'] = 'application/msgpack, application/cbor;q=0.5'
+            self.assertEqual(msgpack_format, controllers.negotiate_format())
+            headers['Accept'] = 'application/x-msgpack'
+            self.assertEqual(
+                ('msgpack', 'application/x-msgpack'),
+                controllers.negotiate_format()
+            )
+
+    def test_index_is_negotiated(self):
+        """
+        Test that MainController responses are encoded in the format the
+        client prefers, with a separate cache entry and entity tag for each
+        format.
+        """
+        controller = controllers.MainController()
+        controller.update([('Adam', 'Male'), ('Eve', 'Female')])
+        identity = controller.index()
+
+        headers = cherrypy.serving.request.headers
+        self.addCleanup(headers.pop, 'Accept', None)
+        self.addCleanup(cherrypy.response.headers.pop, 'ETag', None)
+        self.addCleanup(
+            cherrypy.response.headers.__setitem__,
+            'Content-Type',
+            'application/json'
+        )
+        headers['Accept'] = 'application/cbor'
+        cherrypy.response.headers['ETag'] = '"token-1"'
+
+        body = controller.index()
+
+        self.assertEqual(
+            'application/cbor',
+            cherrypy.response.headers['Content-Type']
+        )
+        self.assertEqual('"token-1-cbor"', cherrypy.response.headers['ETag'])
+        self.assertEqual(
+            json.loads(identity.decode('utf-8')),
+            cbor.loads(body)
+        )
+        self.assertIs(body, controller.index())
+        self.assertEqual(2, len(controller.response_cache))
+
+        # Existence checks answer with a null in the same format.
+        self.assertEqual(
+            b'\xf6',
+            controller._users.index(user='Adam', groups=True, group='Male')
+        )
+
+        packer = mock.MagicMock()
+        packer.packb.return_value = b'packed'
+        headers['Accept'] = 'application/msgpack'
+        with mock.patch('slugs.controllers.msgpack', packer):
+            self.assertEqual(b'packed', controller.index())
+        packer.packb.assert_called_once_with(
+            {'users': ['Adam', 'Eve'], 'groups': ['Female', 'Male']},
+            use_bin_type=controllers._MSGPACK_BIN_TYPE
+        )
+        self.assertEqual(
+            'application/msgpack',
+            cherrypy.response.headers['Content-Type']
+        )
+        self.assertEqual(3, len(controller.response_cache))
+
+    @mock.patch('slugs.controllers._STREAM_BATCH', 2)
+    @mock.patch('slugs.controllers._STREAM_THRESHOLD', 4)
+    def test_index_is_streamed_in_cbor(self):
+        """
+        Test that large MainController responses are streamed as CBOR with
+        indefinite lengths, decoding to the same object as JSON, and cached
+        separately once complete.
+        """
+        controller = controllers.MainController()
+        controller.update(
+            [
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Cain', 'Male'),
+                ('Abel', u'M\xe4le')
+            ]
+        )
+        self.addCleanup(setattr, cherrypy.response, 'stream', False)
+        identity = b''.join(controller.index())
+
+        headers = cherrypy.serving.request.headers
+        self.addCleanup(headers.pop, 'Accept', None)
+        self.addCleanup(
+            cherrypy.response.headers.__setitem__,
+            'Content-Type',
+            'application/json'
+        )
+        headers['Accept'] = 'application/cbor'
+
+        body = controller.index()
+
+        self.assertNotIsInstance(body, bytes)
+        body = b''.join(body)
+        self.assertTrue(body.startswith(cbor.MAP_START))
+        self.assertEqual(
+            json.loads(identity.decode('utf-8')),
+            cbor.loads(body)
+        )
+        self.assertEqual(2, len(controller.response_cache))
+        self.assertEqual(body, b''.join(controller.index()))
+
+        # MessagePack needs lengths up front, so it is never streamed.
+        packer = mock.MagicMock()
+        packer.packb.return_value = b'packed'
+        headers['Accept'] = 'application/msgpack'
+        with mock.patch('slugs.controllers.msgpack', packer):
+            self.assertEqual(b'packed', controller.index())
+
+    @mock.patch('slugs.controllers._STREAM_BATCH', 2)
+    @mock.patch('slugs.controllers._STREAM_THRESHOLD', 4)
+    def test_index_is_streamed_compressed(self):
+        """
+        Test that large MainController responses are compressed while they
+        are streamed, and that the compressed body is cached once complete.
+        """
+        controller = controllers.MainController()
+        controller.update(
+            [
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Cain', 'Male'),
+                ('Abel', 'Male')
+            ]
+        )
+        identity = b''.join(controller.index())
+        self.addCleanup(setattr, cherrypy.response, 'stream', False)
+
+        headers = cherrypy.serving.request.headers
+        self.addCleanup(headers.pop, 'Accept-Encoding', None)
+        self.addCleanup(
+            cherrypy.response.headers.pop,
+            'Content-Encoding',
+            None
+        )
+        headers['Accept-Encoding'] = 'gzip'
+        cherrypy.response.stream = False
+
+        body = controller.index()
+
+        self.assertNotIsInstance(body, bytes)
+        self.assertTrue(cherrypy.response.stream)
+        self.assertEqual(1, len(controller.response_cache))
+        body = b''.join(body)
+        self.assertEqual(identity, zlib.decompress(body, 16 + zlib.MAX_WBITS))
+        self.assertEqual(2, len(controller.response_cache))
+
+        cherrypy.response.stream = False
+        self.assertEqual(body, b''.join(controller.index()))
+        self.assertTrue(cherrypy.response.stream)
+        self.assertEqual(
+            'gzip',
+            cherrypy.response.headers['Content-Encoding']
+        )
+
+    @mock.patch('slugs.controllers._STREAM_CHUNK', 16)
+    @mock.patch('slugs.controllers._STREAM_BATCH', 2)
+    @mock.patch('slugs.controllers._STREAM_THRESHOLD', 4)
+    def test_index_is_streamed(self):
+        """
+        Test that large MainController responses are streamed, produce the
+        same JSON as encoded responses, and are cached once complete and
+        then streamed from the cache in fixed-size chunks.
+        """
+        controller = controllers.MainController()
+        controller.update(
+            [
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Cain', 'Male'),
+                ('Abel', u'M\xe4le')
+            ]
+        )
+        self.addCleanup(setattr, cherrypy.response, 'stream', False)
+
+        body = controller.index()
+
+        self.assertNotIsInstance(body, bytes)
+        self.assertTrue(cherrypy.response.stream)
+        body = b''.join(body)
+        self.assertEqual(
+            json.dumps(
+                {
+                    'users': ['Abel', 'Adam', 'Cain', 'Eve'],
+                    'groups': ['Female', 'Male', u'M\xe4le']
+                }
+            ),
+            body.decode('utf-8')
+        )
+        self.assertEqual(1, len(controller.response_cache))
+
+        cherrypy.response.stream = False
+        with mock.patch('slugs.controllers._stream_json') as stream:
+            chunks = list(controller.index())
+            stream.return_value.__iter__.assert_not_called()
+        self.assertTrue(cherrypy.response.stream)
+        self.assertEqual(body, b''.join(chunks))
+        self.assertEqual(
+            set([16]),
+            set(len(chunk) for chunk in chunks[:-1])
+        )
+        self.assertLessEqual(len(chunks[-1]), 16)
+
+        cherrypy.response.stream = False
+        body = controller._groups.index(group='Male', users=True)
+        self.assertIsInstance(body, bytes)
+        self.assertFalse(cherrypy.response.stream)
+        self.assertEqual(
+            {'users': ['Adam', 'Cain']},
+            json.loads(body.decode('utf-8'))
+        )
+
+    @mock.patch('slugs.controllers._STREAM_BATCH', 2)
+    @mock.patch('slugs.controllers._STREAM_THRESHOLD', 4)
+    def test_index_is_streamed_past_cache_budget(self):
+        """
+        Test that large MainController responses that cannot fit in the
+        response cache are streamed without being kept or cached.
+        """
+        controller = controllers.MainController()
+        controller.update(
+            [
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Cain', 'Male'),
+                ('Abel', 'Male')
+            ]
+        )
+        controller.response_cache.max_size = 40
+        self.addCleanup(setattr, cherrypy.response, 'stream', False)
+
+        body = b''.join(controller.index())
+
+        self.assertLess(40, len(body))
+        self.assertEqual(
+            {
+                'users': ['Abel', 'Adam', 'Cain', 'Eve'],
+                'groups': ['Female', 'Male']
+            },
+            json.loads(body.decode('utf-8'))
+        )
+        self.assertEqual(0, len(controller.response_cache))
+        self.assertEqual(body, b''.join(controller.index()))
+
+    def test_readers_do_not_lock(self):
+        """
+        Test that MainController request handling never takes the update
+        lock.
+        """
+        controller = controllers.MainController()
+        controller.update([('Adam', 'Male')])
+        controller._lock = mock.MagicMock()
+
+        controller._cp_dispatch(['users', 'Adam', 'groups', 'Male'])
+        controller.index()
 
-        controller._users.update.assert_called_once_with('test')
-        controller._groups.update.assert_called_once_with('test')
+        controller._lock.__enter__.assert_not_called()
+
+        controller.update([('Eve', 'Female')])
+
+        controller._lock.__enter__.assert_called_once_with()
+
+    def test_membership_handler(self):
+        """
+        Test that the lean membership handler answers like the index
+        handlers, setting statuses directly.
+        """
+        controller = controllers.MainController()
+        controller.update([('Adam', 'Male')], modified=1500000000.0)
+        etag = tools.entity_tag(controller.snapshot)
+
+        request = cherrypy.serving.request
+        response = cherrypy.serving.response
+        self.addCleanup(setattr, request, 'params', request.params)
+        self.addCleanup(setattr, response, 'status', response.status)
+        self.addCleanup(setattr, response, 'headers', response.headers)
+        self.addCleanup(request.headers.pop, 'Accept', None)
+        self.addCleanup(request.headers.pop, 'If-None-Match', None)
+
+        def handle(user, group, **headers):
+            request.params = {'user': user, 'group': group}
+            response.status = None
+            response.headers = httputil.HeaderMap(
+                {'Content-Type': 'text/html'}
+            )
+            for name in ('Accept', 'If-None-Match'):
+                request.headers.pop(name, None)
+            request.headers.update(headers)
+            return controller.membership_handler()
+
+        self.assertEqual(b'null', handle('Adam', 'Male'))
+        self.assertIsNone(response.status)
+        self.assertEqual('application/json', response.headers['Content-Type'])
+        self.assertEqual(etag, response.headers['ETag'])
+        self.assertEqual(
+            'Fri, 14 Jul 2017 02:40:00 GMT',
+            response.headers['Last-Modified']
+        )
+        self.assertEqual('Accept, Accept-Encoding', response.headers['Vary'])
+
+        self.assertEqual(
+            b'\xf6',
+            handle('Adam', 'Male', Accept=cbor.MEDIA_TYPE)
+        )
+        self.assertEqual('application/cbor', response.headers['Content-Type'])
+        self.assertEqual(
+            tools.variant_tag(etag, 'cbor'),
+            response.headers['ETag']
+        )
+
+        for user, group in (('Adam', 'Female'), ('Eve', 'Male')):
+            self.assertEqual(b'', handle(user, group))
+            self.assertEqual(404, response.status)
+            self.assertNotIn('Content-Type', response.headers)
+            self.assertNotIn('ETag', response.headers)
+
+        # Only the tag of the representation served is current, and only
+        # for a resource that exists.
+        self.assertEqual(
+            b'',
+            handle('Adam', 'Male', **{'If-None-Match': etag})
+        )
+        self.assertEqual(304, response.status)
+        self.assertEqual(etag, response.headers['ETag'])
+        self.assertNotIn('Content-Type', response.headers)
+        self.assertNotIn('Last-Modified', response.headers)
+
+        cbor_etag = tools.variant_tag(etag, 'cbor')
+        self.assertEqual(
+            b'',
+            handle(
+                'Adam',
+                'Male',
+                Accept=cbor.MEDIA_TYPE,
+                **{'If-None-Match': cbor_etag}
+            )
+        )
+        self.assertEqual(304, response.status)
+        self.assertEqual(cbor_etag, response.headers['ETag'])
+
+        self.assertEqual(
+            b'\xf6',
+            handle(
+                'Adam',
+                'Male',
+                Accept=cbor.MEDIA_TYPE,
+                **{'If-None-Match': etag}
+            )
+        )
+        self.assertIsNone(response.status)
+
+        self.assertEqual(
+            b'',
+            handle('Adam', 'Female', **{'If-None-Match': etag})
+        )
+        self.assertEqual(404, response.status)
+        self.assertNotIn('ETag', response.headers)
+
+        # Headers are built once per snapshot.
+        self.assertEqual(2, len(controller._membership_responses[1]))
+        controller.update(added=[('Eve', 'Female')])
+        self.assertEqual(b'null', handle('Eve', 'Female'))
+        self.assertEqual(
+            tools.entity_tag(controller.snapshot),
+            response.headers['ETag']
+        )
+        self.assertEqual(1, len(controller._membership_responses[1]))
 
     def test_cp_dispatch_level_one(self):
         """
@@ -89,6 +709,30 @@ class TestMainController(testtools.TestCase):
             *args
         )
 
+    def test_cp_dispatch_check(self):
+        """
+        Test that MainController dispatching routes check and lookup queries
+        to the right controllers.
+        """
+        controller = controllers.MainController()
+
+        result = controller._cp_dispatch(['check'])
+        self.assertIsInstance(result, controllers.CheckController)
+
+        result = controller._cp_dispatch(['lookup'])
+        self.assertIsInstance(result, controllers.LookupController)
+
+        result = controller._cp_dispatch(['changes'])
+        self.assertIsInstance(result, controllers.ChangesController)
+
+        args = [['check', 'invalid']]
+        self.assertRaisesRegex(
+            cherrypy.HTTPError,
+            "Resource not found.",
+            controller._cp_dispatch,
+            *args
+        )
+
     def test_cp_dispatch_level_two(self):
         """
         Test that MainController dispatching routes a Level 2 query to the
@@ -202,12 +846,16 @@ class TestMainController(testtools.TestCase):
         """
         controller = controllers.MainController()
 
-        controller._users = mock.MagicMock(spec=controllers.UsersController)
-        controller._groups = mock.MagicMock(spec=controllers.GroupsController)
-        controller._users.list.return_value = ['Adam', 'Eve']
-        controller._groups.list.return_value = ['Male', 'Female', 'Human']
+        controller.update(
+            [
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Adam', 'Human'),
+                ('Eve', 'Human')
+            ]
+        )
 
-        results = controller.index()
+        results = json.loads(controller.index().decode('utf-8'))
 
         self.assertIsInstance(results, dict)
         self.assertEqual(2, len(results.keys()))
@@ -223,6 +871,109 @@ class TestMainController(testtools.TestCase):
         self.assertIn('Female', results.get('groups'))
         self.assertIn('Human', results.get('groups'))
 
+    def test_index_with_limit(self):
+        """
+        Test that a MainController pages through users and groups together.
+        """
+        controller = controllers.MainController()
+        controller.update(
+            [
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Adam', 'Human'),
+                ('Eve', 'Human')
+            ]
+        )
+
+        results = json.loads(controller.index(limit='2').decode('utf-8'))
+        self.assertEqual(['Adam', 'Eve'], results.get('users'))
+        self.assertEqual(['Female', 'Human'], results.get('groups'))
+        self.assertIsNotNone(results.get('next'))
+
+        results = json.loads(
+            controller.index(cursor=results.get('next')).decode('utf-8')
+        )
+        self.assertEqual([], results.get('users'))
+        self.assertEqual(['Male'], results.get('groups'))
+        self.assertIsNone(results.get('next'))
+
+    def test_index_with_count(self):
+        """
+        Test that a MainController counts users and groups without listing
+        them.
+        """
+        controller = controllers.MainController()
+        controller.update(
+            [
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Adam', 'Human'),
+                ('Eve', 'Human')
+            ]
+        )
+
+        results = json.loads(controller.index(count='true').decode('utf-8'))
+        self.assertEqual({'users': 2, 'groups': 3}, results)
+
+        controller.update(added=[('Cain', 'Farmer')])
+        results = json.loads(controller.index(count='true').decode('utf-8'))
+        self.assertEqual({'users': 3, 'groups': 4}, results)
+
+        self.assertRaisesRegex(
+            cherrypy.HTTPError,
+            "Count must be 'true' or 'false'.",
+            controller.index,
+            count='yes'
+        )
+
+    def test_index_with_invalid_page(self):
+        """
+        Test that a MainController rejects invalid limits and cursors.
+        """
+        controller = controllers.MainController()
+        controller.update([('Adam', 'Male'), ('Eve', 'Female')])
+
+        for limit in ('0', '-1', 'invalid'):
+            self.assertRaisesRegex(
+                cherrypy.HTTPError,
+                "Limit must be a positive integer.",
+                controller.index,
+                limit=limit
+            )
+        for cursor in ('invalid', '!', controllers.encode_cursor(
+                controller.snapshot, 1, (0,))):
+            e = self.assertRaises(
+                cherrypy.HTTPError,
+                controller.index,
+                cursor=cursor
+            )
+            self.assertEqual(400, e.status)
+
+    def test_index_with_expired_cursor(self):
+        """
+        Test that cursors survive delta reloads and expire on full reloads.
+        """
+        controller = controllers.MainController()
+        controller.update([('Adam', 'Male'), ('Eve', 'Female')])
+
+        results = json.loads(controller._users.index(limit=1).decode('utf-8'))
+        self.assertEqual(['Adam'], results.get('users'))
+        cursor = results.get('next')
+
+        controller.update(added=[('Cain', 'Male')])
+        results = json.loads(
+            controller._users.index(cursor=cursor).decode('utf-8')
+        )
+        self.assertEqual(['Eve'], results.get('users'))
+
+        controller.update([('Adam', 'Male'), ('Eve', 'Female')])
+        e = self.assertRaises(
+            cherrypy.HTTPError,
+            controller._users.index,
+            cursor=cursor
+        )
+        self.assertEqual(410, e.status)
+
 
 class TestUsersController(testtools.TestCase):
 
@@ -308,7 +1059,7 @@ class TestUsersController(testtools.TestCase):
         """
         controller = controllers.UsersController()
 
-        result = controller.index()
+        result = json.loads(controller.index().decode('utf-8'))
         self.assertIsInstance(result, dict)
         self.assertEqual(1, len(result.keys()))
         self.assertIn('users', result.keys())
@@ -323,7 +1074,7 @@ class TestUsersController(testtools.TestCase):
             ]
         )
 
-        result = controller.index()
+        result = json.loads(controller.index().decode('utf-8'))
         self.assertIsInstance(result, dict)
         self.assertEqual(1, len(result.keys()))
         self.assertIn('users', result.keys())
@@ -373,6 +1124,7 @@ class TestUsersController(testtools.TestCase):
         )
 
         result = controller.index(user='Adam', groups=True)
+        result = json.loads(result.decode('utf-8'))
         self.assertIsInstance(result, dict)
         self.assertEqual(1, len(result.keys()))
         self.assertIn('groups', result.keys())
@@ -409,6 +1161,210 @@ class TestUsersController(testtools.TestCase):
 
         controller.index(user='Adam', groups=True, group='Human')
 
+    def test_index_with_limit(self):
+        """
+        Test that a UsersController pages through users and user groups.
+        """
+        controller = controllers.UsersController()
+        controller.update(
+            user_group_mapping=[
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Adam', 'Human'),
+                ('Eve', 'Human')
+            ]
+        )
+
+        results = json.loads(controller.index(limit=1).decode('utf-8'))
+        self.assertEqual({'users': ['Adam'], 'next': mock.ANY}, results)
+        results = json.loads(
+            controller.index(cursor=results.get('next')).decode('utf-8')
+        )
+        self.assertEqual({'users': ['Eve'], 'next': None}, results)
+
+        kwargs = {'user': 'Adam', 'groups': True, 'limit': 1}
+        results = json.loads(controller.index(**kwargs).decode('utf-8'))
+        self.assertEqual({'groups': ['Human'], 'next': mock.ANY}, results)
+        kwargs = {'user': 'Adam', 'groups': True, 'cursor': results['next']}
+        results = json.loads(controller.index(**kwargs).decode('utf-8'))
+        self.assertEqual({'groups': ['Male'], 'next': None}, results)
+
+    def test_index_with_search(self):
+        """
+        Test that a UsersController can search user names.
+        """
+        controller = controllers.UsersController()
+        controller.update(
+            user_group_mapping=[
+                ('Adam', 'Male'),
+                ('Abel', 'Male'),
+                ('Eve', 'Female'),
+                ('Cain', 'Male')
+            ]
+        )
+
+        results = json.loads(controller.index(prefix='A').decode('utf-8'))
+        self.assertEqual(
+            {'users': ['Abel', 'Adam'], 'truncated': False},
+            results
+        )
+
+        results = json.loads(
+            controller.index(contains='e', limit='1').decode('utf-8')
+        )
+        self.assertEqual({'users': ['Abel'], 'truncated': True}, results)
+
+        self.assertRaisesRegex(
+            cherrypy.HTTPError,
+            "Searches cannot be paginated.",
+            controller.index,
+            prefix='A',
+            cursor='cursor'
+        )
+        self.assertRaisesRegex(
+            cherrypy.HTTPError,
+            "Limit must be a positive integer.",
+            controller.index,
+            prefix='A',
+            limit='0'
+        )
+        self.assertRaisesRegex(
+            cherrypy.HTTPError,
+            "Search limit must not exceed 1000.",
+            controller.index,
+            prefix='A',
+            limit='1001'
+        )
+
+    def test_index_with_search_limits(self):
+        """
+        Test that UsersController searches list at most the default number
+        of matches, flag the matches left out, and accept limits up to the
+        maximum.
+        """
+        controller = controllers.UsersController()
+        controller.update(
+            user_group_mapping=[
+                ('User{:04}'.format(i), 'Human') for i in range(1200)
+            ]
+        )
+
+        def index(**kwargs):
+            return json.loads(controller.index(**kwargs).decode('utf-8'))
+
+        results = index(prefix='User')
+        self.assertEqual(
+            ['User{:04}'.format(i) for i in range(100)],
+            results['users']
+        )
+        self.assertTrue(results['truncated'])
+
+        results = index(prefix='User00')
+        self.assertEqual(100, len(results['users']))
+        self.assertFalse(results['truncated'])
+
+        results = index(prefix='User', limit='1000')
+        self.assertEqual(1000, len(results['users']))
+        self.assertTrue(results['truncated'])
+
+        self.assertEqual({'count': 1200}, index(prefix='User', count='true'))
+        self.assertRaisesRegex(
+            cherrypy.HTTPError,
+            "Search limit must not exceed 1000.",
+            controller.index,
+            contains='User',
+            limit='1001'
+        )
+
+    def test_index_with_count(self):
+        """
+        Test that a UsersController counts users, the groups of a user, and
+        search matches.
+        """
+        controller = controllers.UsersController()
+        controller.update(
+            user_group_mapping=[
+                ('Adam', 'Male'),
+                ('Abel', 'Male'),
+                ('Adam', 'Human'),
+                ('Eve', 'Female')
+            ]
+        )
+
+        def index(**kwargs):
+            return json.loads(controller.index(**kwargs).decode('utf-8'))
+
+        self.assertEqual({'count': 3}, index(count='true'))
+        self.assertEqual({'count': 3}, index(count='1', limit='1'))
+        self.assertEqual(
+            {'count': 2},
+            index(user='Adam', groups=True, count='true')
+        )
+        self.assertEqual(
+            {'count': 1},
+            index(user='Eve', groups=True, count='true')
+        )
+        self.assertEqual(
+            {'count': 2},
+            index(prefix='A', limit='1', count='true')
+        )
+        self.assertEqual(
+            {'users': ['Abel', 'Adam', 'Eve']},
+            index(count='false')
+        )
+        self.assertRaisesRegex(
+            cherrypy.HTTPError,
+            "User not found.",
+            controller.index,
+            user='Cain',
+            groups=True,
+            count='true'
+        )
+
+    def test_index_with_query(self):
+        """
+        Test that a UsersController lists the users matching a group set
+        expression, as a count, a full listing, or a page at a time.
+        """
+        controller = controllers.UsersController()
+        controller.update(
+            user_group_mapping=[
+                ('Adam', 'Male'),
+                ('Adam', 'Human'),
+                ('Cain', 'Male'),
+                ('Cain', 'Human'),
+                ('Cain', 'Farmer'),
+                ('Eve', 'Female'),
+                ('Eve', 'Human')
+            ]
+        )
+
+        def index(**kwargs):
+            return json.loads(controller.index(**kwargs).decode('utf-8'))
+
+        self.assertEqual(
+            {'users': ['Adam']},
+            index(all_of='Human,Male', none_of='Farmer')
+        )
+        self.assertEqual(
+            {'users': ['Cain', 'Eve']},
+            index(any_of=['Female', 'Farmer'])
+        )
+        self.assertEqual({'count': 3}, index(all_of='Human', count='true'))
+
+        results = index(all_of='Human', limit='2')
+        self.assertEqual(['Adam', 'Cain'], results.get('users'))
+        results = index(all_of='Human', cursor=results.get('next'))
+        self.assertEqual({'users': ['Eve'], 'next': None}, results)
+
+        self.assertRaisesRegex(
+            cherrypy.HTTPError,
+            "Count must be 'true' or 'false'.",
+            controller.index,
+            all_of='Human',
+            count='invalid'
+        )
+
 
 class TestGroupsController(testtools.TestCase):
 
@@ -498,7 +1454,7 @@ class TestGroupsController(testtools.TestCase):
         """
         controller = controllers.GroupsController()
 
-        result = controller.index()
+        result = json.loads(controller.index().decode('utf-8'))
         self.assertIsInstance(result, dict)
         self.assertEqual(1, len(result.keys()))
         self.assertIn('groups', result.keys())
@@ -513,7 +1469,7 @@ class TestGroupsController(testtools.TestCase):
             ]
         )
 
-        result = controller.index()
+        result = json.loads(controller.index().decode('utf-8'))
         self.assertIsInstance(result, dict)
         self.assertEqual(1, len(result.keys()))
         self.assertIn('groups', result.keys())
@@ -564,6 +1520,7 @@ class TestGroupsController(testtools.TestCase):
         )
 
         result = controller.index(group='Human', users=True)
+        result = json.loads(result.decode('utf-8'))
         self.assertIsInstance(result, dict)
         self.assertEqual(1, len(result.keys()))
         self.assertIn('users', result.keys())
@@ -599,3 +1556,335 @@ class TestGroupsController(testtools.TestCase):
         )
 
         controller.index(group='Human', users=True, user='Adam')
+
+    def test_index_with_limit(self):
+        """
+        Test that a GroupsController pages through groups and group users.
+        """
+        controller = controllers.GroupsController()
+        controller.update(
+            user_group_mapping=[
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Adam', 'Human'),
+                ('Eve', 'Human')
+            ]
+        )
+
+        results = json.loads(controller.index(limit=2).decode('utf-8'))
+        self.assertEqual(
+            {'groups': ['Female', 'Human'], 'next': mock.ANY},
+            results
+        )
+        results = json.loads(
+            controller.index(cursor=results.get('next')).decode('utf-8')
+        )
+        self.assertEqual({'groups': ['Male'], 'next': None}, results)
+
+        kwargs = {'group': 'Human', 'users': True, 'limit': 2}
+        results = json.loads(controller.index(**kwargs).decode('utf-8'))
+        self.assertEqual({'users': ['Adam', 'Eve'], 'next': None}, results)
+
+    def test_index_with_search(self):
+        """
+        Test that a GroupsController can search group names.
+        """
+        controller = controllers.GroupsController()
+        controller.update(
+            user_group_mapping=[
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Adam', 'Human'),
+                ('Eve', 'Human')
+            ]
+        )
+
+        results = json.loads(
+            controller.index(contains='male').decode('utf-8')
+        )
+        self.assertEqual({'groups': ['Female'], 'truncated': False}, results)
+
+        results = json.loads(
+            controller.index(prefix='', limit='2').decode('utf-8')
+        )
+        self.assertEqual(
+            {'groups': ['Female', 'Human'], 'truncated': True},
+            results
+        )
+
+    def test_index_with_count(self):
+        """
+        Test that a GroupsController counts groups and the users of a group.
+        """
+        controller = controllers.GroupsController()
+        controller.update(
+            user_group_mapping=[
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Adam', 'Human'),
+                ('Eve', 'Human')
+            ]
+        )
+
+        def index(**kwargs):
+            return json.loads(controller.index(**kwargs).decode('utf-8'))
+
+        self.assertEqual({'count': 3}, index(count='true'))
+        self.assertEqual(
+            {'count': 2},
+            index(group='Human', users=True, count='true')
+        )
+        self.assertEqual(
+            {'count': 1},
+            index(group='Male', users=True, count='true')
+        )
+        self.assertRaisesRegex(
+            cherrypy.HTTPError,
+            "Count must be 'true' or 'false'.",
+            controller.index,
+            group='Human',
+            users=True,
+            count='invalid'
+        )
+
+    def test_index_with_query(self):
+        """
+        Test that a GroupsController lists the groups matching a user set
+        expression.
+        """
+        controller = controllers.GroupsController()
+        controller.update(
+            user_group_mapping=[
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Adam', 'Human'),
+                ('Eve', 'Human')
+            ]
+        )
+
+        results = json.loads(
+            controller.index(all_of='Adam,Eve').decode('utf-8')
+        )
+        self.assertEqual({'groups': ['Human']}, results)
+
+
+class TestCheckController(testtools.TestCase):
+
+    def setUp(self):
+        super(TestCheckController, self).setUp()
+
+        request = cherrypy.serving.request
+        self.addCleanup(setattr, request, 'json', None)
+
+    def test_index(self):
+        """
+        Test that a CheckController checks every pair in a request.
+        """
+        controller = controllers.CheckController(
+            [
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Adam', 'Human'),
+                ('Eve', 'Human')
+            ]
+        )
+        cherrypy.request.json = [
+            ['Adam', 'Male'],
+            ['Adam', 'Female'],
+            ['Eve', 'Human'],
+            ['invalid', 'Human'],
+            ['Eve', 'invalid']
+        ]
+
+        result = json.loads(controller.index().decode('utf-8'))
+
+        self.assertEqual(
+            {'results': [True, False, True, False, False]},
+            result
+        )
+        self.assertEqual(
+            'application/json',
+            cherrypy.response.headers['Content-Type']
+        )
+
+    def test_index_with_no_pairs(self):
+        """
+        Test that a CheckController handles an empty request.
+        """
+        controller = controllers.CheckController()
+        cherrypy.request.json = []
+
+        result = json.loads(controller.index().decode('utf-8'))
+
+        self.assertEqual({'results': []}, result)
+
+    def test_index_with_invalid_pairs(self):
+        """
+        Test that a CheckController rejects malformed requests.
+        """
+        controller = controllers.CheckController()
+
+        for data in ({}, 'Adam', [['Adam']], [['Adam', 'Male', 'Human']],
+                     [['Adam', 1]], [[None, 'Male']], [('Adam', 'Male'), 3]):
+            cherrypy.request.json = data
+            self.assertRaisesRegex(
+                cherrypy.HTTPError,
+                "Request body must be a JSON array of \\[user, group\\] "
+                "pairs.",
+                controller.index
+            )
+
+
+class TestLookupController(testtools.TestCase):
+
+    def setUp(self):
+        super(TestLookupController, self).setUp()
+
+        request = cherrypy.serving.request
+        self.addCleanup(setattr, request, 'json', None)
+        self.addCleanup(setattr, cherrypy.response, 'stream', False)
+
+        self.controller = controllers.LookupController(
+            [
+                ('Adam', 'Male'),
+                ('Eve', 'Female'),
+                ('Adam', 'Human'),
+                ('Eve', 'Human')
+            ]
+        )
+
+    def test_index(self):
+        """
+        Test that a LookupController returns the groups of every known user
+        and reports unknown users.
+        """
+        cherrypy.request.json = ['Adam', 'invalid', 'Eve', 'Adam']
+
+        body = self.controller.index()
+
+        self.assertIsInstance(body, bytes)
+        self.assertEqual(
+            {
+                'groups': {
+                    'Adam': ['Human', 'Male'],
+                    'Eve': ['Female', 'Human']
+                },
+                'unknown': ['invalid']
+            },
+            json.loads(body.decode('utf-8'))
+        )
+        self.assertEqual(
+            'application/json',
+            cherrypy.response.headers['Content-Type']
+        )
+
+    @mock.patch('slugs.controllers._STREAM_BATCH', 1)
+    @mock.patch('slugs.controllers._STREAM_THRESHOLD', 3)
+    def test_index_is_streamed(self):
+        """
+        Test that large LookupController responses are streamed and produce
+        the same JSON as encoded responses.
+        """
+        cherrypy.request.json = ['Adam', 'invalid', 'Eve']
+
+        body = self.controller.index()
+
+        self.assertNotIsInstance(body, bytes)
+        self.assertTrue(cherrypy.response.stream)
+        self.assertEqual(
+            json.dumps(
+                {
+                    'groups': {
+                        'Adam': ['Human', 'Male'],
+                        'Eve': ['Female', 'Human']
+                    },
+                    'unknown': ['invalid']
+                }
+            ),
+            b''.join(body).decode('utf-8')
+        )
+
+    def test_index_with_invalid_users(self):
+        """
+        Test that a LookupController rejects malformed requests.
+        """
+        for data in ({}, 'Adam', [['Adam']], ['Adam', None]):
+            cherrypy.request.json = data
+            self.assertRaisesRegex(
+                cherrypy.HTTPError,
+                "Request body must be a JSON array of user names.",
+                self.controller.index
+            )
+
+
+class TestChangesController(testtools.TestCase):
+
+    def setUp(self):
+        super(TestChangesController, self).setUp()
+
+        self.controller = controllers.MainController()
+        self.controller.update([('Adam', 'Male'), ('Eve', 'Female')])
+        self.generation = self.controller.snapshot.generation
+
+    def index(self, **kwargs):
+        return json.loads(
+            self.controller._changes.index(**kwargs).decode('utf-8')
+        )
+
+    def test_index(self):
+        """
+        Test that a ChangesController lists the net changes since a
+        generation.
+        """
+        self.controller.update(added=[('Eve', 'Human')])
+        self.controller.update(
+            added=[('Adam', 'Human')],
+            removed=[('Eve', 'Human'), ('Adam', 'Male')]
+        )
+        current = self.controller.snapshot.generation
+
+        self.assertEqual(
+            {
+                'generation': current,
+                'instance': snapshots.INSTANCE,
+                'resync': False,
+                'added': [['Adam', 'Human']],
+                'removed': [['Adam', 'Male']]
+            },
+            self.index(since=str(self.generation))
+        )
+        results = self.index(since=str(current))
+        self.assertEqual([], results.get('added'))
+        self.assertEqual([], results.get('removed'))
+
+    def test_index_with_resync(self):
+        """
+        Test that a ChangesController asks for a full resync when the
+        changes since a generation are not recorded.
+        """
+        self.controller.update(added=[('Eve', 'Human')])
+        self.controller.change_feed.max_size = 1
+        self.controller.update(added=[('Adam', 'Human')])
+        current = self.controller.snapshot.generation
+
+        for since in ('0', str(self.generation), str(current + 1)):
+            self.assertEqual(
+                {
+                    'generation': current,
+                    'instance': snapshots.INSTANCE,
+                    'resync': True
+                },
+                self.index(since=since)
+            )
+
+    def test_index_with_invalid_since(self):
+        """
+        Test that a ChangesController rejects invalid generations.
+        """
+        for since in (None, '-1', 'invalid'):
+            self.assertRaisesRegex(
+                cherrypy.HTTPError,
+                "Since must be a generation number.",
+                self.controller._changes.index,
+                since=since
+            )
@@ -0,0 +1,194 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import cherrypy
+import testtools
+
+from slugs import controllers
+from slugs import dispatch
+
+
+class TestRouteDispatcher(testtools.TestCase):
+
+    def setUp(self):
+        super(TestRouteDispatcher, self).setUp()
+
+        self.controller = controllers.MainController()
+        self.controller.update([('Adam', 'Male')])
+        self.application = cherrypy.Application(self.controller, '/slugs')
+        self.application.merge({'/users': {'tools.gzip.on': True}})
+        self.dispatcher = dispatch.RouteDispatcher()
+
+        request = cherrypy.serving.request
+        for name in ('app', 'params', 'config', 'handler', 'is_index',
+                     'method'):
+            self.addCleanup(setattr, request, name, getattr(request, name))
+        request.app = self.application
+        request.params = {}
+        request.method = 'GET'
+
+    def test_dispatch(self):
+        """
+        Test that a RouteDispatcher routes each URL shape to the right
+        handler with the right request parameters.
+        """
+        request = cherrypy.serving.request
+        request.method = 'POST'
+        cases = [
+            ('/', self.controller, {}),
+            ('/users', self.controller._users, {}),
+            ('/groups/', self.controller._groups, {}),
+            ('/check', self.controller._check, {}),
+            ('/lookup', self.controller._lookup, {}),
+            ('/changes', self.controller._changes, {}),
+            ('/users/Adam/', self.controller._users, {'user': 'Adam'}),
+            ('/groups/Male', self.controller._groups, {'group': 'Male'}),
+            (
+                '/users/Adam/groups/',
+                self.controller._users,
+                {'user': 'Adam', 'groups': True}
+            ),
+            (
+                '/groups/Male/users/Adam/',
+                self.controller._groups,
+                {'group': 'Male', 'users': True, 'user': 'Adam'}
+            )
+        ]
+        for path, controller, params in cases:
+            request.params = {'limit': '10'}
+            self.dispatcher(path)
+
+            self.assertEqual(controller.index, request.handler.callable, path)
+            self.assertEqual(dict(params, limit='10'), request.params, path)
+            self.assertTrue(request.is_index)
+
+    def test_dispatch_config(self):
+        """
+        Test that a RouteDispatcher merges the application and controller
+        configuration for each route.
+        """
+        request = cherrypy.serving.request
+
+        self.dispatcher('/users/Adam/groups/')
+        self.assertTrue(request.config['tools.conditional.on'])
+        self.assertTrue(request.config['tools.gzip.on'])
+
+        self.dispatcher('/check')
+        self.assertTrue(request.config['tools.conditional.on'])
+        self.assertNotIn('tools.gzip.on', request.config)
+        self.assertEqual(['POST'], request.config['tools.allow.methods'])
+
+    def test_dispatch_config_merge(self):
+        """
+        Test that a RouteDispatcher picks up application configuration
+        merged after a route was first dispatched.
+        """
+        request = cherrypy.serving.request
+
+        self.dispatcher('/groups/Male/')
+        self.assertNotIn('tools.gzip.on', request.config)
+        self.assertNotIn('tools.expires.on', request.config)
+
+        self.application.merge({
+            '/': {'tools.expires.on': True},
+            '/groups': {'tools.gzip.on': True}
+        })
+        self.dispatcher('/groups/Male/')
+        self.assertTrue(request.config['tools.gzip.on'])
+        self.assertTrue(request.config['tools.expires.on'])
+
+        self.application.merge({'/groups': {'tools.gzip.on': False}})
+        self.dispatcher('/groups/Male/')
+        self.assertFalse(request.config['tools.gzip.on'])
+
+    def test_dispatch_membership_check(self):
+        """
+        Test that a RouteDispatcher hands GET membership checks to the lean
+        handler, with the tools it replaces turned off.
+        """
+        request = cherrypy.serving.request
+        for path in ('/users/Adam/groups/Male/', '/groups/Male/users/Adam/'):
+            for method in ('GET', 'HEAD'):
+                request.method = method
+                request.params = {}
+                self.dispatcher(path)
+
+                self.assertEqual(
+                    self.controller.membership_handler,
+                    request.handler
+                )
+                self.assertEqual('Adam', request.params['user'])
+                self.assertEqual('Male', request.params['group'])
+                self.assertFalse(request.config['tools.conditional.on'])
+                self.assertFalse(request.config['tools.trailing_slash.on'])
+                self.assertEqual(
+                    path.startswith('/users'),
+                    request.config.get('tools.gzip.on', False)
+                )
+
+    def test_dispatch_membership_check_fallback(self):
+        """
+        Test that a RouteDispatcher uses the index handler for membership
+        checks the lean handler cannot answer the same way.
+        """
+        request = cherrypy.serving.request
+
+        # Other methods
+        request.method = 'POST'
+        self.dispatcher('/users/Adam/groups/Male/')
+        self.assertEqual(
+            self.controller._users.index,
+            request.handler.callable
+        )
+
+        # A trailing slash redirect is due
+        request.method = 'GET'
+        self.dispatcher('/users/Adam/groups/Male')
+        self.assertEqual(
+            self.controller._users.index,
+            request.handler.callable
+        )
+
+        # Conditional requests are turned off
+        self.application.merge({'/groups': {'tools.conditional.on': False}})
+        self.dispatcher('/groups/Male/users/Adam/')
+        self.assertEqual(
+            self.controller._groups.index,
+            request.handler.callable
+        )
+
+    def test_dispatch_not_found(self):
+        """
+        Test that a RouteDispatcher answers unknown paths with the same 404
+        errors as the default dispatcher.
+        """
+        cases = [
+            ('/invalid', "Collection not found."),
+            ('/check/invalid', "Resource not found."),
+            ('/users/Adam/invalid', "User attribute not found."),
+            ('/groups/Male/invalid/Adam', "Group attribute not found."),
+            ('/users/Adam/groups/Male/invalid', "Resource not found.")
+        ]
+        for path, message in cases:
+            e = self.assertRaises(
+                cherrypy.HTTPError,
+                self.dispatcher,
+                path
+            )
+            self.assertEqual(404, e.status)
+            self.assertEqual(message, e._message)
+            self.assertTrue(
+                cherrypy.serving.request.config['tools.conditional.on']
+            )
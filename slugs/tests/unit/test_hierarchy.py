@@ -0,0 +1,107 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import testtools
+
+from slugs import hierarchy
+
+
+class TestHierarchy(testtools.TestCase):
+
+    def setUp(self):
+        super(TestHierarchy, self).setUp()
+
+        # Admins -> Staff -> Everyone, with Staff <-> Contractors as a
+        # cycle.
+        self.edges = [
+            ('Admins', 'Staff'),
+            ('Staff', 'Everyone'),
+            ('Staff', 'Contractors'),
+            ('Contractors', 'Staff')
+        ]
+
+    def test_components(self):
+        """
+        Test that the components of a hierarchy are found, with each
+        component listed after the components of its parents.
+        """
+        result = hierarchy.components(self.edges)
+
+        self.assertEqual(
+            [['Everyone'], ['Contractors', 'Staff'], ['Admins']],
+            result
+        )
+
+    def test_components_with_deep_hierarchy(self):
+        """
+        Test that a hierarchy deeper than the recursion limit is handled.
+        """
+        edges = [(i, i + 1) for i in range(5000)]
+
+        result = hierarchy.components(edges)
+
+        self.assertEqual([[i] for i in range(5000, -1, -1)], result)
+
+    def test_closure(self):
+        """
+        Test that the effective groups of every group are computed, with
+        groups in a cycle sharing the same effective groups.
+        """
+        result = hierarchy.closure(self.edges)
+
+        self.assertEqual(
+            {
+                'Admins': ('Admins', 'Contractors', 'Everyone', 'Staff'),
+                'Staff': ('Contractors', 'Everyone', 'Staff'),
+                'Contractors': ('Contractors', 'Everyone', 'Staff'),
+                'Everyone': ('Everyone',)
+            },
+            result
+        )
+
+    def test_closure_with_no_edges(self):
+        """
+        Test that an empty hierarchy has no effective groups.
+        """
+        self.assertEqual({}, hierarchy.closure([]))
+
+    def test_expand(self):
+        """
+        Test that direct memberships are expanded into distinct effective
+        memberships.
+        """
+        result = hierarchy.expand(
+            [
+                ['Alice', 'Admins'],
+                ['Bob', 'Contractors'],
+                ['Bob', 'Everyone'],
+                ['Carol', 'Visitors']
+            ],
+            self.edges
+        )
+
+        self.assertEqual(
+            [
+                ['Alice', 'Admins'],
+                ['Alice', 'Contractors'],
+                ['Alice', 'Everyone'],
+                ['Alice', 'Staff'],
+                ['Bob', 'Contractors'],
+                ['Bob', 'Everyone'],
+                ['Bob', 'Staff'],
+                ['Carol', 'Visitors']
+            ],
+            result
+        )
@@ -0,0 +1,82 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import shutil
+import tempfile
+import testtools
+
+from slugs import inotify
+
+
+@testtools.skipUnless(inotify.is_supported(), "inotify is not supported")
+class TestInotify(testtools.TestCase):
+
+    def setUp(self):
+        super(TestInotify, self).setUp()
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        self.watcher = inotify.Inotify()
+        self.addCleanup(self.watcher.close)
+
+    def test_read_with_no_events(self):
+        """
+        Test that reading from an Inotify instance with no pending events
+        times out with no events.
+        """
+        self.watcher.add_watch(self.temp_dir, inotify.IN_CLOSE_WRITE)
+
+        self.assertEqual([], self.watcher.read(timeout=0))
+
+    def test_read_with_events(self):
+        """
+        Test that an Inotify instance reports the right events for a watched
+        directory.
+        """
+        wd = self.watcher.add_watch(
+            self.temp_dir,
+            inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO | inotify.IN_DELETE
+        )
+
+        path = os.path.join(self.temp_dir, 'data.csv')
+        with open(path, 'w') as f:
+            f.write("John,Male\n")
+        os.rename(path, os.path.join(self.temp_dir, 'renamed.csv'))
+        os.remove(os.path.join(self.temp_dir, 'renamed.csv'))
+
+        events = self.watcher.read(timeout=5)
+
+        self.assertEqual(
+            [
+                (wd, inotify.IN_CLOSE_WRITE, 'data.csv'),
+                (wd, inotify.IN_MOVED_TO, 'renamed.csv'),
+                (wd, inotify.IN_DELETE, 'renamed.csv')
+            ],
+            [(e.wd, e.mask, e.name) for e in events]
+        )
+
+    def test_add_watch_with_invalid_path(self):
+        """
+        Test that the right error is raised when watching a path that does
+        not exist.
+        """
+        self.assertRaises(
+            OSError,
+            self.watcher.add_watch,
+            os.path.join(self.temp_dir, 'invalid'),
+            inotify.IN_CLOSE_WRITE
+        )
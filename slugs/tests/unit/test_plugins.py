@@ -19,8 +19,12 @@ import os
 import shutil
 import tempfile
 import testtools
+import threading
 
+from slugs import controllers
+from slugs import inotify
 from slugs import plugins
+from slugs import snapshots
 
 
 class TestFileMonitoringPlugin(testtools.TestCase):
@@ -95,6 +99,76 @@ class TestFileMonitoringPlugin(testtools.TestCase):
             *args
         )
 
+    def test_watcher(self):
+        """
+        Test that the watcher attribute of a FileMonitoringPlugin is resolved
+        and validated correctly.
+        """
+        callback = mock.MagicMock()
+        plugin = plugins.FileMonitoringPlugin(
+            cherrypy.engine,
+            self.temp_file.name,
+            callback,
+            watcher='poll'
+        )
+        self.assertEqual(plugin.watcher, 'poll')
+
+        with mock.patch('slugs.inotify.is_supported', return_value=False):
+            plugin.watcher = 'auto'
+            self.assertEqual(plugin.watcher, 'poll')
+
+            args = [plugin, 'watcher', 'inotify']
+            self.assertRaisesRegex(
+                ValueError,
+                "The 'inotify' watcher is not supported on this platform.",
+                setattr,
+                *args
+            )
+
+        with mock.patch('slugs.inotify.is_supported', return_value=True):
+            plugin.watcher = 'auto'
+            self.assertEqual(plugin.watcher, 'inotify')
+
+        args = [plugin, 'watcher', 'invalid']
+        self.assertRaisesRegex(
+            ValueError,
+            "Watcher 'invalid' must be one of 'auto', 'inotify', or 'poll'.",
+            setattr,
+            *args
+        )
+
+    @testtools.skipUnless(inotify.is_supported(), "inotify is not supported")
+    def test_start_with_inotify(self):
+        """
+        Test that the FileMonitoringPlugin reloads the monitored file from a
+        background inotify watcher, including after an atomic rename.
+        """
+        callback = mock.MagicMock()
+        plugin = plugins.FileMonitoringPlugin(
+            cherrypy.engine,
+            self.temp_file.name,
+            callback,
+            watcher='inotify'
+        )
+        plugin.bus = mock.MagicMock(spec=cherrypy.engine)
+        reloaded = threading.Event()
+        plugin.update_data = mock.MagicMock(side_effect=reloaded.set)
+
+        plugin.start()
+        self.addCleanup(plugin.stop)
+
+        plugin.bus.subscribe.assert_not_called()
+        self.assertTrue(reloaded.wait(5))
+        reloaded.clear()
+
+        replacement = os.path.join(self.temp_dir, 'replacement')
+        with open(replacement, 'w') as f:
+            f.write("John,Male\n")
+        os.rename(replacement, plugin.path)
+
+        self.assertTrue(reloaded.wait(5))
+        self.assertEqual(2, plugin.update_data.call_count)
+
     def test_start(self):
         """
         Test that the FileMonitoringPlugin logs the right message and
@@ -104,7 +178,8 @@ class TestFileMonitoringPlugin(testtools.TestCase):
         plugin = plugins.FileMonitoringPlugin(
             cherrypy.engine,
             self.temp_file.name,
-            callback
+            callback,
+            watcher='poll'
         )
         plugin.bus = mock.MagicMock(spec=cherrypy.engine)
 
@@ -130,7 +205,8 @@ class TestFileMonitoringPlugin(testtools.TestCase):
         plugin = plugins.FileMonitoringPlugin(
             cherrypy.engine,
             self.temp_file.name,
-            callback
+            callback,
+            watcher='poll'
         )
         plugin.bus = mock.MagicMock(spec=cherrypy.engine)
 
@@ -161,14 +237,15 @@ class TestFileMonitoringPlugin(testtools.TestCase):
         plugin.bus = mock.MagicMock(spec=cherrypy.engine)
         plugin.update_data = mock.MagicMock()
 
-        t = os.path.getmtime(plugin.path)
-        plugin._t = t
+        s = os.stat(plugin.path)
+        signature = (s.st_dev, s.st_ino, s.st_size, s.st_mtime)
+        plugin._signature = signature
 
         plugin.update_data.assert_not_called()
 
         plugin.check_path()
 
-        self.assertEqual(plugin._t, t)
+        self.assertEqual(plugin._signature, signature)
         plugin.update_data.assert_not_called()
 
     def test_check_path_with_update(self):
@@ -185,14 +262,74 @@ class TestFileMonitoringPlugin(testtools.TestCase):
         plugin.bus = mock.MagicMock(spec=cherrypy.engine)
         plugin.update_data = mock.MagicMock()
 
-        self.assertEqual(plugin._t, 0)
+        self.assertIsNone(plugin._signature)
         plugin.update_data.assert_not_called()
 
         plugin.check_path()
 
-        self.assertNotEqual(plugin._t, 0)
+        self.assertIsNotNone(plugin._signature)
+        plugin.update_data.assert_called_once()
+
+    def test_check_path_with_replaced_file(self):
+        """
+        Test that the FileMonitoringPlugin reloads a monitored file that was
+        replaced by rename, even if the modification time did not change.
+        """
+        callback = mock.MagicMock()
+        plugin = plugins.FileMonitoringPlugin(
+            cherrypy.engine,
+            self.temp_file.name,
+            callback
+        )
+        plugin.bus = mock.MagicMock(spec=cherrypy.engine)
+        plugin.update_data = mock.MagicMock()
+
+        plugin.check_path()
+        plugin.update_data.assert_called_once()
+
+        t = os.path.getmtime(plugin.path)
+        replacement = os.path.join(self.temp_dir, 'replacement')
+        with open(replacement, 'w') as f:
+            f.write("John,Male\n")
+        os.utime(replacement, (t, t))
+        os.rename(replacement, plugin.path)
+
+        plugin.check_path()
+        self.assertEqual(2, plugin.update_data.call_count)
+
+    def test_check_path_with_missing_file(self):
+        """
+        Test that the FileMonitoringPlugin retains its data while the
+        monitored file is missing and reloads it once it is recreated.
+        """
+        callback = mock.MagicMock()
+        plugin = plugins.FileMonitoringPlugin(
+            cherrypy.engine,
+            self.temp_file.name,
+            callback
+        )
+        plugin.bus = mock.MagicMock(spec=cherrypy.engine)
+        plugin.update_data = mock.MagicMock()
+
+        plugin.check_path()
         plugin.update_data.assert_called_once()
 
+        os.remove(plugin.path)
+        plugin.check_path()
+
+        plugin.bus.log.assert_called_once_with(
+            "Monitored file ({}) is missing. Retaining current data.".format(
+                plugin.path
+            )
+        )
+        plugin.update_data.assert_called_once()
+
+        with open(plugin.path, 'w') as f:
+            f.write("John,Male\n")
+        plugin.check_path()
+
+        self.assertEqual(2, plugin.update_data.call_count)
+
     def test_update_data_with_no_data(self):
         """
         Test that the FileMonitoringPlugin processes an empty data file
@@ -214,7 +351,10 @@ class TestFileMonitoringPlugin(testtools.TestCase):
         plugin.bus.log.assert_called_once_with(
             "Monitored file ({}) updated. Reloading data.".format(plugin.path)
         )
-        callback.assert_called_once_with([])
+        callback.assert_called_once_with(
+            [],
+            modified=os.path.getmtime(plugin.path)
+        )
 
     def test_update_data_with_data(self):
         """
@@ -250,7 +390,8 @@ class TestFileMonitoringPlugin(testtools.TestCase):
                 ['Jane', 'Female'],
                 ['John', 'Human'],
                 ['Jane', 'Human']
-            ]
+            ],
+            modified=os.path.getmtime(plugin.path)
         )
 
     def test_update_data_with_bad_data(self):
@@ -286,3 +427,341 @@ class TestFileMonitoringPlugin(testtools.TestCase):
             )
         )
         callback.assert_not_called()
+
+    def test_update_data_with_changed_data(self):
+        """
+        Test that the FileMonitoringPlugin only hands over the membership
+        changes when a data file is reloaded.
+        """
+        published = [snapshots.Snapshot()]
+        callback = mock.MagicMock()
+        plugin = plugins.FileMonitoringPlugin(
+            cherrypy.engine,
+            self.temp_file.name,
+            callback,
+            snapshot=lambda: published[0]
+        )
+        plugin.bus = mock.MagicMock(spec=cherrypy.engine)
+
+        with open(self.temp_file.name, 'w') as f:
+            f.write("John,Male\n")
+            f.write("Jane,Female\n")
+            f.write("John,Human\n")
+
+        plugin.update_data()
+
+        callback.assert_called_once_with(
+            [
+                ['John', 'Male'],
+                ['Jane', 'Female'],
+                ['John', 'Human']
+            ],
+            modified=os.path.getmtime(plugin.path)
+        )
+        published[0] = snapshots.Snapshot(callback.call_args[0][0])
+        callback.reset_mock()
+
+        with open(self.temp_file.name, 'w') as f:
+            f.write("John,Male\n")
+            f.write("John,Human\n")
+            f.write("Jane,Human\n")
+
+        plugin.update_data()
+
+        plugin.bus.log.assert_any_call(
+            "Applying 1 added and 1 removed memberships."
+        )
+        callback.assert_called_once_with(
+            added=[('Jane', 'Human')],
+            removed=[('Jane', 'Female')],
+            modified=os.path.getmtime(plugin.path)
+        )
+        published[0] = published[0].apply(
+            added=callback.call_args[1]['added'],
+            removed=callback.call_args[1]['removed']
+        )
+        callback.reset_mock()
+
+        plugin.update_data()
+
+        callback.assert_not_called()
+
+    def test_diff(self):
+        """
+        Test that parsed entries are diffed correctly against a snapshot,
+        including one whose names were added by deltas.
+        """
+        snapshot = snapshots.Snapshot([['John', 'Male'], ['Jane', 'Female']])
+        snapshot = snapshot.apply(
+            added=[('Adam', 'Male'), ('Jane', 'Admin'), ('Zed', 'Male')],
+            removed=[('John', 'Male')]
+        )
+        data = [
+            ['Zed', 'Male'],
+            ['John', 'Male'],
+            ['Jane', 'Female'],
+            ['John', 'Male'],
+            ['Eve', 'Female'],
+            ['Jane', 'Admin']
+        ]
+
+        added, removed = plugins._diff(snapshot, data)
+
+        self.assertEqual([('Eve', 'Female'), ('John', 'Male')], added)
+        self.assertEqual([('Adam', 'Male')], removed)
+        self.assertEqual(([], []), plugins._diff(snapshot, [
+            ['Adam', 'Male'],
+            ['Jane', 'Admin'],
+            ['Jane', 'Female'],
+            ['Zed', 'Male']
+        ]))
+
+    def test_reloader(self):
+        """
+        Test that the reloader attribute of a FileMonitoringPlugin is
+        validated correctly.
+        """
+        callback = mock.MagicMock()
+        plugin = plugins.FileMonitoringPlugin(
+            cherrypy.engine,
+            self.temp_file.name,
+            callback
+        )
+        self.assertEqual(plugin.reloader, 'thread')
+
+        plugin.reloader = 'process'
+        self.assertEqual(plugin.reloader, 'process')
+
+        args = [plugin, 'reloader', 'invalid']
+        self.assertRaisesRegex(
+            ValueError,
+            "Reloader 'invalid' must be one of 'thread' or 'process'.",
+            setattr,
+            *args
+        )
+
+    def test_check_path_with_worker(self):
+        """
+        Test that a started FileMonitoringPlugin reloads the monitored file
+        on its worker thread instead of the thread checking the file.
+        """
+        reloaded = threading.Event()
+        threads = []
+
+        def callback(*args, **kwargs):
+            threads.append(threading.current_thread())
+            reloaded.set()
+
+        plugin = plugins.FileMonitoringPlugin(
+            cherrypy.engine,
+            self.temp_file.name,
+            callback,
+            watcher='poll'
+        )
+        plugin.bus = mock.MagicMock(spec=cherrypy.engine)
+
+        plugin.start()
+        self.addCleanup(plugin.stop)
+
+        plugin.check_path()
+
+        self.assertTrue(reloaded.wait(5))
+        self.assertEqual(1, len(threads))
+        self.assertNotEqual(threading.current_thread(), threads[0])
+
+    def test_update_data_with_process_reloader(self):
+        """
+        Test that the FileMonitoringPlugin can parse a data file in a
+        subprocess.
+        """
+        callback = mock.MagicMock()
+        plugin = plugins.FileMonitoringPlugin(
+            cherrypy.engine,
+            self.temp_file.name,
+            callback,
+            reloader='process'
+        )
+        plugin.bus = mock.MagicMock(spec=cherrypy.engine)
+
+        with open(self.temp_file.name, 'w') as f:
+            f.write("John,Male\n")
+            f.write("Jane,Female\n")
+
+        plugin.update_data()
+
+        callback.assert_called_once_with(
+            [
+                ['John', 'Male'],
+                ['Jane', 'Female']
+            ],
+            modified=os.path.getmtime(plugin.path)
+        )
+
+        with open(self.temp_file.name, 'w') as f:
+            f.write("JohnMale\n")
+
+        plugin.update_data()
+
+        plugin.bus.log.assert_any_call(
+            "Error parsing monitored file ({}). Halting data reload.".format(
+                plugin.path
+            )
+        )
+        callback.assert_called_once()
+
+    def test_update_data_with_stale_data(self):
+        """
+        Test that the FileMonitoringPlugin drops the result of a reload
+        that was superseded by a newer version of the file.
+        """
+        plugin = plugins.FileMonitoringPlugin(
+            cherrypy.engine,
+            self.temp_file.name,
+            None
+        )
+        plugin._callback = mock.MagicMock()
+        plugin.bus = mock.MagicMock(spec=cherrypy.engine)
+
+        def parse(is_cancelled):
+            plugin._invalidate()
+            return [['John', 'Male']]
+
+        plugin._parse = parse
+        plugin.update_data()
+
+        plugin.bus.log.assert_any_call(
+            "Monitored file ({}) changed during reload. Discarding stale "
+            "data.".format(plugin.path)
+        )
+        plugin._callback.assert_not_called()
+
+    def test_update_data_with_snapshot_file(self):
+        """
+        Test that the FileMonitoringPlugin loads a compiled snapshot file
+        and publishes it whole.
+        """
+        callback = mock.MagicMock()
+        plugin = plugins.FileMonitoringPlugin(
+            cherrypy.engine,
+            self.temp_file.name,
+            callback,
+            snapshot=lambda: snapshots.Snapshot([['John', 'Male']])
+        )
+        plugin.bus = mock.MagicMock(spec=cherrypy.engine)
+
+        with open(self.temp_file.name, 'wb') as f:
+            snapshots.dump(snapshots.Snapshot([['Jane', 'Female']]), f)
+
+        plugin.update_data()
+
+        callback.assert_called_once()
+        snapshot = callback.call_args[0][0]
+        self.assertIsInstance(snapshot, snapshots.Snapshot)
+        self.assertEqual({'Jane': ['Female']}, snapshot.users)
+        self.assertEqual(os.path.getmtime(plugin.path), snapshot.modified)
+
+
+class TestParseMappingFile(testtools.TestCase):
+
+    def setUp(self):
+        super(TestParseMappingFile, self).setUp()
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        self.path = os.path.join(self.temp_dir, 'data.csv')
+
+    def test_parse(self):
+        """
+        Test that a mapping file is parsed correctly.
+        """
+        with open(self.path, 'w') as f:
+            f.write("John,  Male\n")
+            f.write("\n")
+            f.write("# This is a comment.\n")
+            f.write("  Jane,Female\n")
+
+        result = plugins.parse_mapping_file(self.path)
+
+        self.assertEqual([['John', 'Male'], ['Jane', 'Female']], result)
+
+    def test_parse_with_groups(self):
+        """
+        Test that a mapping file with a group section is parsed into
+        effective memberships.
+        """
+        with open(self.path, 'w') as f:
+            f.write("John,Male\n")
+            f.write("[groups]\n")
+            f.write("Male,Human\n")
+            f.write("Female,Human\n")
+            f.write("[users]\n")
+            f.write("Jane,Female\n")
+            f.write("Jane,Human\n")
+
+        result = plugins.parse_mapping_file(self.path)
+
+        self.assertEqual(
+            [
+                ['John', 'Human'],
+                ['John', 'Male'],
+                ['Jane', 'Female'],
+                ['Jane', 'Human']
+            ],
+            result
+        )
+
+    def test_parse_with_bad_data(self):
+        """
+        Test that the right error is raised for an invalid mapping file.
+        """
+        with open(self.path, 'w') as f:
+            f.write("John,Male\n")
+            f.write("JaneFemale\n")
+
+        self.assertRaisesRegex(
+            ValueError,
+            "Invalid entry on line 2.",
+            plugins.parse_mapping_file,
+            self.path
+        )
+
+    def test_parse_cancelled(self):
+        """
+        Test that a mapping file parse can be cancelled.
+        """
+        with open(self.path, 'w') as f:
+            f.write("John,Male\n")
+
+        self.assertRaises(
+            plugins.ReloadCancelled,
+            plugins.parse_mapping_file,
+            self.path,
+            lambda: True
+        )
+
+
+class TestWatchPlugin(testtools.TestCase):
+
+    def setUp(self):
+        super(TestWatchPlugin, self).setUp()
+
+    def test_start_and_stop(self):
+        """
+        Test that a WatchPlugin runs its server while the engine runs, and
+        that the server hears about every published snapshot meanwhile.
+        """
+        controller = controllers.MainController()
+        plugin = plugins.WatchPlugin(cherrypy.engine, controller)
+        plugin.bus = mock.MagicMock(spec=cherrypy.engine)
+
+        plugin.start()
+        self.assertIsNotNone(plugin.server.address)
+        self.assertEqual([plugin.server.notify], controller._listeners)
+        plugin.bus.log.assert_called_once_with(
+            "Started watch server on {}:{}.".format(*plugin.server.address)
+        )
+
+        plugin.stop()
+        self.assertIsNone(plugin.server.address)
+        self.assertEqual([], controller._listeners)
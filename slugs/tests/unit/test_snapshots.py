@@ -0,0 +1,795 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import testtools
+
+from slugs import snapshots
+
+
+class TestSnapshot(testtools.TestCase):
+
+    def setUp(self):
+        super(TestSnapshot, self).setUp()
+
+    def test_init(self):
+        """
+        Test that an empty Snapshot can be built without error.
+        """
+        snapshot = snapshots.Snapshot()
+
+        self.assertEqual({}, snapshot.users)
+        self.assertEqual({}, snapshot.groups)
+
+    def test_init_with_data(self):
+        """
+        Test that a Snapshot builds both membership mappings from a list of
+        user/group pairs, removing duplicate entries.
+        """
+        snapshot = snapshots.Snapshot(
+            [
+                ['Adam', 'Male'],
+                ['Eve', 'Female'],
+                ['Adam', 'Human'],
+                ['Eve', 'Human'],
+                ['Adam', 'Human']
+            ]
+        )
+
+        self.assertEqual(2, len(snapshot.users.keys()))
+        self.assertEqual(
+            ['Human', 'Male'],
+            sorted(snapshot.users.get('Adam'))
+        )
+        self.assertEqual(
+            ['Female', 'Human'],
+            sorted(snapshot.users.get('Eve'))
+        )
+
+        self.assertEqual(3, len(snapshot.groups.keys()))
+        self.assertEqual(['Adam'], snapshot.groups.get('Male'))
+        self.assertEqual(['Eve'], snapshot.groups.get('Female'))
+        self.assertEqual(
+            ['Adam', 'Eve'],
+            sorted(snapshot.groups.get('Human'))
+        )
+
+    def test_apply(self):
+        """
+        Test that applying a delta builds a new Snapshot, sharing untouched
+        entries and leaving the original Snapshot unchanged.
+        """
+        original = snapshots.Snapshot(
+            [
+                ['Adam', 'Male'],
+                ['Eve', 'Female'],
+                ['Adam', 'Human'],
+                ['Eve', 'Human']
+            ]
+        )
+
+        snapshot = original.apply(
+            added=[('Cain', 'Male'), ('Cain', 'Human')],
+            removed=[('Eve', 'Female'), ('Eve', 'Human')]
+        )
+
+        self.assertEqual(['Adam', 'Cain'], sorted(snapshot.users.keys()))
+        self.assertIs(
+            original.user_adjacency._targets,
+            snapshot.user_adjacency._targets
+        )
+        self.assertEqual(['Human', 'Male'], snapshot.users['Adam'])
+        self.assertEqual(
+            ['Human', 'Male'],
+            sorted(snapshot.users.get('Cain'))
+        )
+        self.assertEqual(['Human', 'Male'], sorted(snapshot.groups.keys()))
+        self.assertEqual(
+            ['Adam', 'Cain'],
+            sorted(snapshot.groups.get('Human'))
+        )
+
+        self.assertEqual(['Adam', 'Eve'], sorted(original.users.keys()))
+        self.assertEqual(
+            ['Female', 'Human', 'Male'],
+            sorted(original.groups.keys())
+        )
+
+    def test_generation(self):
+        """
+        Test that every Snapshot gets a higher generation number than the
+        Snapshots built before it.
+        """
+        first = snapshots.Snapshot()
+        second = snapshots.Snapshot([['Adam', 'Male']])
+        third = second.apply(added=[('Eve', 'Female')])
+
+        self.assertLess(first.generation, second.generation)
+        self.assertLess(second.generation, third.generation)
+
+    def test_epoch(self):
+        """
+        Test that a Snapshot built by applying a delta keeps the epoch of
+        the Snapshot it was built from.
+        """
+        snapshot = snapshots.Snapshot([['Adam', 'Male']])
+        delta = snapshot.apply(added=[('Eve', 'Female')])
+
+        self.assertEqual(snapshot.generation, snapshot.epoch)
+        self.assertEqual(snapshot.epoch, delta.epoch)
+        self.assertNotEqual(snapshot.epoch, snapshots.Snapshot().epoch)
+
+    def test_modified(self):
+        """
+        Test that a Snapshot keeps the modification time it was built with.
+        """
+        self.assertIsNone(snapshots.Snapshot().modified)
+
+        snapshot = snapshots.Snapshot([['Adam', 'Male']], modified=10.0)
+        self.assertEqual(10.0, snapshot.modified)
+        self.assertIsNone(snapshot.apply(added=[('Eve', 'Female')]).modified)
+        self.assertEqual(
+            20.0,
+            snapshot.apply(added=[('Eve', 'Female')], modified=20.0).modified
+        )
+
+    def test_apply_with_no_changes(self):
+        """
+        Test that applying an empty delta builds an equivalent Snapshot.
+        """
+        original = snapshots.Snapshot([['Adam', 'Male']])
+
+        snapshot = original.apply()
+
+        self.assertIsNot(original, snapshot)
+        self.assertEqual(original.users, snapshot.users)
+        self.assertEqual(original.groups, snapshot.groups)
+
+    def test_apply_with_unknown_names(self):
+        """
+        Test that removing unknown memberships from a Snapshot is a no-op.
+        """
+        original = snapshots.Snapshot([['Adam', 'Male']])
+
+        snapshot = original.apply(
+            removed=[('Adam', 'Female'), ('Eve', 'Male')]
+        )
+
+        self.assertEqual({'Adam': ['Male']}, snapshot.users)
+        self.assertEqual({'Male': ['Adam']}, snapshot.groups)
+        self.assertIs(
+            original.user_adjacency.names,
+            snapshot.user_adjacency.names
+        )
+
+    def test_is_member(self):
+        """
+        Test that a Snapshot checks memberships correctly.
+        """
+        snapshot = snapshots.Snapshot(
+            [
+                ['Adam', 'Male'],
+                ['Eve', 'Female'],
+                ['Adam', 'Human'],
+                ['Eve', 'Human']
+            ]
+        ).apply(added=[('Cain', 'Male')], removed=[('Eve', 'Female')])
+
+        self.assertTrue(snapshot.is_member('Adam', 'Male'))
+        self.assertTrue(snapshot.is_member('Adam', 'Human'))
+        self.assertTrue(snapshot.is_member('Cain', 'Male'))
+        self.assertTrue(snapshot.is_member('Eve', 'Human'))
+        self.assertFalse(snapshot.is_member('Eve', 'Female'))
+        self.assertFalse(snapshot.is_member('Eve', 'Male'))
+        self.assertFalse(snapshot.is_member('invalid', 'Male'))
+        self.assertFalse(snapshot.is_member('Adam', 'invalid'))
+
+    def test_is_member_with_long_rows(self):
+        """
+        Test that a Snapshot checks memberships between a user and a group
+        that both have long rows.
+        """
+        pairs = [['Adam', 'Group{}'.format(i)] for i in range(500)]
+        pairs += [['User{}'.format(i), 'Group7'] for i in range(500)]
+        snapshot = snapshots.Snapshot(pairs)
+        self.assertIsNotNone(snapshot.user_adjacency.bitmap(0))
+
+        self.assertTrue(snapshot.is_member('Adam', 'Group7'))
+        self.assertTrue(snapshot.is_member('User42', 'Group7'))
+        self.assertFalse(snapshot.is_member('User42', 'Group8'))
+
+    def test_select_users(self):
+        """
+        Test that users are selected by group set expressions.
+        """
+        snapshot = snapshots.Snapshot(
+            [
+                ['Adam', 'Male'],
+                ['Adam', 'Human'],
+                ['Cain', 'Male'],
+                ['Cain', 'Human'],
+                ['Cain', 'Farmer'],
+                ['Eve', 'Female'],
+                ['Eve', 'Human']
+            ]
+        )
+        names = snapshot.user_adjacency.names
+
+        def select(**kwargs):
+            return [names[i] for i in snapshot.select_users(**kwargs)]
+
+        self.assertEqual(['Adam', 'Cain', 'Eve'], select())
+        self.assertEqual(['Adam', 'Cain'], select(all_of=['Human', 'Male']))
+        self.assertEqual(['Adam'], select(all_of=['Male'], none_of=['Farmer']))
+        self.assertEqual(
+            ['Cain', 'Eve'],
+            select(any_of=['Female', 'Farmer', 'invalid'])
+        )
+        self.assertEqual(
+            ['Eve'],
+            select(all_of=['Human'], any_of=['Female', 'Farmer'],
+                   none_of=['Male'])
+        )
+        self.assertEqual(['Eve'], select(none_of=['Male', 'invalid']))
+        self.assertEqual([], select(all_of=['Human', 'invalid']))
+        self.assertEqual([], select(any_of=['invalid']))
+        self.assertEqual(['Cain', 'Eve'], select(all_of=['Human'], start=1))
+
+    def test_select_users_with_long_rows(self):
+        """
+        Test that users are selected correctly when the required rows are
+        long enough to be intersected as bitmaps.
+        """
+        pairs = [['User{:04}'.format(i), 'Even'] for i in range(0, 3000, 2)]
+        pairs += [
+            ['User{:04}'.format(i), 'Triple'] for i in range(0, 3000, 3)
+        ]
+        pairs += [['User{:04}'.format(i), 'Odd'] for i in range(1, 3000, 2)]
+        snapshot = snapshots.Snapshot(pairs)
+        names = snapshot.user_adjacency.names
+        self.assertEqual(3, len(snapshot.group_adjacency._bitmap_rows))
+
+        result = [
+            names[i] for i in snapshot.select_users(
+                all_of=['Even', 'Triple'],
+                start=6
+            )
+        ]
+        self.assertEqual(
+            ['User{:04}'.format(i) for i in range(6, 3000, 6)],
+            result
+        )
+        self.assertEqual(
+            [],
+            list(snapshot.select_users(all_of=['Even', 'Triple', 'Odd']))
+        )
+
+    def test_select_groups(self):
+        """
+        Test that groups are selected by user set expressions.
+        """
+        snapshot = snapshots.Snapshot(
+            [
+                ['Adam', 'Male'],
+                ['Adam', 'Human'],
+                ['Eve', 'Female'],
+                ['Eve', 'Human']
+            ]
+        )
+        names = snapshot.group_adjacency.names
+
+        self.assertEqual(
+            ['Human'],
+            [names[i] for i in snapshot.select_groups(all_of=['Adam', 'Eve'])]
+        )
+        self.assertEqual(
+            ['Male'],
+            [names[i] for i in snapshot.select_groups(any_of=['Adam'],
+                                                      none_of=['Eve'])]
+        )
+
+    def test_pairs(self):
+        """
+        Test that a Snapshot iterates over its memberships correctly.
+        """
+        snapshot = snapshots.Snapshot(
+            [
+                ['Eve', 'Female'],
+                ['Adam', 'Male'],
+                ['Adam', 'Human']
+            ]
+        ).apply(added=[('Cain', 'Male')], removed=[('Eve', 'Female')])
+
+        self.assertEqual(
+            [('Adam', 'Human'), ('Adam', 'Male'), ('Cain', 'Male')],
+            list(snapshot.pairs())
+        )
+
+
+class TestAdjacency(testtools.TestCase):
+
+    def setUp(self):
+        super(TestAdjacency, self).setUp()
+
+        self.snapshot = snapshots.Snapshot(
+            [
+                ['Adam', 'Male'],
+                ['Eve', 'Female'],
+                ['Adam', 'Human'],
+                ['Eve', 'Human']
+            ]
+        )
+
+    def test_layout(self):
+        """
+        Test that an Adjacency interns names in sorted order and keeps sorted
+        rows in CSR arrays.
+        """
+        users = self.snapshot.user_adjacency
+        groups = self.snapshot.group_adjacency
+
+        self.assertEqual(['Adam', 'Eve'], users.names)
+        self.assertEqual(['Female', 'Human', 'Male'], groups.names)
+        self.assertEqual([0, 2, 4], list(users._offsets))
+        self.assertEqual([1, 2, 0, 1], list(users._targets))
+        self.assertEqual([0, 1, 3, 4], list(groups._offsets))
+        self.assertEqual([1, 0, 1, 0], list(groups._targets))
+        self.assertTrue(users.packed)
+        self.assertTrue(groups.packed)
+
+    def test_lookup(self):
+        """
+        Test that an Adjacency only finds present names.
+        """
+        users = self.snapshot.apply(
+            removed=[('Eve', 'Female'), ('Eve', 'Human')]
+        ).user_adjacency
+
+        self.assertEqual(0, users.lookup('Adam'))
+        self.assertIsNone(users.lookup('Eve'))
+        self.assertIsNone(users.lookup('invalid'))
+        self.assertEqual(1, len(users))
+        self.assertEqual([0], list(users))
+        self.assertFalse(users.packed)
+
+    def test_row_and_degree(self):
+        """
+        Test that an Adjacency serves rows and degrees from its CSR arrays
+        and its overrides.
+        """
+        snapshot = self.snapshot.apply(added=[('Cain', 'Male')])
+        users = snapshot.user_adjacency
+
+        self.assertEqual([1, 2], list(users.row(0)))
+        self.assertEqual(2, users.degree(0))
+        self.assertEqual([2], list(users.row(2)))
+        self.assertEqual(1, users.degree(2))
+        self.assertEqual([], list(users.row(3)))
+        self.assertEqual(0, users.degree(3))
+
+    def test_page(self):
+        """
+        Test that an Adjacency pages through its present IDs in ID order.
+        """
+        users = self.snapshot.apply(
+            added=[('Cain', 'Male'), ('Abel', 'Male')],
+            removed=[('Eve', 'Female'), ('Eve', 'Human')]
+        ).user_adjacency
+
+        self.assertEqual(['Adam', 'Eve', 'Abel', 'Cain'], users.names)
+        self.assertEqual(([0, 2], 3), users.page(0, 2))
+        self.assertEqual(([2, 3], None), users.page(1, 2))
+        self.assertEqual(([3], None), users.page(3, 2))
+        self.assertEqual(([], None), users.page(4, 2))
+
+    def test_row_page(self):
+        """
+        Test that an Adjacency pages through a row in ID order.
+        """
+        groups = self.snapshot.group_adjacency
+
+        ids, start = groups.row_page(1, 0, 1)
+        self.assertEqual([0], list(ids))
+        self.assertEqual(1, start)
+
+        ids, start = groups.row_page(1, 1, 1)
+        self.assertEqual([1], list(ids))
+        self.assertIsNone(start)
+
+        ids, start = groups.row_page(1, 2, 1)
+        self.assertEqual([], list(ids))
+        self.assertIsNone(start)
+
+    def test_order(self):
+        """
+        Test that an Adjacency orders its IDs by name, sharing the order
+        while its name table is unchanged.
+        """
+        users = self.snapshot.user_adjacency
+        self.assertEqual([0, 1], list(users.order()))
+
+        delta = self.snapshot.apply(removed=[('Eve', 'Female')])
+        self.assertIs(users.order(), delta.user_adjacency.order())
+
+        delta = self.snapshot.apply(added=[('Abel', 'Male')])
+        self.assertEqual(['Adam', 'Eve', 'Abel'], delta.user_adjacency.names)
+        self.assertEqual([2, 0, 1], list(delta.user_adjacency.order()))
+
+    def test_search(self):
+        """
+        Test that an Adjacency finds present names by prefix and substring,
+        in name order.
+        """
+        groups = self.snapshot.apply(
+            added=[('Adam', 'Humane'), ('Eve', 'Femme')],
+            removed=[('Eve', 'Female')]
+        ).group_adjacency
+        names = groups.names
+
+        def search(**kwargs):
+            return [names[i] for i in groups.search(**kwargs)]
+
+        self.assertEqual(['Femme', 'Human', 'Humane', 'Male'], search())
+        self.assertEqual(['Human', 'Humane'], search(prefix='Hu'))
+        self.assertEqual(['Human'], search(prefix='Hu', limit=1))
+        self.assertEqual(['Femme'], search(prefix='Fe'))
+        self.assertEqual([], search(prefix='Z'))
+        self.assertEqual(['Human', 'Humane'], search(contains='uma'))
+        self.assertEqual(['Femme', 'Humane', 'Male'], search(contains='e'))
+        self.assertEqual(['Humane'], search(prefix='H', contains='ane'))
+        self.assertEqual([], search(contains='emal'))
+        self.assertEqual([], search(contains='xyz'))
+
+    def test_contains(self):
+        """
+        Test that an Adjacency checks rows stored as arrays and rows stored
+        as bitmaps.
+        """
+        pairs = [['Adam', 'Group{:03}'.format(i)] for i in range(500)]
+        pairs += [['Eve', 'Group050']]
+        users = snapshots.Snapshot(pairs).user_adjacency
+
+        self.assertTrue(users.contains(1, 50))
+        self.assertFalse(users.contains(1, 49))
+        self.assertIsNone(users.bitmap(1))
+
+        self.assertTrue(users.contains(0, 499))
+        self.assertFalse(users.contains(0, 500))
+        self.assertEqual(list(range(500)), list(users.bitmap(0)))
+
+    def test_bitmap_rows(self):
+        """
+        Test that an Adjacency stores rows longer than its threshold only as
+        bitmaps, and serves them like any other row.
+        """
+        pairs = [['Adam', 'Group{:03}'.format(i)] for i in range(0, 1000, 2)]
+        pairs += [['Eve', 'Group050']]
+        users = snapshots.Snapshot(pairs).user_adjacency
+
+        self.assertEqual(365, users.threshold)
+        self.assertEqual([0], list(users._bitmap_rows.keys()))
+        self.assertEqual([0, 0, 1], list(users._offsets))
+        self.assertEqual([25], list(users._targets))
+
+        self.assertEqual(500, users.degree(0))
+        self.assertEqual(list(range(500)), list(users.row(0)))
+        self.assertEqual(([10, 11], 12), users.row_page(0, 10, 2))
+        self.assertEqual(([499], None), users.row_page(0, 499, 2))
+        self.assertEqual(([], None), users.row_page(0, 500, 2))
+
+        offsets, targets = users.csr()
+        self.assertEqual([0, 500, 501], list(offsets))
+        self.assertEqual(list(range(500)) + [25], list(targets))
+
+    def test_bitmap_threshold(self):
+        """
+        Test that the bitmap threshold grows with the number of IDs on the
+        other side.
+        """
+        self.assertEqual(365, snapshots._bitmap_threshold(0))
+        self.assertEqual(365, snapshots._bitmap_threshold(65535))
+        self.assertEqual(425, snapshots._bitmap_threshold(65536))
+        self.assertEqual(1265, snapshots._bitmap_threshold(1000000))
+
+    def test_intern(self):
+        """
+        Test that an Adjacency only copies its name table for new names.
+        """
+        users = self.snapshot.user_adjacency
+
+        names, ids = users.intern(['Adam'])
+        self.assertIs(users.names, names)
+
+        names, ids = users.intern(['Seth', 'Cain', 'Adam'])
+        self.assertEqual(['Adam', 'Eve', 'Cain', 'Seth'], names)
+        self.assertEqual({'Adam': 0, 'Eve': 1, 'Cain': 2, 'Seth': 3}, ids)
+        self.assertEqual(['Adam', 'Eve'], users.names)
+
+    def test_compact(self):
+        """
+        Test that compacting an Adjacency folds its overrides back into the
+        CSR arrays without changing any IDs.
+        """
+        snapshot = self.snapshot.apply(
+            added=[('Cain', 'Male')],
+            removed=[('Adam', 'Human')]
+        )
+        users = snapshot.user_adjacency.compact()
+
+        self.assertEqual({}, users._overrides)
+        self.assertEqual([0, 1, 3, 4], list(users._offsets))
+        self.assertEqual([2, 0, 1, 2], list(users._targets))
+        self.assertEqual(['Adam', 'Eve', 'Cain'], users.names)
+        self.assertEqual(3, len(users))
+
+    def test_update_compacts(self):
+        """
+        Test that an Adjacency compacts itself once enough rows have been
+        overridden.
+        """
+        users = self.snapshot.user_adjacency
+        names, ids = users.intern(
+            ['User{}'.format(i) for i in range(5000)]
+        )
+        changes = dict(
+            [(ids['User{}'.format(i)], set([0])) for i in range(5000)]
+        )
+
+        result = users.update(names, ids, changes)
+
+        self.assertEqual({}, result._overrides)
+        self.assertEqual(5002, len(result))
+        self.assertEqual([0], list(result.row(ids['User4999'])))
+
+    def test_update_with_long_rows(self):
+        """
+        Test that an Adjacency lays out rows changed by a delta by length,
+        and picks a new threshold when compacting.
+        """
+        groups = self.snapshot.group_adjacency
+        names, ids = groups.intern(['Robot'])
+        changes = {
+            ids['Human']: set(range(400)),
+            ids['Robot']: set([0])
+        }
+
+        result = groups.update(names, ids, changes)
+
+        self.assertIsNotNone(result.bitmap(ids['Human']))
+        self.assertIsNone(result.bitmap(ids['Robot']))
+        self.assertEqual(400, result.degree(ids['Human']))
+        self.assertTrue(result.contains(ids['Human'], 399))
+
+        result = result.compact(universe=70000)
+
+        self.assertEqual(425, result.threshold)
+        self.assertEqual({}, result._overrides)
+        self.assertIsNone(result.bitmap(ids['Human']))
+        self.assertEqual(list(range(400)), list(result.row(ids['Human'])))
+
+
+class TestSnapshotFiles(testtools.TestCase):
+
+    def setUp(self):
+        super(TestSnapshotFiles, self).setUp()
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        self.path = os.path.join(self.temp_dir, 'snapshot.slugs')
+
+    def dump(self, snapshot):
+        with open(self.path, 'wb') as f:
+            snapshots.dump(snapshot, f)
+
+    def test_dump_and_load(self):
+        """
+        Test that a Snapshot survives a round trip through a compiled
+        snapshot file.
+        """
+        name = u'Jos\xe9'
+        if bytes is str:
+            name = name.encode('utf-8')
+        self.dump(
+            snapshots.Snapshot(
+                [
+                    [u'Adam', u'Male'],
+                    [u'Eve', u'Female'],
+                    [u'Adam', u'Human'],
+                    [u'Eve', u'Human'],
+                    [name, u'Human']
+                ]
+            )
+        )
+
+        self.assertTrue(snapshots.is_snapshot_file(self.path))
+        snapshot = snapshots.load(self.path)
+
+        self.assertEqual(
+            {
+                u'Adam': [u'Human', u'Male'],
+                u'Eve': [u'Female', u'Human'],
+                name: [u'Human']
+            },
+            snapshot.users
+        )
+        self.assertEqual(
+            {
+                u'Female': [u'Eve'],
+                u'Human': [u'Adam', u'Eve', name],
+                u'Male': [u'Adam']
+            },
+            snapshot.groups
+        )
+
+    def test_dump_and_load_non_ascii_names(self):
+        """
+        Test that non-ASCII native string names, as parsed from a mapping
+        file, survive a round trip through a compiled snapshot file.
+        """
+        name = u'Jos\xe9'
+        if bytes is str:
+            name = name.encode('utf-8')
+        self.dump(snapshots.Snapshot([[name, 'Human'], ['Adam', 'Human']]))
+
+        snapshot = snapshots.load(self.path)
+
+        self.assertEqual(['Adam', name], snapshot.user_adjacency.names)
+        self.assertIsInstance(snapshot.user_adjacency.names[1], str)
+        self.assertTrue(snapshot.is_member(name, 'Human'))
+        self.assertEqual({'Human': ['Adam', name]}, snapshot.groups)
+
+    def test_dump_and_load_after_delta(self):
+        """
+        Test that a Snapshot with applied deltas is repacked when written to
+        a compiled snapshot file.
+        """
+        original = snapshots.Snapshot(
+            [[u'Eve', u'Female'], [u'Adam', u'Male']]
+        )
+        self.dump(
+            original.apply(
+                added=[(u'Cain', u'Male')],
+                removed=[(u'Eve', u'Female')]
+            )
+        )
+
+        snapshot = snapshots.load(self.path)
+
+        self.assertEqual([u'Adam', u'Cain'], snapshot.user_adjacency.names)
+        self.assertEqual([u'Male'], snapshot.group_adjacency.names)
+        self.assertEqual({u'Male': [u'Adam', u'Cain']}, snapshot.groups)
+
+    def test_dump_and_load_with_long_rows(self):
+        """
+        Test that rows stored as bitmaps are written out in full, and read
+        back into bitmaps.
+        """
+        pairs = [[u'User{:03}'.format(i), u'Human'] for i in range(400)]
+        pairs += [[u'User000', u'Male']]
+        self.dump(snapshots.Snapshot(pairs))
+
+        snapshot = snapshots.load(self.path)
+        groups = snapshot.group_adjacency
+
+        self.assertIsNotNone(groups.bitmap(0))
+        self.assertEqual(list(range(400)), list(groups.row(0)))
+        self.assertEqual([0], list(groups.row(1)))
+        self.assertTrue(snapshot.is_member(u'User399', u'Human'))
+        self.assertEqual(401, len(list(snapshot.pairs())))
+
+    def test_load_is_memory_mapped(self):
+        """
+        Test that a loaded Snapshot serves its arrays from the mapped file.
+        """
+        if not hasattr(memoryview, 'cast') or sys.byteorder != 'little':
+            self.skipTest("memoryview casting is not available")
+
+        self.dump(snapshots.Snapshot([[u'Adam', u'Male']]))
+
+        snapshot = snapshots.load(self.path)
+
+        self.assertIsInstance(snapshot.user_adjacency._targets, memoryview)
+        self.assertEqual([0], list(snapshot.user_adjacency.row(0)))
+
+    def test_dump_and_load_empty(self):
+        """
+        Test that an empty Snapshot survives a round trip through a compiled
+        snapshot file.
+        """
+        self.dump(snapshots.Snapshot())
+
+        snapshot = snapshots.load(self.path)
+
+        self.assertEqual({}, snapshot.users)
+        self.assertEqual({}, snapshot.groups)
+
+    def test_dump_layout(self):
+        """
+        Test that every section of a compiled snapshot file is aligned.
+        """
+        f = io.BytesIO()
+        snapshots.dump(snapshots.Snapshot([[u'Adam', u'Male']]), f)
+        data = f.getvalue()
+
+        self.assertEqual(snapshots.MAGIC, data[:8])
+        self.assertEqual(b'Adam\0' + b'\0' * 3, data[32:40])
+        self.assertEqual(b'Male\0' + b'\0' * 3, data[40:48])
+        self.assertEqual(76, len(data))
+
+    def test_is_snapshot_file_with_csv(self):
+        """
+        Test that a CSV file is not mistaken for a compiled snapshot file.
+        """
+        with open(self.path, 'w') as f:
+            f.write("Adam,Male\n")
+
+        self.assertFalse(snapshots.is_snapshot_file(self.path))
+
+    def test_load_invalid(self):
+        """
+        Test that the right errors are raised when loading an invalid
+        compiled snapshot file.
+        """
+        open(self.path, 'wb').close()
+        self.assertRaisesRegex(
+            ValueError,
+            "Snapshot file is empty.",
+            snapshots.load,
+            self.path
+        )
+
+        with open(self.path, 'wb') as f:
+            f.write(b'Adam,Male\n')
+        self.assertRaisesRegex(
+            ValueError,
+            "Snapshot file is truncated.",
+            snapshots.load,
+            self.path
+        )
+
+        with open(self.path, 'wb') as f:
+            f.write(b'Adam,Male\n' * 4)
+        self.assertRaisesRegex(
+            ValueError,
+            "Snapshot file has an invalid header.",
+            snapshots.load,
+            self.path
+        )
+
+        self.dump(snapshots.Snapshot([[u'Adam', u'Male']]))
+        with open(self.path, 'r+b') as f:
+            f.seek(8)
+            f.write(b'\x02')
+        self.assertRaisesRegex(
+            ValueError,
+            "Snapshot file version 2 is not supported.",
+            snapshots.load,
+            self.path
+        )
+
+        self.dump(snapshots.Snapshot([[u'Adam', u'Male']]))
+        with open(self.path, 'r+b') as f:
+            f.truncate(60)
+        self.assertRaisesRegex(
+            ValueError,
+            "Snapshot file is truncated.",
+            snapshots.load,
+            self.path
+        )
@@ -0,0 +1,209 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import cherrypy
+import mock
+import testtools
+
+from cherrypy import _cprequest
+from cherrypy.lib import httputil
+
+from slugs import controllers
+from slugs import tools
+
+
+class TestConditional(testtools.TestCase):
+
+    def setUp(self):
+        super(TestConditional, self).setUp()
+
+        self.controller = controllers.MainController()
+        self.controller.update([['John', 'Male']], modified=1500000000.0)
+
+        request = cherrypy.serving.request
+        response = cherrypy.serving.response
+        self.addCleanup(setattr, request, 'app', request.app)
+        self.addCleanup(setattr, request, 'method', request.method)
+        self.addCleanup(setattr, request, 'headers', request.headers)
+        self.addCleanup(setattr, request, 'hooks', request.hooks)
+        self.addCleanup(setattr, response, 'headers', response.headers)
+        self.addCleanup(setattr, response, 'status', response.status)
+
+        request.app = mock.MagicMock(root=self.controller)
+        request.method = 'GET'
+        request.headers = httputil.HeaderMap()
+        request.hooks = _cprequest.HookMap(_cprequest.hookpoints)
+        response.headers = httputil.HeaderMap()
+        response.status = None
+
+    def respond(self, etag=None, status=None):
+        """
+        Run the conditional tool around a page handler serving the given
+        entity tag and status.
+        """
+        request = cherrypy.serving.request
+        request.hooks = _cprequest.HookMap(_cprequest.hookpoints)
+        tools.conditional()
+        response = cherrypy.serving.response
+        if etag is not None:
+            response.headers['ETag'] = etag
+        response.status = status
+        request.hooks.run('before_finalize')
+
+    def test_entity_tag(self):
+        """
+        Test that entity tags are unique to a snapshot generation.
+        """
+        first = tools.entity_tag(self.controller.snapshot)
+        self.controller.update([['John', 'Male']])
+        second = tools.entity_tag(self.controller.snapshot)
+
+        self.assertTrue(first.startswith('"'))
+        self.assertTrue(first.endswith('"'))
+        self.assertNotEqual(first, second)
+
+    def test_conditional(self):
+        """
+        Test that the validators for the current snapshot are set on an
+        unconditional request.
+        """
+        tools.conditional()
+
+        headers = cherrypy.serving.response.headers
+        self.assertEqual(
+            tools.entity_tag(self.controller.snapshot),
+            headers['ETag']
+        )
+        self.assertEqual(
+            'Fri, 14 Jul 2017 02:40:00 GMT',
+            headers['Last-Modified']
+        )
+        self.assertEqual('Accept, Accept-Encoding', headers['Vary'])
+
+    def test_variant_tag(self):
+        """
+        Test that other representations get their own entity tags.
+        """
+        etag = tools.entity_tag(self.controller.snapshot)
+        gzip_etag = tools.variant_tag(etag, 'gzip')
+        cbor_etag = tools.variant_tag(etag, 'cbor')
+
+        self.assertNotEqual(etag, gzip_etag)
+        self.assertNotEqual(gzip_etag, cbor_etag)
+        self.assertTrue(gzip_etag.startswith(etag[:-1]))
+        self.assertTrue(gzip_etag.endswith('-gzip"'))
+        self.assertTrue(cbor_etag.endswith('-cbor"'))
+
+    def test_conditional_with_unknown_modification_time(self):
+        """
+        Test that no Last-Modified header is set when the snapshot has no
+        modification time.
+        """
+        self.controller.update([['John', 'Male']])
+
+        tools.conditional()
+
+        self.assertNotIn('Last-Modified', cherrypy.serving.response.headers)
+
+    def test_conditional_with_matching_etag(self):
+        """
+        Test that a request with a matching If-None-Match header is answered
+        with a 304 once the page handler has run.
+        """
+        etag = tools.entity_tag(self.controller.snapshot)
+        headers = cherrypy.serving.request.headers
+        for value in [etag, '"other", W/' + etag, '*']:
+            headers['If-None-Match'] = value
+            e = self.assertRaises(cherrypy.HTTPRedirect, self.respond)
+            self.assertEqual(304, e.status)
+
+        variant = tools.variant_tag(tools.variant_tag(etag, 'cbor'), 'gzip')
+        headers['If-None-Match'] = variant
+        e = self.assertRaises(cherrypy.HTTPRedirect, self.respond, variant)
+        self.assertEqual(304, e.status)
+
+    def test_conditional_with_other_variant(self):
+        """
+        Test that a tag only matches the representation it was served with.
+        """
+        etag = tools.entity_tag(self.controller.snapshot)
+        gzip_etag = tools.variant_tag(etag, 'gzip')
+        cbor_etag = tools.variant_tag(etag, 'cbor')
+        headers = cherrypy.serving.request.headers
+
+        headers['If-None-Match'] = gzip_etag
+        self.respond()
+        self.respond(cbor_etag)
+
+        headers['If-None-Match'] = etag
+        self.respond(gzip_etag)
+
+    def test_conditional_with_missing_resource(self):
+        """
+        Test that a request for a resource that does not exist is never
+        answered with a 304.
+        """
+        request = cherrypy.serving.request
+        request.headers['If-None-Match'] = tools.entity_tag(
+            self.controller.snapshot
+        )
+        self.respond(status='404 Not Found')
+
+        del request.headers['If-None-Match']
+        request.headers['If-Modified-Since'] = 'Fri, 14 Jul 2017 02:40:00 GMT'
+        self.respond(status=404)
+
+    def test_conditional_with_stale_etag(self):
+        """
+        Test that a request with an outdated If-None-Match header is passed
+        on, even if its If-Modified-Since header is current.
+        """
+        etag = tools.entity_tag(self.controller.snapshot)
+        self.controller.update(added=[('Jane', 'Female')])
+
+        request = cherrypy.serving.request
+        request.headers['If-None-Match'] = etag
+        request.headers['If-Modified-Since'] = 'Fri, 14 Jul 2017 02:40:00 GMT'
+
+        self.respond()
+
+    def test_conditional_with_if_modified_since(self):
+        """
+        Test that If-Modified-Since is compared against the modification
+        time of the snapshot.
+        """
+        request = cherrypy.serving.request
+
+        request.headers['If-Modified-Since'] = 'Fri, 14 Jul 2017 02:40:00 GMT'
+        e = self.assertRaises(cherrypy.HTTPRedirect, self.respond)
+        self.assertEqual(304, e.status)
+
+        request.headers['If-Modified-Since'] = 'Fri, 14 Jul 2017 02:39:59 GMT'
+        self.respond()
+
+        request.headers['If-Modified-Since'] = 'invalid'
+        self.respond()
+
+    def test_conditional_with_post(self):
+        """
+        Test that requests other than GET and HEAD are left alone.
+        """
+        request = cherrypy.serving.request
+        request.method = 'POST'
+        request.headers['If-None-Match'] = '*'
+
+        tools.conditional()
+
+        self.assertNotIn('ETag', cherrypy.serving.response.headers)
@@ -0,0 +1,337 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import errno
+import json
+import mock
+import socket
+import testtools
+import threading
+
+from slugs import controllers
+from slugs import snapshots
+from slugs import watch
+
+
+class TestParsers(testtools.TestCase):
+
+    def setUp(self):
+        super(TestParsers, self).setUp()
+
+    def test_parse_since(self):
+        """
+        Test that the since parameter is validated correctly.
+        """
+        self.assertIsNone(watch.parse_since(None))
+        self.assertEqual(7, watch.parse_since('7'))
+        for value in ('-1', 'invalid'):
+            e = self.assertRaises(watch.WatchError, watch.parse_since, value)
+            self.assertEqual(400, e.status)
+            self.assertEqual("Since must be a generation number.", str(e))
+
+    def test_parse_timeout(self):
+        """
+        Test that the timeout parameter is validated correctly.
+        """
+        self.assertEqual(watch.DEFAULT_TIMEOUT, watch.parse_timeout(None))
+        self.assertEqual(5, watch.parse_timeout('5'))
+        for value in ('0', str(watch.MAX_TIMEOUT + 1), 'invalid'):
+            self.assertRaisesRegex(
+                watch.WatchError,
+                "Timeout must be an integer between 1 and 300.",
+                watch.parse_timeout,
+                value
+            )
+
+    def test_parse_delta(self):
+        """
+        Test that the delta parameter is validated correctly.
+        """
+        self.assertFalse(watch.parse_delta(None))
+        self.assertFalse(watch.parse_delta('false'))
+        self.assertTrue(watch.parse_delta('true'))
+        self.assertRaisesRegex(
+            watch.WatchError,
+            "Delta must be 'true' or 'false'.",
+            watch.parse_delta,
+            'yes'
+        )
+
+
+class TestWatchServer(testtools.TestCase):
+
+    def setUp(self):
+        super(TestWatchServer, self).setUp()
+
+        self.controller = controllers.MainController()
+        self.controller.update([('Adam', 'Male'), ('Eve', 'Female')])
+        self.generation = self.controller.snapshot.generation
+
+        self.server = watch.WatchServer(self.controller)
+        self.server.start()
+        self.controller.add_listener(self.server.notify)
+        self.addCleanup(self.server.stop)
+        self.addCleanup(self.controller.remove_listener, self.server.notify)
+
+    def request(self, target, headers=()):
+        sock = socket.create_connection(self.server.address, timeout=10)
+        self.addCleanup(sock.close)
+        lines = ['GET {} HTTP/1.1'.format(target), 'Host: localhost']
+        lines.extend('{}: {}'.format(k, v) for k, v in headers)
+        sock.sendall('\r\n'.join(lines).encode('ascii') + b'\r\n\r\n')
+        return sock
+
+    def read_response(self, sock):
+        data = b''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        head, body = data.split(b'\r\n\r\n', 1)
+        status = int(head.split(b' ')[1])
+        return status, head.decode('latin-1'), body
+
+    def read_event(self, sock, buffer):
+        while b'\n\n' not in buffer[0]:
+            chunk = sock.recv(4096)
+            self.assertNotEqual(b'', chunk)
+            buffer[0] += chunk
+        event, buffer[0] = buffer[0].split(b'\n\n', 1)
+        return event.decode('utf-8')
+
+    def test_init(self):
+        """
+        Test that a WatchServer listens on a free port when none is given.
+        """
+        self.assertEqual('127.0.0.1', self.server.address[0])
+        self.assertNotEqual(0, self.server.address[1])
+
+    @mock.patch('slugs.watch.selectors', None)
+    def test_init_unsupported(self):
+        """
+        Test that the right error is raised when the watch server is not
+        supported.
+        """
+        self.assertFalse(watch.is_supported())
+        self.assertRaisesRegex(
+            ValueError,
+            "The watch server is not supported on this platform.",
+            watch.WatchServer,
+            self.controller
+        )
+
+    def test_poll_outdated(self):
+        """
+        Test that a long poll from an older generation is answered at once.
+        """
+        sock = self.request(
+            '/slugs/watch?since={}&delta=true'.format(self.generation - 1)
+        )
+
+        status, head, body = self.read_response(sock)
+
+        self.assertEqual(200, status)
+        self.assertIn('Content-Type: application/json', head)
+        self.assertEqual(
+            {
+                'generation': self.generation,
+                'instance': snapshots.INSTANCE,
+                'changed': True,
+                'resync': True
+            },
+            json.loads(body.decode('utf-8'))
+        )
+
+    def test_poll_waits_for_change(self):
+        """
+        Test that a long poll blocks until the next generation is published.
+        """
+        sock = self.request(
+            '/slugs/watch?since={}&delta=true'.format(self.generation)
+        )
+        timer = threading.Timer(
+            0.2,
+            self.controller.update,
+            kwargs={'added': [('Eve', 'Human')]}
+        )
+        timer.start()
+        self.addCleanup(timer.join)
+
+        status, _, body = self.read_response(sock)
+
+        self.assertEqual(200, status)
+        self.assertEqual(
+            {
+                'generation': self.controller.snapshot.generation,
+                'instance': snapshots.INSTANCE,
+                'changed': True,
+                'resync': False,
+                'added': [['Eve', 'Human']],
+                'removed': []
+            },
+            json.loads(body.decode('utf-8'))
+        )
+
+    def test_poll_timeout(self):
+        """
+        Test that a long poll is answered when its timeout expires.
+        """
+        sock = self.request('/slugs/watch?timeout=1')
+
+        status, _, body = self.read_response(sock)
+
+        self.assertEqual(200, status)
+        self.assertEqual(
+            {
+                'generation': self.generation,
+                'instance': snapshots.INSTANCE,
+                'changed': False
+            },
+            json.loads(body.decode('utf-8'))
+        )
+
+    def test_stream(self):
+        """
+        Test that an event stream gets one event per published generation.
+        """
+        sock = self.request(
+            '/slugs/watch?delta=true',
+            [('Accept', 'text/event-stream')]
+        )
+        buffer = [b'']
+        head = self.read_event(sock, buffer)
+        self.assertIn('Content-Type: text/event-stream', head)
+        self.assertTrue(head.endswith('\r\n\r\n: watching'))
+
+        for pair in (('Eve', 'Human'), ('Adam', 'Human')):
+            self.controller.update(added=[pair])
+            event = self.read_event(sock, buffer).split('\n')
+            generation = self.controller.snapshot.generation
+            self.assertEqual('id: {}'.format(generation), event[0])
+            self.assertEqual('event: change', event[1])
+            message = json.loads(event[2][len('data: '):])
+            self.assertEqual(generation, message['generation'])
+            self.assertEqual([list(pair)], message['added'])
+
+    def test_stream_resumes_from_last_event_id(self):
+        """
+        Test that a reconnecting event stream picks up from its last event.
+        """
+        self.controller.update(added=[('Eve', 'Human')])
+
+        sock = self.request(
+            '/slugs/watch?delta=true',
+            [
+                ('Accept', 'text/event-stream'),
+                ('Last-Event-ID', str(self.generation))
+            ]
+        )
+        buffer = [b'']
+        self.read_event(sock, buffer)
+        event = self.read_event(sock, buffer).split('\n')
+
+        message = json.loads(event[2][len('data: '):])
+        self.assertEqual([['Eve', 'Human']], message['added'])
+
+    def test_invalid_requests(self):
+        """
+        Test that invalid watch requests are rejected.
+        """
+        cases = [
+            ('/slugs/users', 404, "Resource not found."),
+            ('/slugs/watch?since=invalid', 400,
+             "Since must be a generation number."),
+            ('/slugs/watch?delta=maybe', 400,
+             "Delta must be 'true' or 'false'.")
+        ]
+        for target, code, message in cases:
+            status, _, body = self.read_response(self.request(target))
+            self.assertEqual(code, status)
+            self.assertEqual(message, body.decode('utf-8'))
+
+        sock = socket.create_connection(self.server.address, timeout=10)
+        self.addCleanup(sock.close)
+        sock.sendall(b'POST /slugs/watch HTTP/1.1\r\n\r\n')
+        status, head, _ = self.read_response(sock)
+        self.assertEqual(405, status)
+        self.assertIn('Allow: GET', head)
+
+    @mock.patch('slugs.watch._ACCEPT_BACKOFF', 0.1)
+    def test_accept_errors(self):
+        """
+        Test that a WatchServer logs failures to accept a connection, backs
+        off when out of file descriptors, and keeps serving.
+        """
+        log = mock.MagicMock()
+        self.server._log = log
+        target = '/slugs/watch?since={}'.format(self.generation - 1)
+        errors = [
+            socket.error(errno.EMFILE, "Too many open files"),
+            socket.error(errno.ECONNABORTED, "Connection aborted")
+        ]
+        accept = socket.socket.accept
+
+        def flaky_accept(listener):
+            if errors:
+                raise errors.pop(0)
+            return accept(listener)
+
+        with mock.patch.object(
+                socket.socket,
+                'accept',
+                autospec=True,
+                side_effect=flaky_accept):
+            status, _, _ = self.read_response(self.request(target))
+
+        self.assertEqual(200, status)
+        self.assertEqual([], errors)
+        log.assert_any_call(
+            "Unable to accept watch connection: [Errno {}] Too many open "
+            "files. Pausing for 0.1 second(s).".format(errno.EMFILE)
+        )
+        log.assert_any_call(
+            "Unable to accept watch connection: [Errno {}] Connection "
+            "aborted".format(errno.ECONNABORTED)
+        )
+
+        status, _, _ = self.read_response(self.request(target))
+        self.assertEqual(200, status)
+
+    def test_connection_errors(self):
+        """
+        Test that a WatchServer logs an error on one connection, closes it,
+        and keeps serving the others.
+        """
+        log = mock.MagicMock()
+        self.server._log = log
+        target = '/slugs/watch?since={}'.format(self.generation - 1)
+
+        with mock.patch.object(
+                watch.WatchServer,
+                '_start',
+                side_effect=socket.error(errno.ECONNRESET, "Reset")):
+            sock = self.request(target)
+            self.assertEqual(b'', sock.recv(4096))
+
+        log.assert_called_once_with(
+            "Watch connection failed: [Errno {}] Reset".format(
+                errno.ECONNRESET
+            )
+        )
+        self.assertEqual(0, len(self.server))
+
+        status, _, _ = self.read_response(self.request(target))
+        self.assertEqual(200, status)
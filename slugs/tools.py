@@ -0,0 +1,155 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import cherrypy
+import email.utils
+
+from cherrypy.lib import httputil
+
+from slugs import snapshots
+
+
+# Any response may be served in another media type, or gzip-encoded,
+# depending on the request.
+VARY = 'Accept, Accept-Encoding'
+
+
+def entity_tag(snapshot):
+    """
+    Get the entity tag for every resource served from a snapshot.
+
+    The tag carries the process token as well as the generation, so a
+    restarted service never reuses an old tag.
+
+    Args:
+        snapshot (Snapshot): The snapshot the resources are served from.
+
+    Returns:
+        string: The quoted entity tag.
+    """
+    return '"{}-{}"'.format(snapshots.INSTANCE, snapshot.generation)
+
+
+def variant_tag(etag, variant):
+    """
+    Get the entity tag for another representation of a resource, such as a
+    different media type or a gzip-encoded body.
+
+    Args:
+        etag (string): The quoted entity tag of the resource.
+        variant (string): The name of the representation.
+
+    Returns:
+        string: The quoted entity tag of the representation.
+    """
+    return '{}-{}"'.format(etag[:-1], variant)
+
+
+def _parse_date(value):
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return email.utils.mktime_tz(parsed)
+
+
+def _matches(header, etag):
+    if header.strip() == '*':
+        return True
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def conditional():
+    """
+    Answer conditional requests for the current snapshot.
+
+    Sets the ETag and Last-Modified headers from the snapshot the
+    application root is serving. The page handler may replace the ETag
+    with the tag of the representation it serves (see variant_tag).
+    Requests whose If-None-Match or If-Modified-Since headers show the
+    client already holds that representation are answered with a 304 once
+    the handler has run, so resources that do not exist are never
+    answered with a 304.
+    """
+    request = cherrypy.serving.request
+    response = cherrypy.serving.response
+    if request.method not in ('GET', 'HEAD'):
+        return
+
+    snapshot = getattr(request.app.root, 'snapshot', None)
+    if snapshot is None:
+        return
+
+    etag = entity_tag(snapshot)
+    response.headers['ETag'] = etag
+    response.headers['Vary'] = VARY
+
+    if snapshot.modified is not None:
+        response.headers['Last-Modified'] = httputil.HTTPDate(
+            snapshot.modified
+        )
+
+    request.hooks.attach(
+        'before_finalize',
+        lambda: _not_modified(snapshot)
+    )
+
+
+def _not_modified(snapshot):
+    # Runs after the page handler, errors included, so only successful
+    # responses are compared, against the tag they are actually served
+    # with.
+    response = cherrypy.serving.response
+    status = httputil.valid_status(response.status)[0]
+    if not 200 <= status <= 299:
+        return
+    etag = response.headers.get('ETag')
+    if etag is not None and is_current(snapshot, etag):
+        raise cherrypy.HTTPRedirect([], 304)
+
+
+def is_current(snapshot, etag):
+    """
+    Check if the conditional headers of the request show the client already
+    holds the current data.
+
+    Args:
+        snapshot (Snapshot): The snapshot the resource is served from.
+        etag (string): The entity tag of the representation being served.
+
+    Returns:
+        bool: True if the request can be answered with a 304.
+    """
+    headers = cherrypy.serving.request.headers
+
+    # If-None-Match takes precedence; If-Modified-Since is only consulted
+    # when the client sent no entity tags.
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match is not None:
+        return _matches(if_none_match, etag)
+
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since is not None and snapshot.modified is not None:
+        since = _parse_date(if_modified_since)
+        return since is not None and int(snapshot.modified) <= since
+    return False
+
+
+cherrypy.tools.conditional = cherrypy.Tool('before_handler', conditional)
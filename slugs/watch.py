@@ -0,0 +1,554 @@
+# Copyright 2018, The Johns Hopkins University/Applied Physics Laboratory
+# All Rights Reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import errno
+import json
+import socket
+import threading
+import time
+
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
+try:
+    from urllib.parse import parse_qs, urlsplit
+except ImportError:
+    from urlparse import parse_qs, urlsplit
+
+from slugs import snapshots
+
+
+DEFAULT_TIMEOUT = 30
+MAX_TIMEOUT = 300
+
+# Idle event streams get a comment this often, so proxies keep them open.
+_KEEPALIVE_INTERVAL = 15
+
+# Clients get this long to send their request headers, and this many bytes
+# to send them in.
+_REQUEST_TIMEOUT = 10
+_MAX_REQUEST_SIZE = 8192
+
+# Event stream clients that fall this far behind are disconnected.
+_MAX_PENDING_OUTPUT = 1024 * 1024
+
+_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    431: 'Request Header Fields Too Large'
+}
+
+_WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+# Accepting stops for _ACCEPT_BACKOFF seconds when the process runs out of
+# file descriptors or buffers, rather than spinning on the listener.
+_OUT_OF_RESOURCES = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM)
+_ACCEPT_BACKOFF = 1.0
+
+
+def is_supported():
+    """
+    Check if the watch server can run on this platform.
+
+    Returns:
+        bool: True if the selectors module is available, False otherwise.
+    """
+    return selectors is not None
+
+
+class WatchError(Exception):
+    """
+    Raised when a watch request is invalid.
+    """
+
+    def __init__(self, status, message, headers=()):
+        super(WatchError, self).__init__(message)
+        self.status = status
+        self.headers = list(headers)
+
+
+def parse_since(value):
+    """
+    Validate the since query parameter, or the Last-Event-ID header.
+
+    Returns:
+        int: The generation, or None if the value was not given.
+
+    Raises:
+        WatchError: a 400 error if the value is not a non-negative integer.
+    """
+    if value is None:
+        return None
+    try:
+        since = int(value)
+    except ValueError:
+        since = -1
+    if since < 0:
+        raise WatchError(400, "Since must be a generation number.")
+    return since
+
+
+def parse_timeout(value):
+    """
+    Validate the timeout query parameter, in seconds.
+
+    Returns:
+        int: The timeout, DEFAULT_TIMEOUT if it was not given.
+
+    Raises:
+        WatchError: a 400 error if the value is not an integer between 1 and
+            MAX_TIMEOUT.
+    """
+    if value is None:
+        return DEFAULT_TIMEOUT
+    try:
+        timeout = int(value)
+    except ValueError:
+        timeout = 0
+    if timeout < 1 or timeout > MAX_TIMEOUT:
+        raise WatchError(
+            400,
+            "Timeout must be an integer between 1 and {}.".format(MAX_TIMEOUT)
+        )
+    return timeout
+
+
+def parse_delta(value):
+    """
+    Validate the delta query parameter.
+
+    Returns:
+        bool: The value of the flag, False if it was not given.
+
+    Raises:
+        WatchError: a 400 error if the value is not 'true' or 'false'.
+    """
+    if value is None or value in ('false', '0'):
+        return False
+    if value in ('true', '1'):
+        return True
+    raise WatchError(400, "Delta must be 'true' or 'false'.")
+
+
+class _Connection(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.input = b''
+        self.output = b''
+        self.mode = 'request'
+        self.since = None
+        self.delta = False
+        self.deadline = time.time() + _REQUEST_TIMEOUT
+        self.close_when_flushed = False
+
+
+class WatchServer(object):
+    """
+    A small HTTP server that tells clients when the data changes.
+
+    Watchers are held open by a single thread multiplexing every connection
+    with selectors, so idle watchers never occupy a CherryPy worker thread.
+    Two forms are served from one path:
+
+    * A long poll answers once the generation differs from the one the
+      client passed as since, or once the timeout expires.
+    * A client accepting text/event-stream gets a Server-Sent Events stream
+      carrying one event per published generation.
+    """
+
+    def __init__(self, controller, host='127.0.0.1', port=0,
+                 path='/slugs/watch', log=None):
+        """
+        Build a watch server.
+
+        Args:
+            controller (MainController): The controller whose snapshots are
+                watched.
+            host (string): The address to listen on. Optional, defaults to
+                '127.0.0.1'.
+            port (int): The port to listen on. Optional, defaults to 0,
+                picking a free port.
+            path (string): The URL path watch requests are served on.
+                Optional, defaults to '/slugs/watch'.
+            log (callable): Called with a message for every connection
+                error. Optional, defaults to None, dropping the messages.
+        """
+        if not is_supported():
+            raise ValueError(
+                "The watch server is not supported on this platform."
+            )
+        self._controller = controller
+        self._host = host
+        self._port = port
+        self._path = path
+        self._log = log
+
+        self._listener = None
+        self._selector = None
+        self._connections = {}
+        self._generation = None
+        self._thread = None
+        self._stopping = False
+        self._accept_resume = None
+
+        self._wake_reader = None
+        self._wake_writer = None
+
+    @property
+    def address(self):
+        """
+        The (host, port) the server is listening on, once started.
+        """
+        if self._listener is None:
+            return None
+        return self._listener.getsockname()[:2]
+
+    def __len__(self):
+        return len(self._connections)
+
+    def start(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self._host, self._port))
+        listener.listen(128)
+        listener.setblocking(False)
+        self._listener = listener
+
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(listener, selectors.EVENT_READ, self._accept)
+        self._selector.register(
+            self._wake_reader,
+            selectors.EVENT_READ,
+            self._drain
+        )
+        self._generation = self._controller.snapshot.generation
+
+        self._stopping = False
+        self._accept_resume = None
+        self._thread = threading.Thread(target=self._run, name="slugs-watch")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping = True
+        self.notify()
+        self._thread.join()
+        self._thread = None
+
+        for sock in list(self._connections):
+            self._close(sock)
+        if self._accept_resume is None:
+            self._selector.unregister(self._listener)
+        self._selector.unregister(self._wake_reader)
+        for sock in (self._listener, self._wake_reader):
+            sock.close()
+        self._wake_writer.close()
+        self._selector.close()
+        self._listener = None
+
+    def notify(self, snapshot=None):
+        """
+        Wake the server up to check for a new generation.
+
+        Safe to call from any thread. Meant to be registered as a listener
+        on the watched controller.
+        """
+        try:
+            self._wake_writer.send(b'\0')
+        except socket.error as e:
+            # A full wake-up pipe already guarantees a wake-up.
+            if e.errno not in _WOULD_BLOCK:
+                raise
+
+    def _run(self):
+        while not self._stopping:
+            now = time.time()
+            deadlines = [c.deadline for c in self._connections.values()]
+            if self._accept_resume is not None:
+                deadlines.append(self._accept_resume)
+            timeout = max(0, min(deadlines) - now) if deadlines else None
+            for key, mask in self._selector.select(timeout):
+                # A failing connection must never end the thread serving
+                # every other watcher.
+                try:
+                    key.data(key.fileobj, mask)
+                except socket.error as e:
+                    self._report("Watch connection failed: {}".format(e))
+                    self._close(key.fileobj)
+            self._resume_accepting(time.time())
+            self._publish()
+            self._expire(time.time())
+
+    def _report(self, message):
+        if self._log is not None:
+            self._log(message)
+
+    def _accept(self, listener, mask):
+        try:
+            sock, _ = listener.accept()
+        except socket.error as e:
+            if e.errno in _WOULD_BLOCK:
+                return
+            if e.errno in _OUT_OF_RESOURCES:
+                self._report(
+                    "Unable to accept watch connection: {}. Pausing for {} "
+                    "second(s).".format(e, _ACCEPT_BACKOFF)
+                )
+                self._selector.unregister(listener)
+                self._accept_resume = time.time() + _ACCEPT_BACKOFF
+            else:
+                self._report(
+                    "Unable to accept watch connection: {}".format(e)
+                )
+            return
+        try:
+            sock.setblocking(False)
+        except socket.error as e:
+            self._report("Unable to accept watch connection: {}".format(e))
+            sock.close()
+            return
+        self._connections[sock] = _Connection(sock)
+        self._selector.register(sock, selectors.EVENT_READ, self._handle)
+
+    def _resume_accepting(self, now):
+        if self._accept_resume is not None and now >= self._accept_resume:
+            self._accept_resume = None
+            self._selector.register(
+                self._listener,
+                selectors.EVENT_READ,
+                self._accept
+            )
+
+    def _drain(self, sock, mask):
+        try:
+            while sock.recv(4096):
+                pass
+        except socket.error as e:
+            if e.errno not in _WOULD_BLOCK:
+                self._report("Unable to drain watch wake-ups: {}".format(e))
+
+    def _handle(self, sock, mask):
+        connection = self._connections.get(sock)
+        if connection is None:
+            return
+        if mask & selectors.EVENT_WRITE:
+            self._flush(connection)
+            if sock not in self._connections:
+                return
+        if mask & selectors.EVENT_READ:
+            try:
+                data = sock.recv(4096)
+            except socket.error as e:
+                if e.errno in _WOULD_BLOCK:
+                    return
+                data = b''
+            if not data:
+                self._close(sock)
+                return
+            # Anything sent after the request is ignored.
+            if connection.mode != 'request':
+                return
+
+            connection.input += data
+            if b'\r\n\r\n' in connection.input:
+                try:
+                    self._start(connection)
+                except WatchError as e:
+                    self._respond(
+                        connection,
+                        e.status,
+                        str(e).encode('utf-8'),
+                        'text/plain',
+                        e.headers
+                    )
+            elif len(connection.input) > _MAX_REQUEST_SIZE:
+                self._respond(
+                    connection,
+                    431,
+                    b'Request headers too large.',
+                    'text/plain'
+                )
+
+    def _start(self, connection):
+        head = connection.input.split(b'\r\n\r\n', 1)[0].decode('latin-1')
+        lines = head.split('\r\n')
+        parts = lines[0].split()
+        if len(parts) != 3:
+            raise WatchError(400, "Malformed request line.")
+        method, target, _ = parts
+
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        if url.path.rstrip('/') != self._path:
+            raise WatchError(404, "Resource not found.")
+        if method != 'GET':
+            raise WatchError(
+                405,
+                "Method must be GET.",
+                [('Allow', 'GET')]
+            )
+
+        params = dict(
+            (name, values[-1])
+            for name, values in parse_qs(url.query).items()
+        )
+        since = params.get('since', headers.get('last-event-id'))
+        connection.since = parse_since(since)
+        connection.delta = parse_delta(params.get('delta'))
+        timeout = parse_timeout(params.get('timeout'))
+        if connection.since is None:
+            connection.since = self._generation
+
+        if 'text/event-stream' in headers.get('accept', ''):
+            connection.mode = 'stream'
+            connection.deadline = time.time() + _KEEPALIVE_INTERVAL
+            self._send(
+                connection,
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/event-stream\r\n'
+                b'Cache-Control: no-cache\r\n'
+                b'Connection: close\r\n'
+                b'\r\n'
+                b': watching\n\n'
+            )
+            if connection.since != self._generation:
+                self._push(connection, {})
+        else:
+            connection.mode = 'poll'
+            connection.deadline = time.time() + timeout
+            if connection.since != self._generation:
+                self._push(connection, {})
+
+    def _body(self, since, delta, memo):
+        # Watchers at the same generation share one encoded body.
+        key = (since, delta)
+        body = memo.get(key)
+        if body is None:
+            message = {
+                'generation': self._generation,
+                'instance': snapshots.INSTANCE,
+                'changed': since != self._generation
+            }
+            if delta:
+                changes = self._controller.change_feed.since(since)
+                message['resync'] = changes is None
+                if changes is not None:
+                    message['added'] = [list(pair) for pair in changes[0]]
+                    message['removed'] = [list(pair) for pair in changes[1]]
+            body = json.dumps(message).encode('utf-8')
+            memo[key] = body
+        return body
+
+    def _push(self, connection, memo):
+        body = self._body(connection.since, connection.delta, memo)
+        if connection.mode == 'poll':
+            self._respond(connection, 200, body, 'application/json')
+        else:
+            self._send(
+                connection,
+                'id: {}\nevent: change\ndata: '.format(
+                    self._generation
+                ).encode('utf-8') + body + b'\n\n'
+            )
+            connection.since = self._generation
+            connection.deadline = time.time() + _KEEPALIVE_INTERVAL
+
+    def _publish(self):
+        generation = self._controller.snapshot.generation
+        if generation == self._generation:
+            return
+        self._generation = generation
+        memo = {}
+        for connection in list(self._connections.values()):
+            if connection.mode in ('poll', 'stream'):
+                self._push(connection, memo)
+
+    def _expire(self, now):
+        for connection in list(self._connections.values()):
+            if connection.deadline > now:
+                continue
+            if connection.mode == 'poll':
+                self._push(connection, {})
+            elif connection.mode == 'stream':
+                self._send(connection, b': keepalive\n\n')
+                connection.deadline = now + _KEEPALIVE_INTERVAL
+            else:
+                self._close(connection.sock)
+
+    def _respond(self, connection, status, body, content_type, headers=()):
+        lines = [
+            'HTTP/1.1 {} {}'.format(status, _REASONS[status]),
+            'Content-Type: {}'.format(content_type),
+            'Content-Length: {}'.format(len(body)),
+            'Cache-Control: no-cache',
+            'Connection: close'
+        ]
+        lines.extend('{}: {}'.format(name, value) for name, value in headers)
+        connection.mode = 'closing'
+        connection.close_when_flushed = True
+        connection.deadline = time.time() + _REQUEST_TIMEOUT
+        self._send(
+            connection,
+            '\r\n'.join(lines).encode('latin-1') + b'\r\n\r\n' + body
+        )
+
+    def _send(self, connection, data):
+        connection.output += data
+        if len(connection.output) > _MAX_PENDING_OUTPUT:
+            self._close(connection.sock)
+            return
+        self._flush(connection)
+
+    def _flush(self, connection):
+        sock = connection.sock
+        try:
+            while connection.output:
+                sent = sock.send(connection.output)
+                connection.output = connection.output[sent:]
+        except socket.error as e:
+            if e.errno not in _WOULD_BLOCK:
+                self._close(sock)
+                return
+
+        if connection.output:
+            events = selectors.EVENT_READ | selectors.EVENT_WRITE
+        elif connection.close_when_flushed:
+            self._close(sock)
+            return
+        else:
+            events = selectors.EVENT_READ
+        if self._selector.get_key(sock).events != events:
+            self._selector.modify(sock, events, self._handle)
+
+    def _close(self, sock):
+        if self._connections.pop(sock, None) is None:
+            return
+        self._selector.unregister(sock)
+        sock.close()